@@ -45,6 +45,17 @@ byte rpi_int_flag =  NONE;
 // TODO
 ///////////////////////
  byte frames = 0b00000000;  //active frames
+const byte NR_OF_LEDS = 81;  // 9x9 matrix, leds on the corners of the squares
+byte ledFrame[NR_OF_LEDS][3];  // RGB value for every led
+bool ledFrameChanged = false;
+// Animation programs uploaded by the rpi zero. See led_animations.py for the format
+const byte ANIMATION_SLOTS = 8;
+const byte ANIMATION_SLOT_SIZE = 48;
+byte animationSlots[ANIMATION_SLOTS][ANIMATION_SLOT_SIZE];
+byte playingSlot = 255;  // 255 --> no animation
+byte playingSquares[4];
+byte playingKeyframe = 0;
+unsigned long keyframeStart = 0;
 
 /////////////////
 // REED MATRIX //
@@ -117,6 +128,14 @@ void loop()
   // Button signal to rpi0
   // Powerbutton signal to Rpi0
 
+  if (playingSlot != 255){
+    playAnimation();
+  }
+
+  if (ledFrameChanged){
+    renderLedFrame();
+  }
+
   if (reedActive){
     readReedSwitchMatrix();
     checkBoard();
@@ -271,6 +290,16 @@ void checkSerial() {
   if (Serial.read() == START_CHAR){
     char in = Serial.read();
     // Serial.write(in);
+    // Led frames carry a payload. Read it before the buffer gets cleared
+    if (in == 'U'){
+      readLedFrame();
+    }
+    else if (in == 'A'){
+      readAnimation();
+    }
+    else if (in == 'P'){
+      readPlayAnimation();
+    }
     while (Serial.available() > 0){
       Serial.read();
     }
@@ -284,6 +313,10 @@ void checkSerial() {
     // V --> button interrupt on
     // X --> button interrupt off
     // L --> execute led matrix instruction
+    // U --> led frame: nr of runs + runs (first led, nr of leds, R, G, B). No answer
+    // A --> upload animation: slot, size, program. Answer slot nr
+    // P --> play animation: slot, nr of squares, squares. No answer
+    // Q --> stop animation
     // I --> send reed interrupt signal to rpi (for debugging)
     // S --> send shutdown interrupt to rpi (for debugging)
 
@@ -363,6 +396,22 @@ void checkSerial() {
         Serial.write(STOP_CHAR);
         break;
 
+      // Led frame is already read
+      case 'U':
+        break;
+
+      // Animation is already stored
+      case 'A':
+        break;
+
+      // Animation is already started
+      case 'P':
+        break;
+
+      case 'Q':
+        playingSlot = 255;
+        break;
+
       // DEBUG
       // Send pulse with reed interrupt pin
       case 'I':
@@ -421,6 +470,117 @@ void ledControl(uint8_t action){
   }
 }
 
+byte readSerialByte(){
+  // Wait for the next byte of a payload. Returns 0 on timeout
+  unsigned long timestamp = millis();
+  while (Serial.available() == 0){
+    if (millis() - timestamp > 50){return 0;}
+  }
+  return Serial.read();
+}
+
+void readLedFrame(){
+  // Apply run-length encoded led changes to ledFrame
+  byte runs = readSerialByte();
+  for (byte run = 0; run < runs; run++){
+    byte first = readSerialByte();
+    byte count = readSerialByte();
+    byte red = readSerialByte();
+    byte green = readSerialByte();
+    byte blue = readSerialByte();
+    for (byte led = first; led < first + count && led < NR_OF_LEDS; led++){
+      ledFrame[led][0] = red;
+      ledFrame[led][1] = green;
+      ledFrame[led][2] = blue;
+    }
+  }
+  readSerialByte();  // STOP_CHAR
+  ledFrameChanged = true;
+}
+
+void readAnimation(){
+  // Store an animation program and confirm with the slot nr
+  byte slot = readSerialByte();
+  byte size = readSerialByte();
+  for (byte i = 0; i < size; i++){
+    byte value = readSerialByte();
+    if (slot < ANIMATION_SLOTS && i < ANIMATION_SLOT_SIZE){
+      animationSlots[slot][i] = value;
+    }
+  }
+  readSerialByte();  // STOP_CHAR
+  if (slot < ANIMATION_SLOTS && size <= ANIMATION_SLOT_SIZE){
+    Serial.write(START_CHAR);
+    Serial.write(slot);
+    Serial.write(STOP_CHAR);
+  }
+}
+
+void readPlayAnimation(){
+  // Start an animation on the given squares
+  byte slot = readSerialByte();
+  byte count = readSerialByte();
+  for (byte i = 0; i < count; i++){
+    byte square = readSerialByte();
+    if (i < sizeof(playingSquares)){
+      playingSquares[i] = square;
+    }
+  }
+  readSerialByte();  // STOP_CHAR
+  if (slot < ANIMATION_SLOTS){
+    playingSlot = slot;
+    playingKeyframe = 0;
+    keyframeStart = millis();
+    showKeyframe();
+  }
+}
+
+void showKeyframe(){
+  // Copy the colors of the current keyframe to the leds around the squares
+  byte *program = animationSlots[playingSlot];
+  byte targets = program[0];
+  byte *keyframe = program + 3 + playingKeyframe * (2 + 3 * targets);
+  for (byte target = 0; target < targets && target < sizeof(playingSquares); target++){
+    byte square = playingSquares[target];
+    byte led = (square / 8) * 9 + square % 8;
+    byte corners[4] = {led, led + 1, led + 9, led + 10};
+    for (byte corner = 0; corner < 4; corner++){
+      for (byte color = 0; color < 3; color++){
+        ledFrame[corners[corner]][color] = keyframe[2 + target * 3 + color];
+      }
+    }
+  }
+  ledFrameChanged = true;
+}
+
+void playAnimation(){
+  // Go to the next keyframe when the duration of the current one has passed
+  byte *program = animationSlots[playingSlot];
+  byte targets = program[0];
+  byte *keyframe = program + 3 + playingKeyframe * (2 + 3 * targets);
+  unsigned long duration = (((unsigned int)keyframe[0] << 8) | keyframe[1]) * 10UL;
+  if (millis() - keyframeStart < duration){
+    return;
+  }
+  keyframeStart = millis();
+  playingKeyframe++;
+  if (playingKeyframe >= program[1]){
+    if (!(program[2] & 0x01)){  // no loop
+      playingSlot = 255;
+      return;
+    }
+    playingKeyframe = 0;
+  }
+  showKeyframe();
+}
+
+void renderLedFrame(){
+  // Write ledFrame to the led matrix
+  // TODO AN32183A: the led ic is not connected yet. The rpi zero side (frames, animations) is done, the driver
+  // goes here
+  ledFrameChanged = false;
+}
+
 void squareOn(){
   // Turn square on
   // Parameters: square nr, color, frame(s)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Polyglot opening books.
+The books are memory mapped at boot (chess.polyglot.MemoryMappedReader). A lookup is a binary search on the zobrist
+hash of the position, so the first moves of a game are played without waking up the engine.
+"""
+
+import logging
+from typing import Dict, Iterable, Optional
+
+import chess
+import chess.polyglot
+import config
+
+LOG = logging.getLogger(__name__)
+
+_READERS: Dict[str, Optional[chess.polyglot.MemoryMappedReader]] = {}  # path: reader, None if the book can't be read
+
+
+def reader(path: str) -> Optional[chess.polyglot.MemoryMappedReader]:
+    """:return: the reader of the book, opened on the first call. None if the file is missing"""
+    if path not in _READERS:
+        try:
+            book_reader = _READERS[path] = chess.polyglot.open_reader(path)
+            LOG.info('book %s: %s entries', path, len(book_reader))
+        except OSError as error:
+            LOG.warning('book %s not available: %s', path, error)
+            _READERS[path] = None
+    return _READERS[path]
+
+
+def open_books(engines: Iterable[config.EngineSetup]) -> None:
+    """Map the books of all engines at boot"""
+    for setup in engines:
+        if setup.book is not None:
+            reader(setup.book.path)
+
+
+def book_move(setup: config.EngineSetup, board: chess.Board) -> Optional[chess.Move]:
+    """
+    :param setup: config.EngineSetup with the book
+    :param board: chess.Board
+    :return: move from the book of the engine, None if the position is not in the book or too deep in the game
+    """
+    book = setup.book
+    plies = 2 * (board.fullmove_number - 1) + (board.turn == chess.BLACK)
+    if book is None or plies >= book.max_plies:
+        return None
+
+    book_reader = reader(book.path)
+    if book_reader is None:
+        return None
+
+    try:
+        entry = book_reader.weighted_choice(board) if book.weighted else book_reader.find(board)
+    except IndexError:
+        return None
+    return entry.move
+
+
+def close() -> None:
+    for book_reader in _READERS.values():
+        if book_reader is not None:
+            book_reader.close()
+    _READERS.clear()
@@ -7,19 +7,19 @@ Make list/dict with buttons and callbacks
 
 import logging
 import threading
-import queue
-import os
-import signal
-from typing import Dict, Union, List, Tuple, Callable, Any
+from time import monotonic
+from typing import Dict, Union, List, Tuple, Callable, Any, Optional
 from dataclasses import dataclass
 
 import config
-import serial_arduino
 import gpio
+from events import EVENTS, Event, EventType
 
 
 LOG = logging.getLogger(__name__)
 
+AUTOSHUTDOWN_TIMER = 'autoshutdown'
+
 
 @dataclass
 class Button:
@@ -39,12 +39,19 @@ class Button:
 
 class Panel:
     """ Button panel """
-    def __init__(self, callbacks: Dict[str, Callable]):
+    def __init__(self, callbacks: Dict[str, Callable], arduino: Any = None):
+        """
+        :param callbacks: button callbacks by name
+        :param arduino: object with reed_on() and reed_off(), eg. a stub to drive the panel with the mock gpio backend.
+            None --> serial_arduino, which opens the serial port
+        """
+        if arduino is None:
+            import serial_arduino  # pylint: disable=import-outside-toplevel
+            arduino = serial_arduino
+        self.arduino = arduino
         self.button_lock: threading.Lock = threading.Lock()
-        self.callback_queue: queue.Queue = queue.Queue(maxsize=3)
         self.active_callbacks: list = [self.no_call] * 8
-        self.wait_for_button: threading.Barrier = threading.Barrier(parties=2)
-        self.move_event = threading.Barrier = threading.Event()
+        self.reeds_armed = False  # reed scanning stays on for the whole game phase
         self.buttons: AllButtons = AllButtons(callbacks)
         self.callbacks = callbacks
 
@@ -53,38 +60,49 @@ class Panel:
         return 'Panel:\n {0}'.format(items)
 
     def handler_callbacks(self) -> None:
-        """callback function for the push button interrupts. Adds job to the button queue and triggers button event"""
+        """callback function for the push button interrupts. Posts the callback of the button as a BUTTON event"""
         if self.button_lock.locked():
             LOG.debug('button_panel is locked. Ignoring call')
             return
 
         gpio.mcp23s17_write_register(gpio.GPINTENA, 0x00)  # Disable mcp23s17 interrupts
-        incoming = gpio.mcp23s17_read_register(gpio.INTFA)
+        # INTFA, INTFB and INTCAPA in 1 transaction. Reading INTCAPA clears the interrupt
+        incoming, _, _ = gpio.mcp23s17_read_registers(gpio.INTFA, 3)
 
         if incoming not in range(0, 8):
             raise ValueError('button.Panel.handler_callbacks: Recieved invalid button nr')
 
         LOG.debug('Button interrupt on button %s', incoming)
+        # The main thread runs the callback. It picks it up in execute_task() or the dispatcher runs it while the
+        # program waits for something else
+        EVENTS.post(EventType.BUTTON, self.active_callbacks[incoming])
 
-        try:
-            self.callback_queue.put(self.active_callbacks[incoming], timeout=1)
-        except queue.Full:
-            LOG.critical('button handler: Couldn\' t put new job into queue. Previous possibly stuck')
+        # Interrupts stay disabled until all buttons are released. A timer checks this so a held button doesn't
+        # keep the spi bus and the cpu busy
+        self._schedule_release_check(config.BUTTON_RELEASE_POLL)
 
-        # if program is waiting for button --> let it stop waiting and pick up task from the queue
-        if self.wait_for_button.n_waiting == 1:
-            self.wait_for_button.wait()  # sync with MAIN thread
-            LOG.debug('wait_for_button: wait finished')
-            serial_arduino.trigger_arduino_int()  # trigger reed pulse because the program was waiting for a button instead  # todo why?
-        else:
-            os.kill(os.getpid(), signal.SIGUSR1)  # todo what is this???
+    def _schedule_release_check(self, delay: float) -> None:
+        """
+        Check for released buttons after 'delay' seconds on a timer thread
+        :param delay: seconds
+        """
+        timer = threading.Timer(delay, self._release_check, args=(delay,))
+        timer.name = 'ButtonReleaseThread'
+        timer.daemon = True
+        timer.start()
 
-        gpio.mcp23s17_read_register(gpio.INTCAPA)
-        while True:  # ensure no button is pressed anymore  # todo necessry???
-            if gpio.mcp23s17_read_register(gpio.GPIOA) == 0xFF:
-                break
+    def _release_check(self, delay: float) -> None:
+        """
+        Reenable the mcp23s17 interrupts when no button is pressed anymore, otherwise check again later with a
+        longer delay
+        :param delay: seconds, delay of this check
+        """
+        if gpio.mcp23s17_read_register(gpio.GPIOA) != 0xFF:
+            self._schedule_release_check(min(delay * 2, config.BUTTON_RELEASE_POLL_MAX))
+            return
 
         gpio.mcp23s17_write_register(gpio.GPINTENA, 0xFF)  # Reenable mcp23017 interrupts
+        LOG.debug('Buttons released, interrupts enabled')
 
     def update_buttons(self, buttons: Union[Tuple[Button], List[Button], Button]) -> None:
         """
@@ -126,50 +144,65 @@ class Panel:
         self.update_button_leds([])
         self.button_lock.release()
 
-    def execute_task(self, signr: int = None, frame: int = None, timeout: int = None) -> Any:
+    @staticmethod
+    def execute_task(timeout: Optional[float] = None) -> Any:
         """
-        Wait and execute task from buttons. When a timeout is given the program will hold until a button is pressed
-        :param signr: SIGNAL nr
-        :param frame: SIGNAL frame
-        :param timeout: timeout in seconds
-        :return:
+        Wait for a button and execute its task. Other events are handled by the dispatcher while waiting.
+        :param timeout: timeout in seconds, None waits forever
+        :return: result of the task, None on timeout
         """
-        LOG.debug('Waiting for button. Timeout = %s, signr = %s, frame = %s', timeout, signr, frame)
-        result = None
-        try:
-            if timeout is not None:
-                self.wait_for_button.wait(timeout=timeout)
-
-            task = self.callback_queue.get(block=True, timeout=timeout)
-            result = task()
-        except threading.BrokenBarrierError:
-            LOG.debug('wait_for_button timeout')
-        except queue.Empty:
-            LOG.exception('No job found in button queue! Probably a timeout')
-
-        return result
-
-    def wait_for_move(self, timeout: int = config.AUTOSHUTDOWN + 30):
+        LOG.debug('Waiting for button. Timeout = %s', timeout)
+        end = None if timeout is None else monotonic() + timeout
+        while True:
+            remaining = None if end is None else end - monotonic()
+            if remaining is not None and remaining <= 0:
+                LOG.debug('wait_for_button timeout')
+                return None
+
+            event = EVENTS.wait_for(EventType.BUTTON, timeout=remaining)
+            if event is not None:
+                return event.data()
+
+    def wait_for_move(self, timeout: float = config.AUTOSHUTDOWN + 30) -> Optional[Event]:
         """
-        Let the program wait for a reed event
+        Let the program wait for a reed event. When the reeds are armed the scanning is already on, otherwise it is
+        switched on and off for this wait only.
         :param timeout: seconds
-        :return: True if event has been set before timeout else False
+        :return: the REED event (data: serial_async.ReedEvent), None on timeout or when the dispatcher handled
+            another event
         """
-        serial_arduino.reed_on()
-        self.move_event.wait(timeout=timeout)  # todo necessary???
-        gpio.wait_for_arduino_int(timeout=timeout)
-        serial_arduino.reed_off()
+        if not self.reeds_armed:
+            self.arduino.reed_on()
+        event = EVENTS.wait_for(EventType.REED, timeout=timeout)
+        if not self.reeds_armed:
+            self.arduino.reed_off()
+        return event
+
+    def arm_reeds(self) -> None:
+        """Keep reed scanning on until disarm_reeds(). Saves a confirmed reed_on/reed_off round trip for every wait"""
+        if not self.reeds_armed:
+            self.arduino.reed_on()
+            self.reeds_armed = True
+            LOG.debug('Reeds armed')
+
+    def disarm_reeds(self) -> None:
+        """Stop reed scanning. Used when entering a menu or going idle"""
+        if self.reeds_armed:
+            self.arduino.reed_off()
+            self.reeds_armed = False
+            EVENTS.discard(EventType.REED)
+            LOG.debug('Reeds disarmed')
 
     @staticmethod
     def toggle_alarm(active: bool = True) -> None:
         """
-        :param active: bool, False to turn SIGALRM off
-        Alarm to save GAME and shutdown pi when program is idle"""
+        :param active: bool, False to turn the alarm off
+        Alarm to save GAME and shutdown pi when program is idle. Posts a TIMER event, thread-safe"""
         if active:
-            signal.alarm(config.AUTOSHUTDOWN)
+            EVENTS.set_timer(AUTOSHUTDOWN_TIMER, config.AUTOSHUTDOWN)
             LOG.debug('Alarm set at %s seconds', config.AUTOSHUTDOWN)
         else:
-            signal.alarm(0)
+            EVENTS.cancel_timer(AUTOSHUTDOWN_TIMER)
             LOG.debug('Alarm disabled')
 
     @staticmethod
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Chess clock for games with a time control (config.TimeControl).
+The clock of the side to move runs from the start of the turn until the move is made: for the player until the move
+is recognized (the confirmation wait is free), for the engine until its move is found. Executing the move of the
+engine on the board is free as well. A delay leaves the first seconds of every move off the clock, an increment is
+added after every move.
+The engine gets both clocks in chess.engine.Limit and divides its time itself. The clock frame is a small partial
+frame, redrawn only when its text changes (CLOCK_TIMER), so clock ticks never add full refreshes.
+"""
+
+import logging
+from math import ceil
+from time import monotonic
+from typing import Dict, Optional
+
+import chess
+import chess.engine
+import chess.pgn
+import config
+
+LOG = logging.getLogger(__name__)
+
+CLOCK_TIMER = 'clock'
+
+
+def time_control(engine: config.EngineSetup) -> Optional[config.TimeControl]:
+    """:return: the time control of the engine setup, None --> no clock, the engine uses the movetime"""
+    option = engine.options.get('clock')  # setups saved before the clock option have none
+    if option is None or not option.value.minutes:
+        return None
+    control: config.TimeControl = option.value
+    return control
+
+
+def format_time(seconds: float) -> str:
+    """:return: 'h:mm:ss' or 'm:ss', rounded up: the clock shows 0:00 only when the time is up"""
+    seconds = max(0, ceil(seconds))
+    hours, rest = divmod(seconds, 3600)
+    if hours:
+        return '{0}:{1:02d}:{2:02d}'.format(hours, *divmod(rest, 60))
+    return '{0}:{1:02d}'.format(*divmod(rest, 60))
+
+
+def parse_time(text: str) -> float:
+    """:param text: 'h:mm:ss' or 'm:ss'"""
+    seconds = 0.0
+    for part in text.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+class ChessClock:
+    """Time left of both sides, the clock of the side to move runs"""
+    def __init__(self, control: config.TimeControl):
+        self.control = control
+        self.remaining: Dict[chess.Color, float] = {chess.WHITE: control.minutes * 60.0, chess.BLACK: control.minutes * 60.0}
+        self.moving: Optional[chess.Color] = None  # side that has the move on the clock
+        self.shown = ''  # text of the last clock frame
+        self._used = 0.0  # seconds of the current move before the last pause
+        self._since: Optional[float] = None  # monotonic time the clock (re)started, None --> paused
+
+    def __str__(self) -> str:
+        return 'ChessClock: {0}, white={1}, black={2}'.format(
+            self.control, format_time(self.time_left(chess.WHITE)), format_time(self.time_left(chess.BLACK)))
+
+    @property
+    def running(self) -> Optional[chess.Color]:
+        """:return: the side whose clock runs, None if the clock is stopped or paused"""
+        return None if self._since is None else self.moving
+
+    def _move_time(self) -> float:
+        """:return: seconds used for the current move, the delay not subtracted"""
+        return self._used + (0.0 if self._since is None else monotonic() - self._since)
+
+    def time_left(self, color: chess.Color) -> float:
+        if color != self.moving:
+            return self.remaining[color]
+        return self.remaining[color] - max(0.0, self._move_time() - self.control.delay)
+
+    def start(self, color: chess.Color) -> None:
+        """Start the move of 'color' or continue it after a pause"""
+        if color != self.moving:
+            self.press()
+            self.moving = color
+        if self._since is None:
+            self._since = monotonic()
+
+    def pause(self) -> None:
+        """Stop the clock without ending the move, eg. while the player confirms the move"""
+        if self._since is not None:
+            self._used += monotonic() - self._since
+            self._since = None
+
+    def press(self) -> None:
+        """
+        End the move of the side on the clock: its time is taken, minus the delay, and the increment added. The
+        increment comes too late when the time is up
+        """
+        if self.moving is None:
+            return
+        color = self.moving
+        left = self.time_left(color)
+        self.remaining[color] = left + self.control.increment if left > 0 else left
+        LOG.debug('%s used %.1f sec', chess.COLOR_NAMES[color], self._move_time())
+        self.moving = None
+        self._used = 0.0
+        self._since = None
+
+    def flagged(self) -> Optional[chess.Color]:
+        """:return: the side whose time is up, None if both have time left"""
+        for color in chess.COLORS:
+            if self.time_left(color) <= 0:
+                return color
+        return None
+
+    def result(self, board: chess.Board) -> str:
+        """:return: the result of the game, a loss on time is a draw when the opponent can't mate"""
+        flagged = self.flagged()
+        if flagged is None:
+            return board.result()
+        if board.has_insufficient_material(not flagged):
+            return '1/2-1/2'
+        return '0-1' if flagged == chess.WHITE else '1-0'
+
+    def interval(self) -> float:
+        """:return: seconds until the next clock frame"""
+        left = self.time_left(self.moving) if self.moving is not None else config.CLOCK_INTERVAL
+        interval = config.CLOCK_LOW_INTERVAL if left < config.CLOCK_LOW_TIME else config.CLOCK_INTERVAL
+        return max(0.1, min(interval, left))
+
+    def text(self) -> str:
+        """:return: 2 lines with the time of white and black, '>' marks the running clock"""
+        return '\n'.join('{0}{1} {2}'.format('>' if color == self.running else ' ', 'W' if color else 'B',
+                                             format_time(self.time_left(color))) for color in chess.COLORS)
+
+    def limit(self) -> chess.engine.Limit:
+        """:return: the search limit with both clocks. UCI has no delay, for the engine a delay works like an increment"""
+        increment = self.control.increment + self.control.delay
+        return chess.engine.Limit(white_clock=self.time_left(chess.WHITE), black_clock=self.time_left(chess.BLACK),
+                                  white_inc=increment, black_inc=increment)
+
+    def movetime(self, color: chess.Color) -> float:
+        """:return: seconds 'color' is expected to use for a move, eg. for the ponder budget"""
+        return self.time_left(color) / config.CLOCK_MOVES_TO_GO + self.control.increment + self.control.delay
+
+    def headers(self) -> Dict[str, str]:
+        """:return: pgn headers with the time control and the time left, to continue a saved game"""
+        if self.control.delay:
+            control = '{0}d{1}'.format(self.control.minutes * 60, self.control.delay)
+        else:
+            control = '{0}+{1}'.format(self.control.minutes * 60, self.control.increment)
+        return {'TimeControl': control,
+                'WhiteClock': format_time(self.time_left(chess.WHITE)),
+                'BlackClock': format_time(self.time_left(chess.BLACK))}
+
+    def restore(self, headers: chess.pgn.Headers) -> None:
+        """Set the time left from the headers of a saved game"""
+        for color, name in ((chess.WHITE, 'WhiteClock'), (chess.BLACK, 'BlackClock')):
+            try:
+                self.remaining[color] = parse_time(headers[name])
+            except (KeyError, ValueError):
+                LOG.debug('no %s in the saved game', name)
@@ -4,7 +4,7 @@ import configparser
 import csv
 import logging
 from PIL import ImageFont
-from typing import Union, Dict, NamedTuple, List, Any
+from typing import Union, Dict, NamedTuple, List, Any, Optional
 from typing import NewType
 from dataclasses import dataclass
 
@@ -29,6 +29,7 @@ CENTER = 2
 IMG_BUTTON_RIGHT = 'images/button_right.png'
 IMG_BUTTON_LEFT = 'images/button_left.png'
 ASCII_PIECES = (167, 164, 165, 166, 163, 162)
+ENGINE_INFO_INTERVAL = 5  # seconds between partial frames with the progress of the engine
 
 # -----------
 # -- files --
@@ -37,6 +38,8 @@ SAVEGAME = 'savegame.pgn'
 SETUPFILE = 'setup.json'
 COMPUTER_MOVE = 'computer.move'
 LOG_FILE = 'log/program.log'
+ENGINE_CACHE_FILE = 'engine.cache'
+ENGINE_CACHE_SIZE = 20000  # nr of positions in the engine cache, 20 bytes each
 
 # --------------------
 # -- Epaper/epd4in2 --
@@ -61,6 +64,8 @@ MAIN_PERSONALITY_IMAGE = 'images/calvin/calvin_running.png'
 # ----------
 # -- Gpio --
 # ----------
+GPIO_BACKEND = 'rpi'  # 'rpi' (RPi.GPIO), 'gpiod' (gpio character device) or 'mock' (in memory, no hardware)
+GPIOD_CHIP = 'gpiochip0'
 # Arduino interrupt
 ARDUINO_INT_PIN = 25
 # epaper
@@ -72,12 +77,31 @@ BUSY_PIN = 21
 CS_BUTTON_PIN = 8
 BUTTON_RESET_PIN = 4
 BUTTON_DEBOUNCE = 100  # Millisec
+BUTTON_RELEASE_POLL = 0.02  # Sec, first check if the buttons are released
+BUTTON_RELEASE_POLL_MAX = 0.25  # Sec, the poll interval doubles until this maximum
+REED_GLITCH_WINDOW = 0.25  # Sec, lift/place pairs on the same square faster than this are ignored
 AUTOSHUTDOWN = 3600  # Sec
+LINK_STATS_INTERVAL = 900  # Sec, interval for the serial link summary in the log file
+EVENT_QUEUE_SIZE = 16  # Nr of events waiting for the main thread that is logged as a backlog
+TIME_CONTINUE_MOVE = 1.5  # Sec, wait for more reed changes when a move can still continue (eg. rook first castling)
 TIME_CONFIRM_MOVE = 3  # 1 sec more than you see on the commander because it updates a bit slow :-)
+RESYNC_PLIES = 3  # Longest line of moves searched to explain a board that doesn't match the game
 # led
 GREEN_ACTIVITY_LED = 47  # GPIO 47 is the led on rpi zero
 DEFAULT_BRIGHTNESS = 511  # (0-4095)
 
+# ----------------
+# -- Led matrix --
+# ----------------
+LED_OFF = (0, 0, 0)
+LED_GREEN = (0, 255, 0)
+LED_ORANGE = (255, 100, 0)
+LED_RED = (255, 0, 0)
+LED_BLUE = (0, 0, 255)
+LED_WHITE = (255, 255, 255)
+LED_ANIMATION_SLOTS = 8
+LED_ANIMATION_SLOT_SIZE = 48  # bytes, the arduino keeps all slots in SRAM
+
 
 # -------------
 # -- Options --
@@ -97,22 +121,124 @@ class Option:
         return '{0} value={1} unit={2}'.format(self.__str__(), self.value, self.unit)
 
 
+@dataclass(frozen=True)
+class TimeControl:
+    """Chess clock setting, the same for both sides. minutes=0 --> no clock, the engine uses the movetime"""
+    minutes: int
+    increment: int = 0  # seconds added after every move (Fischer)
+    delay: int = 0  # seconds at the start of every move that don't count (simple delay)
+
+    def __str__(self) -> str:
+        if not self.minutes:
+            return 'off'
+        if self.delay:
+            return '{0} min, {1} sec delay'.format(self.minutes, self.delay)
+        if self.increment:
+            return '{0} min + {1} sec'.format(self.minutes, self.increment)
+        return '{0} min'.format(self.minutes)
+
+
+NO_CLOCK = TimeControl(minutes=0)
+
 # options with their default value
 COLOR = Option(name='Color', value=WHITE)
 MOVETIME = Option(name='Movetime', value=5, unit=' sec', options=(5, 15, 30, 60, 300, 600, 900, 0))
+CLOCK = Option(name='Clock', value=NO_CLOCK, unit='', options=(
+    NO_CLOCK, TimeControl(5, increment=3), TimeControl(10, increment=5), TimeControl(15, increment=10), TimeControl(30),
+    TimeControl(30, increment=20), TimeControl(60, delay=10), TimeControl(90, increment=30)))
 MARKERS = Option(name='Markers', value=True)
 MARK_LAST_MOVE = Option(name='Mark last move', value=False)
 WAIT_TO_CONFIRM = Option(name='Wait to confirm', value=True)
 ENGINES: list = []
 
 
+# -----------
+# -- Clock --
+# -----------
+CLOCK_INTERVAL = 10  # seconds between partial frames with the clock
+CLOCK_LOW_TIME = 60  # seconds left, below this the clock is shown every CLOCK_LOW_INTERVAL seconds
+CLOCK_LOW_INTERVAL = 2
+CLOCK_MOVES_TO_GO = 30  # expected nr of moves left, for the ponder budget in games with a clock
+
+
+# ---------------
+# -- Pondering --
+# ---------------
+PONDER_MAX_TIME = 60  # seconds of engine search on the position after the expected reply of the player
+PONDER_MIN_TRIES = 5  # nr of player moves before the hit rate counts
+PONDER_MIN_HIT_RATE = 0.25  # stop pondering when the player plays less of the expected replies
+PONDER_WINDOW = 20  # nr of player moves in the hit rate
+HINT_TIME = 10  # seconds of the multi-pv search for hints, taken from the ponder budget
+HINT_LINES = 3  # nr of best moves kept per position
+HINT_CACHE_SIZE = 512  # nr of positions with hints
+
+
+# -----------------------
+# -- Resource governor --
+# -----------------------
+GOVERNOR_INTERVAL = 30  # seconds between samples of temperature, throttling and memory
+CPU_TEMP_FILE = '/sys/class/thermal/thermal_zone0/temp'
+THROTTLED_FILE = '/sys/devices/platform/soc/soc:firmware/get_throttled'  # vcgencmd get_throttled if missing
+TEMP_HIGH = 70  # degrees celsius, half the movetime and threads, no pondering (the pi throttles at 80)
+TEMP_CRITICAL = 78  # degrees celsius, a quarter of the movetime and 1 thread
+MOVETIME_MIN = 2  # seconds, the governor doesn't shorten moves below this
+MEMORY_LOW = 64  # MB available, below this new engine configurations get half the hash
+
+
+# -----------------
+# -- Engine pool --
+# -----------------
+ENGINE_POOL_MEMORY = 400  # MB for engine processes, idle engines are stopped when a new one doesn't fit
+ENGINE_OVERHEAD = 24  # MB for an engine process without the hash table
+ENGINE_DEFAULT_HASH = 16  # MB, hash size of engines without a 'Hash' option in the config
+ENGINE_PREFETCH_DELAY = 2  # seconds an engine is shown in the menu before it is started in the background
+
+
+# -------------------
+# -- Opening books --
+# -------------------
+@dataclass
+class Book:
+    """Polyglot opening book of an engine"""
+    path: str
+    max_plies: int = 20  # no book moves after this nr of half moves
+    weighted: bool = True  # True --> random move by the weights of the book, False --> move with the highest weight
+
+
+DEFAULT_BOOK = Book('books/default.bin')
+
+
+# ----------------
+# -- Early stop --
+# ----------------
+@dataclass
+class EarlyStop:
+    """When a search for the computer move may stop before the movetime"""
+    stable_depths: int  # the best move is the same for this nr of completed depths
+    max_spread: int  # centipawns, max difference between the scores of those depths
+    min_depth: int = 8  # no early stop below this depth
+    min_part: float = 0.1  # part of the movetime searched before an early stop
+
+
+EARLY_STOP_CAUTIOUS = EarlyStop(stable_depths=8, max_spread=15)
+EARLY_STOP_NORMAL = EarlyStop(stable_depths=6, max_spread=25)
+EARLY_STOP_AGGRESSIVE = EarlyStop(stable_depths=4, max_spread=40, min_depth=6)
+
+
+# ------------------------
+# -- Endgame tablebases --
+# ------------------------
+SYZYGY_PATH = 'syzigy/'  # same directory as the SyzygyProbePath of Stockfish
+SYZYGY_MAX_PIECES = 5  # positions with more pieces go to the engine
+SYZYGY_MAX_FDS = 128  # open table files, least recently used files are closed
+
+
 # -------------------
 # -- Chess engines --
 # -------------------
 class EngineSetup:
     """
     Object containing all variables for the chess engine
-    The ponder setting is always disabled since the board is running on batteries
         name: Name visible on screen
         version: visible version
         path: path of engine executable
@@ -122,13 +248,17 @@ class EngineSetup:
         protocol: uci or xboard
         exec_args: CLI options for the engine
         options: dict containing options which the user can adjust
+        ponder: engine searches during the turn of the player, within the limits of governor.PONDER (battery)
+        book: config.Book, opening book played before the engine is asked. None --> no book
+        early_stop: config.EarlyStop, when the engine may stop before the movetime. None --> always the full movetime
         **kwargs: dict containing engine specific options (openening books, endgame tables, hash size...). The key is
         used in the uci 'setoption' command
     """
 
     def __init__(self, name: str, version: str, path: Union[str, List[str]], licence: str, description: str, logo: str, protocol: str,
-                 exec_args: str = None, options: dict = None, **kwargs) -> None:
-        self.options: Dict[str, Option] = {'movetime': MOVETIME}
+                 exec_args: str = None, options: dict = None, ponder: bool = False, book: Book = DEFAULT_BOOK,
+                 early_stop: Optional[EarlyStop] = EARLY_STOP_NORMAL, **kwargs) -> None:
+        self.options: Dict[str, Option] = {'movetime': MOVETIME, 'clock': CLOCK}
         self.name = name
         self.version = version
         self.path = path
@@ -140,7 +270,9 @@ class EngineSetup:
         self.options['level'] = Option('level', 'no levels')
         if options:
             self.options.update(options)
-        self.ponder = False
+        self.ponder = ponder
+        self.book = book
+        self.early_stop = early_stop
         self.extra_options: Dict[str, Union[str, int]] = {}  # for extra, engine specific, options not for user (eg. 'hash', 'book', ...)
         for item, value in kwargs.items():
             self.extra_options[item] = value
@@ -173,7 +305,8 @@ STOCKFISH = EngineSetup(
     logo='images/logo/stockfish.png',
     protocol='uci',
     options={'level': Option(name='Skill Level', value=20, unit='/20', options=[*range(21)])},
-    ponder=False,
+    ponder=True,
+    early_stop=EARLY_STOP_AGGRESSIVE,  # stable search, the full movetime rarely changes the move
     Hash=256,
     SyzygyProbePath='syzigy/',  # http://oics.olympuschess.com/tracker/index.php,
 )
@@ -186,7 +319,7 @@ GREKO = EngineSetup(  # TODO complete -> need extra command "uci" after start
     description='An open source engine by Vladimir Medvedev, written in C++, started in 2002.',
     logo='images/logo/greko.png',
     protocol='uci',
-    ponder=False,
+    ponder=True,
 )
 
 SAYURI = EngineSetup(
@@ -199,7 +332,7 @@ SAYURI = EngineSetup(
                 'and evaluation weights.',
     logo='images/logo/sayuri.png',
     protocol='uci',
-    ponder=False,
+    ponder=True,
 )
 
 GALJOEN = EngineSetup(
@@ -210,7 +343,7 @@ GALJOEN = EngineSetup(
     description='An open source chess program by Werner Taelemans, written in C++11, first released in February 2015.',
     logo='images/logo/galjoen.png',
     protocol='uci',
-    ponder=False,
+    ponder=True,
 )
 
 CINNAMON = EngineSetup(
@@ -222,7 +355,7 @@ CINNAMON = EngineSetup(
                 'February 2013 under that name, while former versions of the engine were called Butterfly.',
     logo='images/logo/cinnamon.png',
     protocol='uci',
-    ponder=False,
+    ponder=True,
 )
 
 GUNCHESS = EngineSetup(  # TODO investigate --> segmentation errors when sending uci 'quit' command
@@ -235,7 +368,7 @@ GUNCHESS = EngineSetup(  # TODO investigate --> segmentation errors when sending
                 'of GNU Chess 6, based on Fruit 2.1',
     logo='images/logo/gnuchess.png',
     protocol='uci',
-    ponder=False,
+    ponder=True,
 )
 
 LASER = EngineSetup(
@@ -246,7 +379,7 @@ LASER = EngineSetup(
     description='An open source chess engine by Jeffrey An and Michael An, written in C++11, first released in summer 2015.',
     logo='images/logo/laser.png',
     protocol='uci',
-    ponder=False,
+    ponder=True,
 )
 
 
@@ -290,7 +423,8 @@ RODENT = EngineSetup(
     path='engines/rodent/rodentIII',
     logo='images/logo/rodent.png',
     protocol='uci',
-    ponder=False,
+    ponder=True,
+    early_stop=EARLY_STOP_CAUTIOUS,  # personalities with a weak search change their mind late
     licence='GPLv3',
     description='Rodent III is a chess engine written by Pawel Koziol. Instead of levels it can adopt personalities: '
                 'it offers different playing styles rather than strength levels. RodentIII can be turned into a strong'
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Persistent cache with the results of engine searches.
+Every game starts with the same openings and undo/redo replays positions. A position searched before with the same
+engine, options and movetime comes back from the cache without using the engine.
+The file is an append log with fixed records of 20 bytes: zobrist hash, context, best move, ponder move and score.
+The context is a crc32 of the engine name, the engine options and the movetime. An OrderedDict in memory is the index
+and the LRU list: the least recently used positions are dropped above config.ENGINE_CACHE_SIZE, and the log is
+rewritten (compacted) when it holds twice as many records as the index.
+"""
+
+import logging
+import os
+import struct
+import zlib
+from typing import NamedTuple, Optional, OrderedDict, Tuple, Union
+
+import chess
+import chess.polyglot
+import config
+
+LOG = logging.getLogger(__name__)
+
+RECORD = struct.Struct('>QIHHi')  # zobrist hash, context, best move, ponder move, score (centipawns)
+MATE_SCORE = 100000
+NO_SCORE = -MATE_SCORE - 1
+
+
+class CachedResult(NamedTuple):
+    """Result of an engine search"""
+    move: chess.Move
+    ponder: Optional[chess.Move]
+    score: Optional[int]  # centipawns for the side to move, mates as +/- (MATE_SCORE - plies)
+
+
+def encode_move(move: Optional[chess.Move]) -> int:
+    """:return: to square + from square << 6 + promotion << 12, 0 for no move"""
+    if move is None:
+        return 0
+    return move.to_square | move.from_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(raw: int) -> Optional[chess.Move]:
+    if raw == 0:
+        return None
+    return chess.Move(raw >> 6 & 0x3F, raw & 0x3F, raw >> 12 or None)
+
+
+def context(setup: config.EngineSetup, movetime: Union[float, str]) -> int:
+    """
+    :param movetime: seconds per move, or the time control (str) in games with a clock
+    :return: crc32 of everything besides the position that changes the result of a search
+    """
+    options = sorted((name, str(value)) for name, value in setup.extra_options.items())
+    level = setup.options.get('level')
+    level_value = None if level is None else getattr(level.value, 'name', level.value)
+    return zlib.crc32(repr((setup.name, setup.version, options, level_value, movetime)).encode())
+
+
+class EngineCache:
+    """Engine results by (zobrist hash, context)"""
+    def __init__(self, path: str = config.ENGINE_CACHE_FILE, size: int = config.ENGINE_CACHE_SIZE):
+        self.path = path
+        self.size = size
+        self._index: OrderedDict[Tuple[int, int], Tuple[int, int, int]] = OrderedDict()
+        self._records = 0  # nr of records in the file
+        self._loaded = False
+        self.hits = 0
+        self.misses = 0
+
+    def __str__(self) -> str:
+        return 'EngineCache: {0} positions, {1} records, {2} hits, {3} misses'.format(
+            len(self._index), self._records, self.hits, self.misses)
+
+    def _load(self) -> None:
+        """Read the log once, later records replace earlier ones"""
+        self._loaded = True
+        try:
+            with open(self.path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+        except OSError as error:
+            LOG.warning('engine cache not readable: %s', error)
+            return
+
+        usable = len(data) - len(data) % RECORD.size  # a power loss can leave half a record
+        for key, ctx, move, ponder, score in RECORD.iter_unpack(data[:usable]):
+            self._index[(key, ctx)] = (move, ponder, score)
+            self._index.move_to_end((key, ctx))
+            self._records += 1
+        self._trim()
+        LOG.info('%s', self)
+
+    def _trim(self) -> None:
+        while len(self._index) > self.size:
+            self._index.popitem(last=False)
+
+    def _compact(self) -> None:
+        """Rewrite the log with the positions in the index, least recently used first"""
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as file:
+            for (key, ctx), (move, ponder, score) in self._index.items():
+                file.write(RECORD.pack(key, ctx, move, ponder, score))
+        os.replace(temp, self.path)
+        self._records = len(self._index)
+        LOG.debug('compacted %s', self)
+
+    def get(self, board: chess.Board, setup: config.EngineSetup, movetime: Union[float, str]) -> Optional[CachedResult]:
+        """:return: the cached result for this position and search settings or None"""
+        if not self._loaded:
+            self._load()
+        key = (chess.polyglot.zobrist_hash(board), context(setup, movetime))
+        entry = self._index.get(key)
+        move = None if entry is None else decode_move(entry[0])
+        if entry is None or move is None or move not in board.legal_moves:  # a hash collision gives an illegal move
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._index.move_to_end(key)
+        board.push(move)
+        ponder = decode_move(entry[1])
+        if ponder is not None and ponder not in board.legal_moves:
+            ponder = None
+        board.pop()
+        return CachedResult(move, ponder, None if entry[2] == NO_SCORE else entry[2])
+
+    def put(self, board: chess.Board, setup: config.EngineSetup, movetime: Union[float, str], move: chess.Move,
+            ponder: Optional[chess.Move] = None, score: Optional[int] = None) -> None:
+        """Add the result of a complete search"""
+        if not self._loaded:
+            self._load()
+        key = (chess.polyglot.zobrist_hash(board), context(setup, movetime))
+        value = (encode_move(move), encode_move(ponder), NO_SCORE if score is None else score)
+        self._index[key] = value
+        self._index.move_to_end(key)
+        self._trim()
+        try:
+            if self._records >= 2 * self.size:
+                self._compact()
+            else:
+                with open(self.path, 'ab') as file:
+                    file.write(RECORD.pack(*key, *value))
+                self._records += 1
+        except OSError as error:
+            LOG.warning('engine cache not writable: %s', error)
+
+
+ENGINE_CACHE = EngineCache()
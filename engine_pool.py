@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Pool of running engine processes.
+Starting an engine means a process launch, the UCI handshake and the allocation of the hash table (256 MB for
+Stockfish and Rodent). The pool keeps engines running between games and while the user browses the menus: a game
+gets a warm engine that only needs 'ucinewgame'. The engine shown in the menu for config.ENGINE_PREFETCH_DELAY
+seconds (PREFETCH_TIMER) is started in the background, idle engines are stopped when the engines would use more than
+config.ENGINE_POOL_MEMORY.
+A warm engine keeps the hash table of its previous game. Every game searches with its own game key (see search.start),
+python-chess sends 'ucinewgame' when the key changes.
+"""
+
+import logging
+import threading
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Dict, Optional, Union
+
+import chess.engine
+import config
+
+LOG = logging.getLogger(__name__)
+
+PREFETCH_TIMER = 'prefetch'
+
+
+def memory(setup: config.EngineSetup) -> int:
+    """:return: estimated MB used by the engine process"""
+    return int(setup.extra_options.get('Hash', config.ENGINE_DEFAULT_HASH)) + config.ENGINE_OVERHEAD
+
+
+def engine_config(setup: config.EngineSetup, engine: chess.engine.SimpleEngine) -> Dict[str, Union[str, int, bool]]:
+    """
+    :return: uci options from the setup (extra options and the level option) the engine supports.
+    Options managed by python-chess (eg. Ponder) are left out
+    """
+    options = dict(setup.extra_options)
+    level = setup.options.get('level')
+    if level is not None and not isinstance(level.value, str):
+        options[level.name] = level.value
+    return {name: value for name, value in options.items()
+            if name in engine.options and name.lower() not in chess.engine.MANAGED_OPTIONS}
+
+
+@dataclass
+class _Entry:
+    """Engine process in the pool"""
+    setup: config.EngineSetup
+    engine: Optional[chess.engine.SimpleEngine] = None
+    error: Optional[Exception] = None
+    in_use: bool = False
+    last_used: float = field(default_factory=monotonic)
+    ready: threading.Event = field(default_factory=threading.Event)
+
+
+class EnginePool:
+    """Running engines by name, within a memory budget"""
+    def __init__(self, budget: int = config.ENGINE_POOL_MEMORY):
+        """:param budget: MB for all engine processes"""
+        self.budget = budget
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return 'EnginePool: {0}, {1}/{2} MB'.format(
+            ['{0}{1}'.format(name, '*' if entry.in_use else '') for name, entry in self._entries.items()],
+            self.used(), self.budget)
+
+    def used(self) -> int:
+        """:return: MB used by the engines in the pool"""
+        return sum(memory(entry.setup) for entry in self._entries.values())
+
+    def _spawn(self, entry: _Entry) -> None:
+        try:
+            entry.engine = chess.engine.SimpleEngine.popen_uci(entry.setup.path)
+            LOG.info('engine %s started', entry.setup.name)
+        except Exception as error:  # re-raised by acquire()
+            LOG.error('engine %s could not start: %s', entry.setup.name, error)
+            entry.error = error
+        entry.ready.set()
+
+    def _evict(self, needed: int) -> None:
+        """Stop idle engines, least recently used first, until 'needed' MB fits in the budget. Call with the lock"""
+        idle = sorted((entry for entry in self._entries.values() if not entry.in_use and entry.ready.is_set()),
+                      key=lambda entry: entry.last_used)
+        for entry in idle:
+            if self.used() + needed <= self.budget:
+                break
+            LOG.info('engine %s stopped, memory budget', entry.setup.name)
+            del self._entries[entry.setup.name]
+            if entry.engine is not None:
+                threading.Thread(target=entry.engine.quit, name='EngineQuit', daemon=True).start()
+
+    def _entry(self, setup: config.EngineSetup) -> _Entry:
+        """:return: the entry of the engine, started in the background if it is not in the pool. Call with the lock"""
+        entry = self._entries.get(setup.name)
+        if entry is not None and entry.error is not None:
+            del self._entries[setup.name]
+            entry = None
+        if entry is None:
+            self._evict(memory(setup))
+            entry = _Entry(setup)
+            self._entries[setup.name] = entry
+            threading.Thread(target=self._spawn, args=(entry,), name='EngineSpawn', daemon=True).start()
+        return entry
+
+    def prefetch(self, setup: config.EngineSetup) -> None:
+        """Start the engine in the background, eg. when it is shown in the menu"""
+        with self._lock:
+            if setup.name not in self._entries and self.used() + memory(setup) > self.budget and \
+                    all(entry.in_use for entry in self._entries.values()):
+                LOG.debug('no prefetch of %s, no memory', setup.name)
+                return
+            self._entry(setup)
+
+    def acquire(self, setup: config.EngineSetup) -> chess.engine.SimpleEngine:
+        """
+        Engine for a new game, started if necessary. Search with a new game key, so the engine gets 'ucinewgame'
+        :raises: the exception of the engine start
+        """
+        with self._lock:
+            entry = self._entry(setup)
+            entry.in_use = True
+        entry.ready.wait()
+        engine = entry.engine
+        if engine is None:
+            with self._lock:
+                self._entries.pop(setup.name, None)
+            raise entry.error or chess.engine.EngineError('engine {0} did not start'.format(setup.name))
+
+        engine.configure(engine_config(setup, engine))
+        LOG.debug('%s', self)
+        return engine
+
+    def release(self, engine: chess.engine.SimpleEngine) -> None:
+        """The game has ended, the engine stays warm for the next game"""
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.engine is engine:
+                    entry.in_use = False
+                    entry.last_used = monotonic()
+        LOG.debug('%s', self)
+
+    def shutdown(self) -> None:
+        """Stop all engines, eg. before a shutdown"""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.ready.wait()
+            if entry.engine is not None:
+                entry.engine.quit()
+
+
+ENGINE_POOL = EnginePool()
@@ -27,19 +27,22 @@ game_led_options        OK
 """
 
 import logging
-from time import sleep, perf_counter
+from time import perf_counter
 from functools import partial
 import threading
 import queue
 import textwrap
-from typing import List, Tuple, Union, TypeVar, Callable, Generic
+from typing import List, Tuple, Union, TypeVar, Callable, Generic, Optional
 from dataclasses import dataclass
 from PIL import Image, ImageDraw, ImageFont
 import chess
 
 import config
+from events import EVENTS, EventType
 import button
 from button import Button
+import hints
+import clock
 import epd4in2
 import frame_array
 
@@ -170,6 +173,12 @@ class Screen:
         """Return True if the Screen thread is running"""
         return self.threadlock_screen.locked()
 
+    def wait_until_done(self) -> None:
+        """Sleep until the screen thread has finished. Other events stay queued"""
+        EVENTS.discard(EventType.SCREEN_DONE)
+        while self.busy():
+            EVENTS.wait_for(EventType.SCREEN_DONE, timeout=1, dispatch=False)
+
     def update_engine_options(self, engine: config.EngineSetup) -> None:
         """
         Update the engine frame methods in the main_menu
@@ -276,8 +285,7 @@ class Screen:
         if not self.screen_queue.empty():
             LOG.debug('Waiting until screen queue is empty...')
             self.ignore_unimportant.set()
-            while self.threadlock_screen.locked():
-                sleep(0.02)
+            self.wait_until_done()
             self.ignore_unimportant.clear()
 
         else:
@@ -431,6 +439,7 @@ class EpaperThread(threading.Thread):
 
         LOG.debug('Screen thread finished')
         self.screen.threadlock_screen.release()
+        EVENTS.post(EventType.SCREEN_DONE)
 
 
 # ------------
@@ -764,11 +773,12 @@ def game_validate_board(button_panel: button.Panel, message: str, current_board:
     return Frame(name=message, items=[text0, text1], buttons=buttons)
 
 
-def game_show_board(button_panel: button.Panel, board: chess.Board) -> Frame:
+def game_show_board(button_panel: button.Panel, board: chess.Board, hint: Optional[hints.Hint] = None) -> Frame:
     """
     Show complete board
     :param button_panel, dict with button.Button object
     :param board: chess.Board
+    :param hint: best move of the position, None --> not shown
     :return: Frame
     """
     def get_key(piece: chess.Piece) -> int:
@@ -804,6 +814,9 @@ def game_show_board(button_panel: button.Panel, board: chess.Board) -> Frame:
     text1 = FrameText(content=textwrap.fill(white, width=6), pos=(236, 197), font=config.CHESS_FONT, spacing=1)
     text2 = FrameText(content=epaper_board, pos=(-22, 30), font=config.CHESS_FONT, spacing=0)
     frame = Frame('Current board', items=[text0, text1, text2, TITLE_DECORATION_RIGHT, TITLE_DECORATION_LEFT], buttons=buttons)
+    if hint is not None:
+        content = 'Best: {0} {1}'.format(board.san(hint.move), hints.score_text(hint.score))
+        frame.items.append(FrameText(content=content, pos=(236, 255)))
     return frame
 
 
@@ -819,11 +832,13 @@ def question(button_panel: button.Panel, line: str = '[Insert question here]') -
     return Frame(name=line, items=[FOOTER_LARGE, image], buttons=buttons)
 
 
-def game_computer_turn(button_panel: button.Panel, move_text: Union[FrameText, Tuple[FrameText, FrameText]] = None, partial_frame: bool = False) -> FrameTypes:
+def game_computer_turn(button_panel: button.Panel, move_text: Union[FrameText, Tuple[FrameText, FrameText]] = None, partial_frame: bool = False,
+                       thinking: bool = False) -> FrameTypes:
     """
     :param button_panel, list with button.Button object
     :param move_text: FrameItem or more FrameItems
     :param partial_frame. Set True to get the partial frame
+    :param thinking: Set True to keep the 'engine stop' button in the partial frame
     :return: frames.Frame or PartialFrame
     """
 
@@ -834,7 +849,9 @@ def game_computer_turn(button_panel: button.Panel, move_text: Union[FrameText, T
     else:
         rectangle = FrameRectangle(measurements=(0, 0, 400, 92))
         buttons = Button('Stop', button_panel.callbacks['stop_game'], call_nr=2)
-        button_panel.update_buttons(buttons)  # disable the 'engine stop' button
+        if thinking:
+            buttons = (buttons, button_panel.buttons.engine_stop)
+        button_panel.update_buttons(buttons)  # 'engine stop' only while the engine thinks
         frame = PartialFrame(name='computer turn', width=400, height=112, pos=(0, 208), items=[rectangle])
         if isinstance(move_text, tuple):
             frame.items.extend(move_text)
@@ -850,8 +867,39 @@ def game_computer_thinking(setup: config.Setup) -> FrameText:
     :param setup: MAIN.GAME.setup
     :return: frames.Partialframe
     """
-    movetime = setup.engine.options['movetime'].value
-    return FrameText('Thinking...\n(Max {0}s)'.format(movetime), pos=(15, 0), fill=config.WHITE)
+    return FrameText('Thinking...\n{0}'.format(_thinking_time(setup)), pos=(15, 0), fill=config.WHITE)
+
+
+def _thinking_time(setup: config.Setup) -> str:
+    """:return: '(Max 5s)' or '(Clock)' in games with a clock"""
+    if clock.time_control(setup.engine) is not None:
+        return '(Clock)'
+    return '(Max {0}s)'.format(setup.engine.options['movetime'].value)
+
+
+def game_computer_progress(setup: config.Setup, info: dict, board: chess.Board) -> FrameText:
+    """
+    String with the progress of the engine: depth, best move so far and score
+    :param setup: MAIN.GAME.setup
+    :param info: chess.engine.InfoDict of the running search
+    :param board: chess.Board being searched
+    :return: FrameText
+    """
+    lines = ['Thinking... depth {0}'.format(info.get('depth', '-')), _thinking_time(setup)]
+    pv = info.get('pv')
+    if pv and pv[0] in board.legal_moves:
+        score = info.get('score')
+        lines[1] = '{0} {1}'.format(board.san(pv[0]), hints.score_text(None if score is None else score.relative))
+    return FrameText('\n'.join(lines), pos=(15, 0), fill=config.WHITE)
+
+
+def game_clock(text: str) -> PartialFrame:
+    """
+    Time left of white and black, left of the image on the player and computer turn frames
+    :param text: clock.ChessClock.text()
+    :return: PartialFrame
+    """
+    return PartialFrame(name='clock', items=[FrameText(content=text, pos=(8, 3))], width=120, height=56, pos=(0, 40))
 
 
 def game_engine_info(player_turn: bool, engine: config.EngineSetup) -> PartialFrame:
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+One event dispatcher for all input of the program.
+Interrupt threads (gpio callback, screen thread, engine) only post typed events. The main thread sleeps in epoll
+(selectors module) until an event arrives, a timer expires or a registered file descriptor becomes readable.
+Handlers are registered per event type and per program state and always run on the waiting (main) thread.
+No signals are used for wakeups, so a wakeup posted just before the main thread starts waiting is never lost.
+"""
+
+import logging
+import os
+import selectors
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from heapq import heappush, heappop
+from time import monotonic
+from typing import Any, Callable, Deque, Dict, List, Optional, Iterable, Tuple, Union
+
+import config
+
+LOG = logging.getLogger(__name__)
+
+
+class EventType(Enum):
+    """Event sources"""
+    BUTTON = 0  # data: callback of the pressed button
+    REED = 1  # reed change detected by the arduino, data: serial_async.ReedEvent
+    SHUTDOWN = 2  # arduino shutdown interrupt, data: serial_arduino.ReasonInterrupt
+    SCREEN_DONE = 3  # screen thread finished the queue
+    ENGINE_RESULT = 4  # data: chess.engine.PlayResult or the exception raised by the engine
+    TIMER = 5  # data: name of the timer
+    ENGINE_INFO = 6  # data: search.Search with new progress info
+
+
+# Only the last one counts: a new event of these types replaces the pending one. All other events queue up
+COALESCED = frozenset({EventType.SCREEN_DONE, EventType.ENGINE_INFO})
+
+
+@dataclass
+class Event:
+    """Event posted by a source"""
+    type: EventType
+    data: Any = None
+    timestamp: float = field(default_factory=monotonic)
+
+    def __str__(self) -> str:
+        return 'Event: {0}, data={1}'.format(self.type.name, self.data)
+
+
+Handler = Callable[[Event], Any]
+
+
+class Dispatcher:
+    """Thread-safe event queue with an epoll loop for the main thread"""
+    def __init__(self, size: int = config.EVENT_QUEUE_SIZE):
+        """:param size: nr of pending events that is logged as a backlog. Events are never dropped"""
+        self._lock = threading.Lock()
+        self._selector = selectors.DefaultSelector()
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        self._selector.register(self._wake_read, selectors.EVENT_READ, None)
+        self._pending: Deque[Event] = deque()
+        self.size = size
+        self._handlers: Dict[EventType, List[Tuple[Optional[frozenset], Handler]]] = {}
+        self._timers: List[Tuple[float, int, str]] = []  # heap with (deadline, sequence nr, name)
+        self._timer_seq: Dict[str, int] = {}  # name: sequence nr of the active timer
+        self._sequence = 0
+        self._woken = False
+        self.get_state: Callable[[], Any] = lambda: None
+
+    def __str__(self) -> str:
+        return 'Dispatcher: {0} pending, {1} timers'.format(len(self._pending), len(self._timer_seq))
+
+    def _wake(self) -> None:
+        try:
+            os.write(self._wake_write, b'\0')
+        except BlockingIOError:
+            pass  # pipe full, the main thread wakes up anyway
+
+    # -------------
+    # -- Sources --
+    # -------------
+    def post(self, event_type: EventType, data: Any = None) -> None:
+        """
+        Add an event and wake up the main thread. An event of a COALESCED type replaces the pending one. Thread-safe
+        :param event_type: EventType
+        :param data: event data
+        """
+        with self._lock:
+            if event_type in COALESCED:
+                for event in [item for item in self._pending if item.type == event_type]:
+                    self._pending.remove(event)
+            self._pending.append(Event(event_type, data))
+            if len(self._pending) == self.size:
+                LOG.warning('Event queue: %s events waiting for the main thread', self.size)
+        self._wake()
+
+    def wakeup(self) -> None:
+        """
+        Let the current or next dispatching wait return without an event, eg. after a state change. Waits without
+        dispatch (dispatch=False) can't react to a state change and leave the wakeup for the next one. Thread-safe
+        """
+        with self._lock:
+            self._woken = True
+        self._wake()
+
+    def set_timer(self, name: str, delay: float) -> None:
+        """
+        Post a TIMER event after 'delay' seconds. Setting a timer with the same name again restarts it. Thread-safe
+        :param name: str, timer name
+        :param delay: seconds
+        """
+        with self._lock:
+            self._sequence += 1
+            self._timer_seq[name] = self._sequence
+            heappush(self._timers, (monotonic() + delay, self._sequence, name))
+        self._wake()
+
+    def cancel_timer(self, name: str) -> None:
+        """:param name: str, timer name"""
+        with self._lock:
+            self._timer_seq.pop(name, None)
+
+    def add_reader(self, fd: int, callback: Callable[[], Any]) -> None:
+        """
+        Watch a file descriptor (eg. a gpiod line or a uart). The callback runs on the waiting thread and normally
+        posts an event.
+        :param fd: file descriptor
+        :param callback: function without arguments
+        """
+        self._selector.register(fd, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fd: int) -> None:
+        self._selector.unregister(fd)
+
+    # --------------
+    # -- Handlers --
+    # --------------
+    def bind_state(self, get_state: Callable[[], Any]) -> None:
+        """:param get_state: function returning the current program state, used to select handlers"""
+        self.get_state = get_state
+
+    def register(self, event_type: EventType, handler: Handler, states: Optional[Iterable] = None) -> None:
+        """
+        :param event_type: EventType
+        :param handler: function with the Event as only argument
+        :param states: program states in which the handler is active, None --> all states
+        """
+        active = None if states is None else frozenset(states)
+        self._handlers.setdefault(event_type, []).append((active, handler))
+
+    def unregister(self, event_type: EventType, handler: Handler) -> None:
+        self._handlers[event_type] = [item for item in self._handlers.get(event_type, []) if item[1] != handler]
+
+    def handler(self, event: Event) -> Optional[Handler]:
+        """:return: the handler for this event in the current state or None"""
+        state = self.get_state()
+        for states, handler in self._handlers.get(event.type, []):
+            if states is None or state in states:
+                return handler
+        return None
+
+    def dispatch(self, event: Event) -> Any:
+        """
+        Run the handler of an event
+        :return: result of the handler, None if there is no handler for the current state
+        """
+        handler = self.handler(event)
+        if handler is None:
+            LOG.debug('No handler for %s', event)
+            return None
+        LOG.debug('Dispatch %s to %s', event, handler.__name__)
+        return handler(event)
+
+    # -------------
+    # -- Waiting --
+    # -------------
+    def _take(self, event_types: Optional[Iterable[EventType]]) -> Optional[Event]:
+        """:return: oldest pending event of the given types (None --> any type that has a handler)"""
+        with self._lock:
+            for event in self._pending:
+                if event_types is None:
+                    match = self.handler(event) is not None
+                else:
+                    match = event.type in event_types
+                if match:
+                    self._pending.remove(event)
+                    return event
+        return None
+
+    def _fire_timers(self) -> Optional[float]:
+        """
+        Post a TIMER event for every expired timer
+        :return: seconds until the next timer, None if there are no timers
+        """
+        now = monotonic()
+        expired = []
+        with self._lock:
+            while self._timers:
+                deadline, sequence, name = self._timers[0]
+                if self._timer_seq.get(name) != sequence:  # cancelled or restarted
+                    heappop(self._timers)
+                elif deadline <= now:
+                    heappop(self._timers)
+                    del self._timer_seq[name]
+                    expired.append(name)
+                else:
+                    break
+            next_timer = self._timers[0][0] - now if self._timers else None
+
+        for name in expired:
+            self.post(EventType.TIMER, name)
+        return next_timer
+
+    def _select(self, timeout: Optional[float]) -> None:
+        """Sleep until a file descriptor is readable or the timeout has passed"""
+        for key, _ in self._selector.select(timeout):
+            if key.fd == self._wake_read:
+                try:
+                    while os.read(self._wake_read, 512):
+                        pass
+                except BlockingIOError:
+                    pass
+            else:
+                key.data()
+
+    def wait_for(self, event_types: Union[EventType, Iterable[EventType]], timeout: Optional[float] = None, dispatch: bool = True) -> Optional[Event]:
+        """
+        Sleep until an event of one of the given types arrives. Must be called from the main thread.
+        Other events with a handler for the current state are dispatched first. The wait returns after a dispatch
+        because the handler may have changed the program state. Events without a handler stay in the queue.
+        :param event_types: EventType or list with EventType
+        :param timeout: seconds, None waits forever
+        :param dispatch: False --> only wait, leave all other events in the queue
+        :return: the Event or None after a timeout, a dispatch or a wakeup() (only when dispatch is True)
+        """
+        types = (event_types,) if isinstance(event_types, EventType) else tuple(event_types)
+        end = None if timeout is None else monotonic() + timeout
+        while True:
+            next_timer = self._fire_timers()
+            event = self._take(types)
+            if event is not None:
+                return event
+
+            if dispatch:
+                other = self._take(None)
+                if other is not None:
+                    self.dispatch(other)
+                    with self._lock:
+                        self._woken = False  # the caller checks the state after a dispatch anyway
+                    return None
+
+                with self._lock:
+                    woken, self._woken = self._woken, False
+                if woken:
+                    return None
+
+            remaining = None if end is None else end - monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            if next_timer is not None:
+                remaining = next_timer if remaining is None else min(remaining, next_timer)
+            self._select(remaining)
+
+    def discard(self, event_type: EventType) -> None:
+        """Drop all pending events of a type"""
+        with self._lock:
+            for event in [item for item in self._pending if item.type == event_type]:
+                self._pending.remove(event)
+
+
+EVENTS = Dispatcher()
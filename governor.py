@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Governors for the engine resources.
+ResourceGovernor samples the cpu temperature, the throttle flags of the firmware (under-voltage) and the free memory.
+From these it sets a level (normal, warm, critical) that shortens the movetime and lowers the engine threads and hash,
+always within the settings of the user, so the pi stays out of thermal throttling and the battery lasts longer.
+PonderGovernor decides how many seconds the engine may search on the turn of the player. While the player thinks, the
+engine can search the position after the reply it expects (PlayResult.ponder). When the player plays that move (a
+ponder hit) the computer move is instant or needs less time. No pondering unless the resources are at the normal
+level, or when the player seldom plays the expected reply.
+"""
+
+import logging
+from collections import deque
+from dataclasses import dataclass
+from enum import IntEnum
+from subprocess import run, CalledProcessError
+from time import monotonic
+from typing import Deque, Dict, Optional, Union
+
+import config
+
+LOG = logging.getLogger(__name__)
+
+# Current flags of the firmware throttle register (vcgencmd get_throttled)
+UNDER_VOLTAGE = 0x1
+FREQUENCY_CAPPED = 0x2
+THROTTLED = 0x4
+SOFT_TEMPERATURE_LIMIT = 0x8
+
+
+class Level(IntEnum):
+    """How much the engine may use"""
+    NORMAL = 0
+    WARM = 1  # hot or throttled
+    CRITICAL = 2  # very hot or under-voltage
+
+
+@dataclass
+class Sample:
+    """Measurements, None if the source is not available"""
+    temperature: Optional[float] = None  # degrees celsius
+    throttled: Optional[int] = None  # throttle flags
+    memory: Optional[int] = None  # MB available
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except OSError:
+        return None
+
+
+def read_temperature() -> Optional[float]:
+    value = _read(config.CPU_TEMP_FILE)
+    return None if value is None else int(value) / 1000
+
+
+def read_throttled() -> Optional[int]:
+    """:return: throttle flags from sysfs or vcgencmd"""
+    value = _read(config.THROTTLED_FILE)
+    if value is None:
+        try:
+            value = run(['vcgencmd', 'get_throttled'], capture_output=True, check=True, text=True).stdout.split('=')[-1]
+        except (OSError, CalledProcessError):
+            return None
+    try:
+        return int(value.strip(), 16)
+    except ValueError:
+        return None
+
+
+def read_memory() -> Optional[int]:
+    """:return: MB available (MemAvailable)"""
+    for line in (_read('/proc/meminfo') or '').splitlines():
+        if line.startswith('MemAvailable:'):
+            return int(line.split()[1]) // 1024
+    return None
+
+
+class ResourceGovernor:
+    """Engine settings from temperature, throttling and memory"""
+    def __init__(self, interval: float = config.GOVERNOR_INTERVAL):
+        """:param interval: seconds between samples"""
+        self.interval = interval
+        self.sample = Sample()
+        self.sampled = -interval
+        self.level = Level.NORMAL
+
+    def __str__(self) -> str:
+        return 'ResourceGovernor: {0}, {1}'.format(self.level.name, self.sample)
+
+    def update(self) -> Level:
+        """Sample the sources when the last sample is older than the interval. Changes of the level are logged"""
+        now = monotonic()
+        if now - self.sampled >= self.interval:
+            self.sampled = now
+            self.sample = Sample(read_temperature(), read_throttled(), read_memory())
+            level = self._level()
+            if level != self.level:
+                LOG.info('%s --> %s', self, level.name)
+                self.level = level
+        return self.level
+
+    def _level(self) -> Level:
+        temperature = self.sample.temperature or 0
+        throttled = self.sample.throttled or 0
+        if temperature >= config.TEMP_CRITICAL or throttled & UNDER_VOLTAGE:
+            return Level.CRITICAL
+        if temperature >= config.TEMP_HIGH or throttled & (THROTTLED | FREQUENCY_CAPPED | SOFT_TEMPERATURE_LIMIT):
+            return Level.WARM
+        return Level.NORMAL
+
+    def movetime(self, requested: float) -> float:
+        """
+        :param requested: movetime set by the user, the upper bound
+        :return: seconds for the computer move
+        """
+        factor = (1, 0.5, 0.25)[self.update()]
+        movetime = max(requested * factor, min(config.MOVETIME_MIN, requested))
+        if movetime < requested:
+            LOG.info('movetime %s sec instead of %s (%s)', movetime, requested, self.level.name)
+        return movetime
+
+    def engine_options(self, options: Dict[str, Union[str, int, bool]]) -> Dict[str, Union[str, int, bool]]:
+        """
+        :param options: uci options from the setup. 'Threads' and 'Hash' are the upper bounds
+        :return: options with Threads and Hash for the current level and free memory
+        """
+        level = self.update()
+        adjusted = dict(options)
+        if 'Threads' in options:
+            threads = int(options['Threads'])
+            adjusted['Threads'] = (threads, max(1, threads // 2), 1)[level]
+        if 'Hash' in options and self.sample.memory is not None and self.sample.memory < config.MEMORY_LOW:
+            adjusted['Hash'] = max(config.ENGINE_DEFAULT_HASH, int(options['Hash']) // 2)
+        if adjusted != options:
+            LOG.info('engine options %s (%s, %s MB free)', {name: adjusted[name] for name in ('Threads', 'Hash') if name in adjusted},
+                     level.name, self.sample.memory)
+        return adjusted
+
+    def allow_ponder(self) -> bool:
+        return self.update() == Level.NORMAL
+
+
+class PonderGovernor:
+    """Ponder budget from the resources and the ponder hit statistics"""
+    def __init__(self, resources: ResourceGovernor, max_time: float = config.PONDER_MAX_TIME, min_tries: int = config.PONDER_MIN_TRIES,
+                 min_hit_rate: float = config.PONDER_MIN_HIT_RATE, window: int = config.PONDER_WINDOW):
+        self.resources = resources
+        self.max_time = max_time
+        self.min_tries = min_tries
+        self.min_hit_rate = min_hit_rate
+        self.results: Deque[bool] = deque(maxlen=window)  # True for every player move that was the expected reply
+        self.time_used = 0.0  # seconds of ponder search since boot
+
+    def __str__(self) -> str:
+        rate = self.hit_rate
+        return 'PonderGovernor: hit rate={0} ({1} moves), used={2:.0f} sec'.format(
+            '-' if rate is None else '{0:.0%}'.format(rate), len(self.results), self.time_used)
+
+    @property
+    def hit_rate(self) -> Optional[float]:
+        """:return: part of the recent player moves that was the expected reply, None if there are no moves yet"""
+        if not self.results:
+            return None
+        return sum(self.results) / len(self.results)
+
+    def record(self, hit: bool) -> None:
+        """
+        Count a player move for which the engine expected a reply, pondering or not. The statistics keep running
+        while pondering is off, so pondering comes back when the player gets predictable again.
+        :param hit: True if the player played the expected reply
+        """
+        self.results.append(hit)
+        LOG.debug('%s', self)
+
+    def used(self, seconds: float) -> None:
+        """:param seconds: search time of a ponder search, for the statistics"""
+        self.time_used += seconds
+
+    def budget(self, movetime: float) -> float:
+        """
+        :param movetime: seconds for a computer move
+        :return: seconds the engine may ponder this turn, 0 --> don't ponder
+        """
+        if not self.resources.allow_ponder():
+            LOG.info('no pondering: %s', self.resources)
+            return 0.0
+        rate = self.hit_rate
+        if rate is not None and len(self.results) >= self.min_tries and rate < self.min_hit_rate:
+            LOG.info('no pondering: hit rate %.0f%%', 100 * rate)
+            return 0.0
+        return float(min(movetime, self.max_time))
+
+
+RESOURCES = ResourceGovernor()
+PONDER = PonderGovernor(RESOURCES)
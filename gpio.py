@@ -1,12 +1,11 @@
 #!/usr/bin/env python3
-"""Gpio with pigpio and spidev module"""
+"""Gpio and spi through a backend from gpio_backends (RPi.GPIO, gpiod or mock, see config.GPIO_BACKEND)"""
 
-from time import sleep
 import logging
-import RPi.GPIO as GPIO
-import spidev
 import config
-from typing import Union, List, Tuple, Callable
+import gpio_backends
+from gpio_backends import HIGH, LOW, RISING, FALLING
+from typing import Union, List, Tuple, Callable, Dict, Any, Optional
 
 LOG = logging.getLogger(__name__)
 
@@ -43,8 +42,28 @@ GPIOB = 0x13
 OLATA = 0x14
 OLATB = 0x15
 
-SPI_EPAPER = spidev.SpiDev()
-SPI_BUTTONS = spidev.SpiDev()
+_BACKEND: Optional[gpio_backends.Backend] = None
+SPI_EPAPER: Any = None  # opened by init_epaper()
+SPI_BUTTONS: Any = None  # opened by init_buttons()
+# Last value written to the mcp23s17 registers. Writes with the same value are skipped
+_MCP_SHADOW: Dict[int, int] = {}
+
+
+def backend() -> gpio_backends.Backend:
+    """:return: the active backend, created from config.GPIO_BACKEND on first use"""
+    global _BACKEND
+    if _BACKEND is None:
+        if config.GPIO_BACKEND == 'gpiod':
+            _BACKEND = gpio_backends.create('gpiod', chip=config.GPIOD_CHIP)
+        else:
+            _BACKEND = gpio_backends.create(config.GPIO_BACKEND)
+    return _BACKEND
+
+
+def use_backend(new: gpio_backends.Backend) -> None:
+    """Replace the backend, eg. with a gpio_backends.MockBackend for benchmarks. Call before init()"""
+    global _BACKEND
+    _BACKEND = new
 
 
 def init():
@@ -56,27 +75,22 @@ def init():
 
 def init_gpio():
     """init other gpio pins"""
-    GPIO.setmode(GPIO.BCM)
-    GPIO.setwarnings(False)
     # Arduino interrupt
-    GPIO.setup(config.ARDUINO_INT_PIN, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+    backend().setup_input(config.ARDUINO_INT_PIN, pull_down=True)
 
 
 def init_buttons():
     """init spi device for buttons"""
-    GPIO.setup(config.BUTTON_RESET_PIN, GPIO.OUT)
-    GPIO.output(config.BUTTON_RESET_PIN, GPIO.HIGH)
-    GPIO.setup(config.CS_BUTTON_PIN, GPIO.OUT)
-    SPI_BUTTONS.open(0, 0)
-    SPI_BUTTONS.max_speed_hz = 8000000
-    SPI_BUTTONS.mode = 0
+    global SPI_BUTTONS
+    backend().setup_output(config.BUTTON_RESET_PIN, HIGH)
+    backend().setup_output(config.CS_BUTTON_PIN)
+    SPI_BUTTONS = backend().spi(0, 0, max_speed_hz=8000000, mode=0)
     # mcp23S17 config
     button_reset()
     mcp23s17_read_register(INTCAPA)  # read interrupt register to clear it
     mcp23s17_read_register(INTCAPB)  # read interrupt register to clear it
-    mcp23s17_write_register(IOCON, 0x28)  # Config register
-    mcp23s17_write_register(IODIRA, 0xFF)  # Bank A are inputs
-    mcp23s17_write_register(IODIRB, 0x00)  # Bank B all outputs
+    mcp23s17_write_register(IOCON, 0x08)  # Config register: sequential mode for burst access, hardware address
+    mcp23s17_write_registers(IODIRA, [0xFF, 0x00])  # Bank A are inputs, bank B all outputs
     mcp23s17_write_register(GPIOB, 0x00)  # All leds off
     mcp23s17_write_register(GPPUA, 0xFF)  # enable internal pull-up resistors on bank A
     mcp23s17_write_register(GPINTENA, 0xFF)  # Enable interrupts on bank A
@@ -87,33 +101,33 @@ def init_buttons():
 
 def init_epaper():
     """init spi device for epaper screen"""
-    GPIO.setup(RST_PIN, GPIO.OUT)
-    GPIO.setup(DC_PIN, GPIO.OUT)
-    GPIO.setup(BUSY_PIN, GPIO.IN)
-    SPI_EPAPER.open(0, 1)
-    SPI_EPAPER.max_speed_hz = 16000000
-    SPI_EPAPER.mode = 0
+    global SPI_EPAPER
+    backend().setup_output(RST_PIN)
+    backend().setup_output(DC_PIN)
+    backend().setup_input(BUSY_PIN)
+    SPI_EPAPER = backend().spi(0, 1, max_speed_hz=16000000, mode=0)
 
 
 def digital_write(pin: int, value: int):
-    GPIO.output(pin, value)
+    backend().write(pin, value)
 
 
 def digital_read(pin: int):
-    return GPIO.input(pin)
+    return backend().read(pin)
 
 
 def delay_ms(delaytime: int) -> None:
     """delay in milliseconds"""
-    sleep(delaytime / 1000.0)
+    backend().delay(delaytime / 1000.0)
 
 
-def wait_for_arduino_int(timeout: int) -> None:
-    return GPIO.wait_for_edge(config.ARDUINO_INT_PIN, GPIO.RISING, timeout=timeout)
+def wait_for_arduino_int(timeout: int) -> Optional[int]:
+    return backend().wait_for_edge(config.ARDUINO_INT_PIN, RISING, timeout=timeout)
 
 
 def set_callback(pin: int, callback: Callable) -> None:
-    GPIO.add_event_detect(pin, GPIO.FALLING, callback=callback)
+    """:param callback: called as callback(pin) on the falling edge, from a background thread"""
+    backend().add_callback(pin, FALLING, callback)
 
 
 def epaper_transfer_data(data: Union[List[int], Tuple[int]]) -> None:
@@ -131,14 +145,15 @@ def set_button_led(value: int) -> None:
 
 def button_reset() -> None:
     """Reset the mcp23x17 ic"""
-    digital_write(config.BUTTON_RESET_PIN, GPIO.LOW)
+    digital_write(config.BUTTON_RESET_PIN, LOW)
     delay_ms(1)
-    digital_write(config.BUTTON_RESET_PIN, GPIO.HIGH)
+    digital_write(config.BUTTON_RESET_PIN, HIGH)
+    _MCP_SHADOW.clear()  # registers are back at their default values
 
 
 def cleanup() -> None:
     """reset gpio pin configuration on the rpi"""
-    GPIO.cleanup()
+    backend().cleanup()
 
 
 def epaper_read(reg: int, nr_of_bytes: int = 1):
@@ -154,12 +169,29 @@ def epaper_write(data: int, reg: int = None):
         SPI_EPAPER.writebytes([data])
 
 
-def mcp23s17_write_register(register: int, value: int) -> None:
+def mcp23s17_write_register(register: int, value: int, force: bool = False) -> None:
     """
+    Write-through: the write is skipped when the register already has this value
     param register: int: register
     param value: int: value
+    param force: bool: write even if the shadow has the same value
     """
+    if not force and _MCP_SHADOW.get(register) == value:
+        return
+
     SPI_BUTTONS.xfer2([MCP_WRITE, register, value])
+    _MCP_SHADOW[register] = value
+
+
+def mcp23s17_write_registers(register: int, values: List[int]) -> None:
+    """
+    Burst write to consecutive registers in 1 spi transaction (sequential mode)
+    param register: int: first register
+    param values: list with values
+    """
+    SPI_BUTTONS.xfer2([MCP_WRITE, register] + list(values))
+    for offset, value in enumerate(values):
+        _MCP_SHADOW[register + offset] = value
 
 
 def mcp23s17_read_register(register: int) -> int:
@@ -169,3 +201,14 @@ def mcp23s17_read_register(register: int) -> int:
     """
     incoming = SPI_BUTTONS.xfer2([MCP_READ, register, 0])
     return int(incoming[2])
+
+
+def mcp23s17_read_registers(register: int, count: int) -> List[int]:
+    """
+    Burst read of consecutive registers in 1 spi transaction (sequential mode). Eg. INTFA, INTFB, INTCAPA
+    param register: first register
+    param count: nr of registers
+    return list: register values
+    """
+    incoming = SPI_BUTTONS.xfer2([MCP_READ, register] + [0] * count)
+    return [int(value) for value in incoming[2:]]
@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+"""
+Backends for gpio pins and spi devices. gpio.py talks to one of these instead of importing RPi.GPIO and spidev itself.
+    - rpi:   RPi.GPIO + spidev
+    - gpiod: linux gpio character device (libgpiod v1 python bindings) + spidev. Edge events come from the kernel
+             event queue instead of the sysfs polling thread of RPi.GPIO
+    - mock:  in memory. Records every pin change and spi transaction with its (virtual) timing. Used to benchmark
+             epd4in2 and button on a pc. The uart to the arduino is answered by ArduinoMock
+The hardware libraries are only imported when the backend is created.
+Spi devices follow the spidev api (xfer2, writebytes, writebytes2, readbytes) and the uart follows the pyserial api
+(write, read, read_until, flushInput, flushOutput, fileno) so the drivers don't care which backend is active. Pin callbacks are called as callback(pin) from a background thread, like RPi.GPIO does.
+"""
+
+import logging
+import os
+import select
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from time import sleep, monotonic
+from typing import Dict, List, Tuple, Callable, Optional, Any, Sequence
+
+LOG = logging.getLogger(__name__)
+
+LOW = 0
+HIGH = 1
+RISING = 'rising'
+FALLING = 'falling'
+BOTH = 'both'
+
+
+class Backend(ABC):
+    """Interface for the gpio backends"""
+    name = ''
+
+    def __str__(self) -> str:
+        return 'gpio backend: {0}'.format(self.name)
+
+    @abstractmethod
+    def setup_output(self, pin: int, value: int = LOW) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def setup_input(self, pin: int, pull_down: bool = False) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def write(self, pin: int, value: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self, pin: int) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def wait_for_edge(self, pin: int, edge: str, timeout: int) -> Optional[int]:
+        """
+        :param pin: BCM pin nr
+        :param edge: RISING, FALLING or BOTH
+        :param timeout: milliseconds
+        :return: pin nr or None on timeout
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_callback(self, pin: int, edge: str, callback: Callable[[int], Any]) -> None:
+        """Call callback(pin) on every edge"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def spi(self, bus: int, device: int, max_speed_hz: int, mode: int = 0) -> Any:
+        """:return: opened spi device with the spidev api"""
+        raise NotImplementedError
+
+    def uart(self, port: str, baudrate: int, timeout: float) -> Any:
+        """:return: opened serial port with the pyserial api"""
+        import serial  # pylint: disable=import-outside-toplevel
+        return serial.Serial(port=port, baudrate=baudrate, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE,
+                             bytesize=serial.EIGHTBITS, timeout=timeout)
+
+    def delay(self, seconds: float) -> None:
+        sleep(seconds)
+
+    @abstractmethod
+    def cleanup(self) -> None:
+        raise NotImplementedError
+
+
+def _spidev(bus: int, device: int, max_speed_hz: int, mode: int) -> Any:
+    """Open a spidev device"""
+    import spidev  # pylint: disable=import-outside-toplevel
+    spi = spidev.SpiDev()
+    spi.open(bus, device)
+    spi.max_speed_hz = max_speed_hz
+    spi.mode = mode
+    return spi
+
+
+# --------------
+# -- RPi.GPIO --
+# --------------
+class RPiGpioBackend(Backend):
+    """RPi.GPIO in BCM mode"""
+    name = 'rpi'
+
+    def __init__(self) -> None:
+        import RPi.GPIO as GPIO  # pylint: disable=import-outside-toplevel
+        self.gpio = GPIO
+        self._edges = {RISING: GPIO.RISING, FALLING: GPIO.FALLING, BOTH: GPIO.BOTH}
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setwarnings(False)
+
+    def setup_output(self, pin: int, value: int = LOW) -> None:
+        self.gpio.setup(pin, self.gpio.OUT, initial=value)
+
+    def setup_input(self, pin: int, pull_down: bool = False) -> None:
+        self.gpio.setup(pin, self.gpio.IN, pull_up_down=self.gpio.PUD_DOWN if pull_down else self.gpio.PUD_OFF)
+
+    def write(self, pin: int, value: int) -> None:
+        self.gpio.output(pin, value)
+
+    def read(self, pin: int) -> int:
+        return int(self.gpio.input(pin))
+
+    def wait_for_edge(self, pin: int, edge: str, timeout: int) -> Optional[int]:
+        channel = self.gpio.wait_for_edge(pin, self._edges[edge], timeout=timeout)
+        return None if channel is None else int(channel)
+
+    def add_callback(self, pin: int, edge: str, callback: Callable[[int], Any]) -> None:
+        self.gpio.add_event_detect(pin, self._edges[edge], callback=callback)
+
+    def spi(self, bus: int, device: int, max_speed_hz: int, mode: int = 0) -> Any:
+        return _spidev(bus, device, max_speed_hz, mode)
+
+    def cleanup(self) -> None:
+        self.gpio.cleanup()
+
+
+# -----------
+# -- gpiod --
+# -----------
+class GpiodBackend(Backend):
+    """Linux gpio character device with the libgpiod v1 python bindings"""
+    name = 'gpiod'
+    consumer = 'chesspi'
+
+    def __init__(self, chip: str = 'gpiochip0') -> None:
+        import gpiod  # pylint: disable=import-outside-toplevel
+        self.gpiod = gpiod
+        self.chip = gpiod.Chip(chip)
+        self._lines: Dict[int, Tuple[Any, Any]] = {}  # pin: (line, request type)
+        self._flags: Dict[int, int] = {}
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._edges = {
+            RISING: gpiod.LINE_REQ_EV_RISING_EDGE,
+            FALLING: gpiod.LINE_REQ_EV_FALLING_EDGE,
+            BOTH: gpiod.LINE_REQ_EV_BOTH_EDGES,
+        }
+
+    def _request(self, pin: int, request_type: int, default: Optional[int] = None) -> Any:
+        """Get the line with the given request type. A line has to be released before it can be requested again"""
+        if pin in self._lines:
+            line, current = self._lines[pin]
+            if current == request_type:
+                return line
+            line.release()
+
+        line = self.chip.get_line(pin)
+        kwargs = {'consumer': self.consumer, 'type': request_type, 'flags': self._flags.get(pin, 0)}
+        if default is not None:
+            kwargs['default_vals'] = [default]
+        line.request(**kwargs)
+        self._lines[pin] = (line, request_type)
+        return line
+
+    def setup_output(self, pin: int, value: int = LOW) -> None:
+        self._request(pin, self.gpiod.LINE_REQ_DIR_OUT, default=value)
+
+    def setup_input(self, pin: int, pull_down: bool = False) -> None:
+        self._flags[pin] = self.gpiod.LINE_REQ_FLAG_BIAS_PULL_DOWN if pull_down else 0
+        self._request(pin, self.gpiod.LINE_REQ_DIR_IN)
+
+    def write(self, pin: int, value: int) -> None:
+        self._lines[pin][0].set_value(value)
+
+    def read(self, pin: int) -> int:
+        return int(self._lines[pin][0].get_value())
+
+    def wait_for_edge(self, pin: int, edge: str, timeout: int) -> Optional[int]:
+        line = self._request(pin, self._edges[edge])
+        seconds, millis = divmod(timeout, 1000)
+        if not line.event_wait(sec=seconds, nsec=millis * 1000000):
+            return None
+        line.event_read()
+        return pin
+
+    def add_callback(self, pin: int, edge: str, callback: Callable[[int], Any]) -> None:
+        line = self._request(pin, self._edges[edge])
+
+        def watch() -> None:
+            while not self._stop.is_set():
+                if line.event_wait(sec=1):
+                    line.event_read()
+                    callback(pin)
+
+        thread = threading.Thread(target=watch, name='GpiodEventThread-{0}'.format(pin), daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def spi(self, bus: int, device: int, max_speed_hz: int, mode: int = 0) -> Any:
+        return _spidev(bus, device, max_speed_hz, mode)
+
+    def cleanup(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=2)
+        for line, _ in self._lines.values():
+            line.release()
+        self._lines.clear()
+        self.chip.close()
+
+
+# ----------
+# -- Mock --
+# ----------
+@dataclass
+class Transaction:
+    """Recorded pin change or spi transfer"""
+    timestamp: float  # virtual time in seconds
+    device: str  # 'pin 20', 'spi 0.1'...
+    kind: str  # 'write', 'read', 'xfer'...
+    data: Any
+    duration: float = 0.0  # seconds on the wire (spi)
+
+
+class Mcp23s17Mock:
+    """Register file of a mcp23s17 on the mock spi bus. Bank A reads high: no button pressed"""
+    def __init__(self) -> None:
+        self.registers = [0] * 0x16
+        self.registers[0x00] = self.registers[0x01] = 0xFF  # IODIRA, IODIRB
+        self.registers[0x12] = 0xFF  # GPIOA
+
+    def __call__(self, data: Sequence[int]) -> List[int]:
+        opcode, register = data[0], data[1]
+        sequential = not self.registers[0x0A] & 0x20  # IOCON.SEQOP
+        response = [0, 0]
+        for value in data[2:]:
+            if opcode & 0x01:
+                response.append(self.registers[register])
+            else:
+                self.registers[register] = value
+                response.append(0)
+            if sequential:
+                register = (register + 1) % len(self.registers)
+        return response
+
+
+class MockSpi:
+    """Spi device in memory. Answers come from the responder, zeros without responder"""
+    def __init__(self, backend: 'MockBackend', bus: int, device: int, max_speed_hz: int,
+                 responder: Optional[Callable[[Sequence[int]], List[int]]] = None) -> None:
+        self.backend = backend
+        self.name = 'spi {0}.{1}'.format(bus, device)
+        self.max_speed_hz = max_speed_hz
+        self.mode = 0
+        self.responder = responder
+
+    def _transfer(self, kind: str, data: Sequence[int]) -> List[int]:
+        duration = len(data) * 8 / self.max_speed_hz
+        self.backend.record(self.name, kind, list(data), duration)
+        self.backend.clock += duration
+        return self.responder(data) if self.responder is not None else [0] * len(data)
+
+    def xfer2(self, data: Sequence[int]) -> List[int]:
+        return self._transfer('xfer', data)
+
+    def writebytes(self, data: Sequence[int]) -> None:
+        self._transfer('write', data)
+
+    def writebytes2(self, data: Sequence[int]) -> None:
+        self._transfer('write', data)
+
+    def readbytes(self, count: int) -> List[int]:
+        return self._transfer('read', [0] * count)
+
+    def close(self) -> None:
+        pass
+
+
+class ArduinoMock:
+    """Firmware of the arduino (arduino/chesspi/chesspi.ino) on the mock uart. Nothing moves, no button is pressed"""
+    def __init__(self) -> None:
+        self.flag = 0  # interrupt flag, cleared after <F>
+        self.move = 100  # square of the last reed change, 100: no move
+        self.board = [0] * 8  # reed rows as sent by <B>
+        self.slots: Dict[int, bytes] = {}  # uploaded animations
+        self.frames: List[bytes] = []  # received led frames
+
+    @staticmethod
+    def payload_size(command: int, payload: bytes) -> Optional[int]:
+        """:return: nr of bytes between the command and the STOP_CHAR, None if the size isn't known yet"""
+        if command == ord('U'):  # nr of runs + 5 bytes per run
+            return 1 + payload[0] * 5 if payload else None
+        if command in (ord('A'), ord('P')):  # slot + size + program or squares
+            return 2 + payload[1] if len(payload) > 1 else None
+        return 0
+
+    def __call__(self, command: int, payload: bytes) -> bytes:
+        """:return: answer to a complete packet"""
+        if command == ord('H'):
+            return b'<hello pi!>'
+        if command == ord('F'):
+            flag, self.flag = self.flag, 0
+            return bytes([ord('<'), flag, ord('>')])
+        if command == ord('M'):
+            move, self.move = self.move, 100
+            return bytes([ord('<'), move, ord('>')])
+        if command == ord('B'):
+            return b'<' + bytes(self.board) + b'>'
+        if command == ord('R'):
+            return b'<on>'
+        if command == ord('O'):
+            return b'<off>'
+        if command == ord('U'):
+            self.frames.append(payload)
+        elif command == ord('A'):
+            self.slots[payload[0]] = payload[2:]
+            return bytes([ord('<'), payload[0], ord('>')])
+        return b''
+
+
+class MockSerial:
+    """
+    Serial port in memory. Complete packets go to the responder, its answers can be read back.
+    The answers go through a pipe, so fileno() works with select and asyncio like a real port
+    """
+    def __init__(self, backend: 'MockBackend', port: str, baudrate: int, timeout: Optional[float],
+                 responder: Optional[ArduinoMock] = None) -> None:
+        self.backend = backend
+        self.name = 'uart {0}'.format(port)
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.responder = responder
+        self._written = bytearray()  # from the host, not a complete packet yet
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+
+    def answer(self, data: bytes) -> None:
+        """Bytes from the arduino, also used by tests for unsolicited data"""
+        if data:
+            os.write(self._write_fd, data)
+
+    def write(self, data: bytes) -> int:
+        duration = len(data) * 10 / self.baudrate  # start + 8 data + stop bits
+        self.backend.record(self.name, 'write', list(data), duration)
+        self.backend.clock += duration
+        self._written += data
+        while self.responder is not None:
+            start = self._written.find(b'<')
+            if start < 0:
+                self._written.clear()
+                break
+            del self._written[:start]
+            if len(self._written) < 2:
+                break
+            command = self._written[1]
+            size = self.responder.payload_size(command, bytes(self._written[2:]))
+            if size is None or len(self._written) < size + 3:
+                break
+            payload = bytes(self._written[2:size + 2])
+            del self._written[:size + 3]
+            self.answer(self.responder(command, payload))
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        data = b''
+        deadline = None if self.timeout is None else monotonic() + self.timeout
+        while len(data) < size:
+            remaining = None if deadline is None else max(0.0, deadline - monotonic())
+            if not select.select([self._read_fd], [], [], remaining)[0]:
+                break
+            data += os.read(self._read_fd, size - len(data))
+        return data
+
+    def read_until(self, terminator: bytes = b'\n', size: Optional[int] = None) -> bytes:
+        data = b''
+        while not data.endswith(terminator) and (size is None or len(data) < size):
+            char = self.read(1)
+            if not char:
+                break
+            data += char
+        return data
+
+    def flushInput(self) -> None:  # pylint: disable=invalid-name
+        try:
+            while os.read(self._read_fd, 1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    def flushOutput(self) -> None:  # pylint: disable=invalid-name
+        pass
+
+    def fileno(self) -> int:
+        return self._read_fd
+
+    def close(self) -> None:
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+class MockBackend(Backend):
+    """
+    In memory backend. Inputs read high unless they have a pull-down, so the epaper is never busy.
+    With realtime=False delays only move the virtual clock, a full epaper refresh takes no wall time.
+    """
+    name = 'mock'
+
+    def __init__(self, realtime: bool = False) -> None:
+        self.realtime = realtime
+        self.clock = 0.0  # virtual seconds: delays + spi wire time
+        self.pins: Dict[int, int] = {}
+        self.transactions: List[Transaction] = []
+        self.responders: Dict[Tuple[int, int], Callable] = {(0, 0): Mcp23s17Mock()}  # (bus, device): responder
+        self.spi_devices: Dict[Tuple[int, int], MockSpi] = {}
+        self.arduino = ArduinoMock()
+        self._callbacks: Dict[int, List[Tuple[str, Callable[[int], Any]]]] = {}
+        self._changed = threading.Condition()
+
+    def record(self, device: str, kind: str, data: Any, duration: float = 0.0) -> None:
+        self.transactions.append(Transaction(self.clock, device, kind, data, duration))
+
+    def setup_output(self, pin: int, value: int = LOW) -> None:
+        self.pins[pin] = value
+
+    def setup_input(self, pin: int, pull_down: bool = False) -> None:
+        self.pins[pin] = LOW if pull_down else HIGH
+
+    def write(self, pin: int, value: int) -> None:
+        self.record('pin {0}'.format(pin), 'write', value)
+        self.pins[pin] = value
+
+    def read(self, pin: int) -> int:
+        self.record('pin {0}'.format(pin), 'read', self.pins.get(pin, HIGH))
+        return self.pins.get(pin, HIGH)
+
+    def set_input(self, pin: int, value: int) -> None:
+        """Change an input from outside (test/benchmark), runs the callbacks of the edge"""
+        old = self.pins.get(pin, HIGH)
+        self.pins[pin] = value
+        if old == value:
+            return
+        edge = RISING if value else FALLING
+        with self._changed:
+            self._changed.notify_all()
+        for wanted, callback in self._callbacks.get(pin, []):
+            if wanted in (edge, BOTH):
+                callback(pin)
+
+    def wait_for_edge(self, pin: int, edge: str, timeout: int) -> Optional[int]:
+        start = self.pins.get(pin, HIGH)
+        with self._changed:
+            self._changed.wait_for(lambda: self.pins.get(pin, HIGH) != start, timeout=timeout / 1000)
+        value = self.pins.get(pin, HIGH)
+        if value != start and (edge == BOTH or (edge == RISING) == bool(value)):
+            return pin
+        return None
+
+    def add_callback(self, pin: int, edge: str, callback: Callable[[int], Any]) -> None:
+        self._callbacks.setdefault(pin, []).append((edge, callback))
+
+    def spi(self, bus: int, device: int, max_speed_hz: int, mode: int = 0) -> MockSpi:
+        spi = MockSpi(self, bus, device, max_speed_hz, self.responders.get((bus, device)))
+        spi.mode = mode
+        self.spi_devices[(bus, device)] = spi
+        return spi
+
+    def uart(self, port: str, baudrate: int, timeout: float) -> MockSerial:
+        return MockSerial(self, port, baudrate, timeout, self.arduino)
+
+    def delay(self, seconds: float) -> None:
+        self.clock += seconds
+        if self.realtime:
+            sleep(seconds)
+
+    def cleanup(self) -> None:
+        self._callbacks.clear()
+
+    def summary(self) -> str:
+        """:return: nr of transactions, spi bytes and time per device"""
+        devices: Dict[str, List[float]] = {}
+        for item in self.transactions:
+            count = devices.setdefault(item.device, [0, 0, 0.0])
+            count[0] += 1
+            count[1] += len(item.data) if isinstance(item.data, list) else 0
+            count[2] += item.duration
+        return ', '.join('{0}: n={1} bytes={2} wire={3:.1f}ms'.format(name, int(n), int(size), wire * 1000)
+                         for name, (n, size, wire) in sorted(devices.items()))
+
+
+BACKENDS = {
+    RPiGpioBackend.name: RPiGpioBackend,
+    GpiodBackend.name: GpiodBackend,
+    MockBackend.name: MockBackend,
+}
+
+
+def create(name: str, **kwargs: Any) -> Backend:
+    """
+    :param name: 'rpi', 'gpiod' or 'mock'
+    :return: new backend
+    """
+    if name not in BACKENDS:
+        raise ValueError('gpio_backends: unknown backend {0}'.format(name))
+    LOG.debug('gpio backend: %s', name)
+    backend: Backend = BACKENDS[name](**kwargs)
+    return backend
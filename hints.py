@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Hints from a multi-pv search on the turn of the player.
+At the start of the turn of the player the engine searches the position for the best config.HINT_LINES moves, within
+the ponder budget (governor.PONDER) and before pondering. The results are kept per position: give_hint reads them at
+once, show_board shows the best move and the pgn notes get the better move wherever the player played another one.
+"""
+
+import logging
+from typing import List, NamedTuple, Optional, OrderedDict
+
+import chess
+import chess.engine
+import chess.pgn
+import chess.polyglot
+import config
+
+LOG = logging.getLogger(__name__)
+
+
+class Hint(NamedTuple):
+    """1 line of the multi-pv search"""
+    move: chess.Move
+    score: Optional[chess.engine.Score]  # for the side to move
+    pv: List[chess.Move]
+
+
+def score_text(score: Optional[chess.engine.Score]) -> str:
+    """:return: string like '+0.35' or '#3', empty without score"""
+    if score is None:
+        return ''
+    centipawns = score.score()
+    if centipawns is None:
+        return '#{0}'.format(score.mate())
+    return '{0:+.2f}'.format(centipawns / 100)
+
+
+class HintCache:
+    """Hints by zobrist hash, least recently used positions are dropped"""
+    def __init__(self, size: int = config.HINT_CACHE_SIZE):
+        self.size = size
+        self._hints: OrderedDict[int, List[Hint]] = OrderedDict()
+
+    def __str__(self) -> str:
+        return 'HintCache: {0} positions'.format(len(self._hints))
+
+    def put(self, board: chess.Board, lines: List[chess.engine.InfoDict]) -> None:
+        """:param lines: InfoDict per line of a multi-pv search (chess.engine.SimpleAnalysisResult.multipv)"""
+        hints = []
+        for info in lines:
+            pv = info.get('pv')
+            if pv:
+                score = info.get('score')
+                hints.append(Hint(pv[0], None if score is None else score.relative, list(pv)))
+        if not hints:
+            return
+
+        key = chess.polyglot.zobrist_hash(board)
+        self._hints[key] = hints
+        self._hints.move_to_end(key)
+        while len(self._hints) > self.size:
+            self._hints.popitem(last=False)
+        LOG.debug('hints %s: %s', board.fen(), [hint.move.uci() for hint in hints])
+
+    def get(self, board: chess.Board) -> List[Hint]:
+        """:return: the hints of the position, best first. Empty list if the position has not been searched"""
+        hints = self._hints.get(chess.polyglot.zobrist_hash(board), [])
+        return [hint for hint in hints if hint.move in board.legal_moves]
+
+    def best(self, board: chess.Board) -> Optional[Hint]:
+        hints = self.get(board)
+        return hints[0] if hints else None
+
+    def annotate(self, pgn: chess.pgn.Game, color: chess.Color) -> None:
+        """
+        Post-game review: comment the moves of the player where the hints had a better move
+        :param pgn: chess.pgn.Game
+        :param color: color of the player
+        """
+        board = pgn.board()
+        for node in pgn.mainline():
+            move = node.move
+            if move is None:
+                break
+            best = self.best(board) if board.turn == color else None
+            if best is not None and best.move != move:
+                node.comment = 'Best: {0} {1}'.format(board.san(best.move), score_text(best.score)).strip()
+            board.push(move)
+
+
+HINTS = HintCache()
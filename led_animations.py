@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Led animations that run on the arduino.
+An animation is a list of keyframes with a duration and one color for every target. The programs are uploaded once
+into numbered slots on the arduino. After that the pi only sends 'play slot N on squares X,Y'. Target 0 is the first
+square, target 1 the second one...
+
+Program format (bytes):
+    header:     nr of targets, nr of keyframes, flags (bit 0: loop)
+    keyframe:   duration in 10ms units (2 bytes, big endian) followed by RGB for every target
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, Tuple, List
+
+import config
+
+LOG = logging.getLogger(__name__)
+
+HEADER_SIZE = 3
+FLAG_LOOP = 0x01
+TIME_UNIT = 10  # ms
+MAX_DURATION = 0xFFFF * TIME_UNIT
+
+Color = Tuple[int, int, int]
+OFF = config.LED_OFF
+GREEN = config.LED_GREEN
+RED = config.LED_RED
+BLUE = config.LED_BLUE
+WHITE = config.LED_WHITE
+
+
+@dataclass
+class Keyframe:
+    """Colors for every target, shown for 'duration' milliseconds"""
+    duration: int
+    colors: Tuple[Color, ...]
+
+
+@dataclass
+class Animation:
+    """Object containing the keyframes of an animation program"""
+    name: str
+    slot: int
+    keyframes: List[Keyframe]
+    loop: bool = False
+
+    def __str__(self) -> str:
+        return '{0}: {1}, slot={2}'.format(type(self), self.name, self.slot)
+
+    @property
+    def targets(self) -> int:
+        """nr of squares the animation needs"""
+        return len(self.keyframes[0].colors)
+
+
+def encode(animation: Animation) -> bytes:
+    """
+    Make the program for an arduino slot
+    :param animation: Animation
+    :return: bytes
+    """
+    if not animation.keyframes:
+        raise ValueError('led_animations.encode: {0} has no keyframes'.format(animation.name))
+
+    targets = animation.targets
+    program = [targets, len(animation.keyframes), FLAG_LOOP if animation.loop else 0]
+    for keyframe in animation.keyframes:
+        if len(keyframe.colors) != targets:
+            raise ValueError('led_animations.encode: {0}: every keyframe needs {1} colors'.format(animation.name, targets))
+        if keyframe.duration not in range(TIME_UNIT, MAX_DURATION + 1):
+            raise ValueError('led_animations.encode: {0}: invalid duration {1}'.format(animation.name, keyframe.duration))
+
+        units = keyframe.duration // TIME_UNIT
+        program.extend((units >> 8, units & 0xFF))
+        for color in keyframe.colors:
+            if len(color) != 3 or any(value not in range(256) for value in color):
+                raise ValueError('led_animations.encode: {0}: invalid color {1}'.format(animation.name, color))
+            program.extend(color)
+
+    return bytes(program)
+
+
+def program_size(animation: Animation) -> int:
+    """:return: size of the encoded program in bytes without encoding it"""
+    return HEADER_SIZE + len(animation.keyframes) * (2 + 3 * animation.targets)
+
+
+def check_budget(animations: List[Animation]) -> int:
+    """
+    Check if the programs fit in the slots on the arduino
+    :param animations: list with Animation
+    :return: total nr of bytes used
+    :raises ValueError: when a program is too big or two programs use the same slot
+    """
+    used: Dict[int, str] = {}
+    total = 0
+    for animation in animations:
+        if animation.slot not in range(config.LED_ANIMATION_SLOTS):
+            raise ValueError('led_animations: {0}: slot {1} does not exist'.format(animation.name, animation.slot))
+        if animation.slot in used:
+            raise ValueError('led_animations: {0} and {1} use slot {2}'.format(used[animation.slot], animation.name, animation.slot))
+
+        size = program_size(animation)
+        if size > config.LED_ANIMATION_SLOT_SIZE:
+            raise ValueError('led_animations: {0} needs {1} bytes, slot size is {2}'.format(animation.name, size, config.LED_ANIMATION_SLOT_SIZE))
+
+        used[animation.slot] = animation.name
+        total += size
+
+    LOG.debug('Led animations: %s bytes used of %s', total, config.LED_ANIMATION_SLOTS * config.LED_ANIMATION_SLOT_SIZE)
+    return total
+
+
+# ----------------
+# -- Animations --
+# ----------------
+BLINK_RED = Animation('blink_red', slot=0, loop=True, keyframes=[
+    Keyframe(400, (RED,)),
+    Keyframe(400, (OFF,)),
+])
+BLINK_GREEN = Animation('blink_green', slot=1, loop=True, keyframes=[
+    Keyframe(400, (GREEN,)),
+    Keyframe(400, (OFF,)),
+])
+MOVE = Animation('move', slot=2, loop=True, keyframes=[
+    Keyframe(500, (GREEN, OFF)),
+    Keyframe(500, (GREEN, GREEN)),
+    Keyframe(300, (OFF, OFF)),
+])
+CONFIRM = Animation('wait_for_confirmation', slot=3, loop=False, keyframes=[
+    Keyframe(1000, (GREEN, GREEN)),
+    Keyframe(1000, ((0, 128, 0), (0, 128, 0))),
+    Keyframe(1000, ((0, 32, 0), (0, 32, 0))),
+])
+PROMOTION = Animation('promotion', slot=4, loop=True, keyframes=[
+    Keyframe(300, (WHITE,)),
+    Keyframe(300, (BLUE,)),
+])
+EN_PASSANT = Animation('en_passant', slot=5, loop=True, keyframes=[
+    Keyframe(400, (GREEN, RED)),
+    Keyframe(400, (GREEN, OFF)),
+])
+
+ANIMATIONS = (BLINK_RED, BLINK_GREEN, MOVE, CONFIRM, PROMOTION, EN_PASSANT)
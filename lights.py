@@ -8,36 +8,216 @@
 # promotion
 # en passant
 # indicate missing pieces
+# mark last move
 # clear square
 # clear leds
 
+# The board has a 9x9 RGB led matrix. The leds sit on the corners of the squares so every square is lit by 4 leds.
+# The pi keeps a shadow copy of what the arduino is showing. Functions only change the next frame, show() sends the
+# differences to the arduino as one run-length encoded packet.
+# Blinking and other animations run on the arduino itself, see led_animations.py
+
 import logging
+from typing import List, Tuple, Sequence, Iterable, Optional, Any
+import config
 import serial_arduino
-from enum import Enum
+import led_animations
 
 log = logging.getLogger(__name__)
 
-_ledstates = [False] * 64
+MATRIX_SIZE = 9
+NR_OF_LEDS = MATRIX_SIZE * MATRIX_SIZE
+MAX_RUN = 255
+OFF = config.LED_OFF
+GREEN = config.LED_GREEN
+ORANGE = config.LED_ORANGE
+RED = config.LED_RED
+BLUE = config.LED_BLUE
+
+Color = Tuple[int, int, int]
+
+
+class LedMatrix:
+    """Shadow framebuffer for the 9x9 RGB led matrix"""
+    def __init__(self) -> None:
+        self._shadow: List[Optional[Color]] = [OFF] * NR_OF_LEDS  # What the arduino is showing right now, None if unknown
+        self._frame: List[Color] = [OFF] * NR_OF_LEDS  # Next frame
+
+    def __str__(self) -> str:
+        return 'LedMatrix: {0} leds on'.format(sum(1 for color in self._shadow if color != OFF))
+
+    def set_led(self, index: int, color: Sequence[int]) -> None:
+        """
+        :param index: led nr (0 - 80)
+        :param color: RGB values (0 - 255)
+        """
+        if index not in range(NR_OF_LEDS) or len(color) != 3 or any(value not in range(256) for value in color):
+            _incorrect_value('set_led', index, color)
+
+        self._frame[index] = (color[0], color[1], color[2])
+
+    def set_square(self, square: int, color: Sequence[int]) -> None:
+        """
+        Light the 4 leds around a square
+        :param square: square nr (0 - 63)
+        :param color: RGB values (0 - 255)
+        """
+        for index in square_leds(square):
+            self.set_led(index, color)
+
+    def clear(self) -> None:
+        """All leds off in the next frame"""
+        self._frame = [OFF] * NR_OF_LEDS
+
+    def invalidate(self, squares: Iterable[int]) -> None:
+        """
+        Forget the shadow state of the leds around the given squares. An animation on the arduino changes them
+        without the pi knowing. The next show() will send these leds again.
+        :param squares: square nrs (0 - 63)
+        """
+        for square in squares:
+            for index in square_leds(square):
+                self._shadow[index] = None
+
+    def changes(self) -> List[Tuple[int, Color]]:
+        """:return: list with (led nr, color) for every led that differs from the shadow state"""
+        return [(index, color) for index, color in enumerate(self._frame) if self._shadow[index] != color]
+
+    def show(self, force: bool = False) -> int:
+        """
+        Send the next frame to the arduino. Only changed leds are sent.
+        :param force: bool, send the complete frame (eg. after an arduino reset)
+        :return: number of leds sent
+        """
+        if force:
+            changed = list(enumerate(self._frame))
+        else:
+            changed = self.changes()
+
+        if not changed:
+            log.debug('Leds: frame unchanged, nothing to send')
+            return 0
+
+        serial_arduino.send_led_frame(encode_runs(changed))
+        self._shadow = list(self._frame)
+        return len(changed)
+
+
+def square_leds(square: int) -> Tuple[int, int, int, int]:
+    """
+    Get the 4 led nrs on the corners of a square
+    :param square: square nr (0 - 63)
+    :return: tuple with 4 led nrs (0 - 80)
+    """
+    if square not in range(64):
+        _incorrect_value('square_leds', square)
+
+    rank, file = divmod(square, 8)
+    index = rank * MATRIX_SIZE + file
+    return index, index + 1, index + MATRIX_SIZE, index + MATRIX_SIZE + 1
+
+
+def encode_runs(changed: Iterable[Tuple[int, Color]]) -> bytes:
+    """
+    Run-length encode changed leds. A run is 5 bytes: first led nr, nr of leds, red, green, blue.
+    Consecutive leds with the same color are merged into one run.
+    :param changed: (led nr, color) sorted by led nr
+    :return: bytes: nr of runs followed by the runs
+    """
+    runs: List[List[int]] = []
+    for index, color in changed:
+        if runs:
+            last = runs[-1]
+            if last[0] + last[1] == index and tuple(last[2:]) == color and last[1] < MAX_RUN:
+                last[1] += 1
+                continue
+
+        runs.append([index, 1, *color])
+
+    return bytes([len(runs)] + [value for run in runs for value in run])
 
 
-class LedCommands(Enum):
-    SQUARE_ON = 1
-    SQUARE_OFF = 2
-    CLEAR_LEDS = 3
+MATRIX = LedMatrix()
+_animating: List[int] = []  # squares with a running animation
+_uploaded = False  # True when the arduino confirmed all animation programs
 
 
-def blink_square(square, color):
+def upload_animations() -> bool:
+    """
+    Upload all programs from led_animations to the arduino. Only needed once after boot, play() does it on its first
+    call. A failed upload is tried again by the next play()
+    :return: True if all uploads are confirmed
+    """
+    global _uploaded
+    led_animations.check_budget(list(led_animations.ANIMATIONS))
+    result = True
+    for animation in led_animations.ANIMATIONS:
+        if not serial_arduino.upload_animation(animation.slot, led_animations.encode(animation)):
+            result = False
+
+    _uploaded = result
+    return result
+
+
+def play(animation: led_animations.Animation, *squares: int) -> None:
+    """
+    Let the arduino play an uploaded animation
+    :param animation: led_animations.Animation
+    :param squares: one square nr (0 - 63) for every target of the animation
+    """
+    if len(squares) != animation.targets:
+        _incorrect_value('play', animation.name, squares)
+
+    if not _uploaded and not upload_animations():
+        log.warning('Leds: not all animations uploaded, %s may not play', animation.name)
+    stop_animations()
+    serial_arduino.play_animation(animation.slot, list(squares))
+    _animating.extend(squares)
+    MATRIX.invalidate(squares)
+
+
+def stop_animations() -> None:
+    """Stop the animations on the arduino. The leds are restored with the next show()"""
+    if _animating:
+        serial_arduino.stop_animations()
+        MATRIX.invalidate(_animating)
+        _animating.clear()
+
+
+def blink_square(square: int, color: Color = RED) -> None:
     """
     Used for indicate picked up piece, alert wrong move
     :param square: square nr (0 - 63)
-    :param color: list with RGB values
+    :param color: RED or GREEN
+    :return:
+    """
+    if color == RED:
+        play(led_animations.BLINK_RED, square)
+    elif color == GREEN:
+        play(led_animations.BLINK_GREEN, square)
+    else:
+        _incorrect_value('blink_square', square, color)
+
+
+def animate_move(from_square: int, to_square: int, from_color: Optional[Sequence[int]] = None,
+                 to_color: Optional[Sequence[int]] = None) -> None:
+    """
+    Used for hints, last move, current player/computer move
+    :param from_square: 0 - 63
+    :param to_square: 0 - 63
+    :param from_color: list with RGB values first square, None --> the move animation of the arduino
+    :param to_color: list with RGB values second square, None --> the move animation of the arduino
     :return:
     """
-    serial_arduino.update_leds(LedCommands.SQUARE_ON, 1, square, color[0], color[1], color[2])
-    _ledstates[square] = True
+    if from_color is not None and to_color is not None:
+        show_move(from_square, to_square, from_color, to_color)
+        return
+
+    clear_leds()
+    play(led_animations.MOVE, from_square, to_square)
 
 
-def animate_move(from_square, to_square, from_color, to_color):
+def show_move(from_square: int, to_square: int, from_color: Sequence[int], to_color: Sequence[int]) -> None:
     """
     Used for hints, last move, current player/computer move
     :param from_square: 0 - 63
@@ -46,18 +226,18 @@ def animate_move(from_square, to_square, from_color, to_color):
     :param to_color: list with RGB values second square
     :return:
     """
-    clear_leds()
-    _square_on(1, from_square, from_color[0], from_color[1], from_color[2])
-    _square_on(2, to_square, to_color[0], to_color[1], to_color[2])
-    _ledstates[from_square] = True
-    _ledstates[to_square] = True
+    stop_animations()
+    MATRIX.clear()
+    MATRIX.set_square(from_square, from_color)
+    MATRIX.set_square(to_square, to_color)
+    MATRIX.show()
 
 
-def move_done():
+def move_done() -> None:
     raise NotImplementedError
 
 
-def wait_for_confirmation(from_square, to_square):
+def wait_for_confirmation(from_square: int, to_square: int) -> None:
     """
     Animation when program is waiting for player to confirm move
     :param from_square: 0-63
@@ -65,82 +245,81 @@ def wait_for_confirmation(from_square, to_square):
     :return:
     """
     clear_leds()
-    _square_on(1, [from_square, to_square], 0, 255, 0)
+    play(led_animations.CONFIRM, from_square, to_square)
 
 
-def promotion():
-    raise NotImplementedError
+def promotion(square: int) -> None:
+    """
+    Ask the player to replace the pawn
+    :param square: 0-63, promotion square
+    """
+    clear_leds()
+    play(led_animations.PROMOTION, square)
 
 
-def en_passant():
-    raise NotImplementedError
+def en_passant(to_square: int, captured_square: int) -> None:
+    """
+    Show where the capturing pawn goes and which pawn has to be removed
+    :param to_square: 0-63
+    :param captured_square: 0-63
+    """
+    clear_leds()
+    play(led_animations.EN_PASSANT, to_square, captured_square)
 
 
-def indicate_missing_pieces(missing, wrong):
+def indicate_missing_pieces(missing: Iterable[int], wrong: Iterable[int]) -> None:
     """
     :param missing: list with missing squares
     :param wrong: list with incorrect squares
     :return:
     """
-    clear_leds()
+    stop_animations()
+    MATRIX.clear()
     for square in missing:
-        serial_arduino.update_leds(LedCommands.SQUARE_ON, square, 1, 255, 100, 0)
-        _ledstates[square] = True
+        MATRIX.set_square(square, ORANGE)
 
     for square in wrong:
-        serial_arduino.update_leds((LedCommands.SQUARE_ON, square, 1, 255, 0, 0))
-        _ledstates[square] = True
+        MATRIX.set_square(square, RED)
 
+    MATRIX.show()
 
-def clear_square():
-    raise NotImplementedError
 
-
-def clear_leds():
+def mark_last_move(from_square: int, to_square: int) -> None:
     """
-    All leds off
-    :return:
+    Mark the last move with blue squares
+    :param from_square: 0-63
+    :param to_square: 0-63
     """
-    serial_arduino.update_leds(LedCommands.CLEAR_LEDS)
-    for square in range(64):
-        _ledstates[square] = False
+    show_move(from_square, to_square, BLUE, BLUE)
 
 
-# ########################################################
-def _square_on(frame, squares, red, green, blue):
+def clear_square(square: int) -> None:
     """
-    Turn on 1 - 64 squares on led matrix
-    :param frame: frame nr (1 - 8)
-    :param squares: int OR list, nr 1 - 64
-    :param red: brightness red (0 - 255)
-    :param green:  brightness red (0 - 255)
-    :param blue:  brightness red (0 - 255)
-    :return: 
+    Turn off the leds around a square
+    :param square: 0-63
     """
-    if frame not in range(8) or squares not in range(65) or (red, green, blue) not in range(256):
-        _incorrect_value('_square_on', frame, squares, red, green, blue)
+    stop_animations()
+    MATRIX.set_square(square, OFF)
+    MATRIX.show()
 
-    serial_arduino.update_leds(LedCommands.SQUARE_ON, squares, red, blue, green)
 
-
-def _square_off(frame, squares):
+def clear_leds() -> None:
     """
-    Turn off 1 - 64 squares on led matrix
-    :param frame: frame nr (0 - 7)
-    :param squares: squares: int OR list, nr 1 - 64
+    All leds off
     :return:
     """
-    if frame not in range(8) or squares not in range(65):
-        _incorrect_value('_square_off', frame, squares)
-    serial_arduino.update_leds(LedCommands.SQUARE_OFF, frame, squares)
+    stop_animations()
+    MATRIX.clear()
+    MATRIX.show()
 
 
-def _incorrect_value(func, *args):
+# ########################################################
+def _incorrect_value(func: str, *args: Any) -> None:
     """
     Raise ValueError
     :param function: string, function name
     :param args: value(s)
     :return:
     """
-    log.error('lights: incorrect value: {1}'.format(func, [' {} '.format(item) for item in args]))
+    log.error('lights: incorrect value: {0}: {1}'.format(func, [' {} '.format(item) for item in args]))
     raise ValueError('{0}: Incorrect value: {1}'.format(func, [' {} '.format(item) for item in args]))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Telemetry for the serial link with the arduino.
+Round-trip latency histograms per command, retries, flushes, timeouts and byte counters. Used to tune the baudrate,
+timeouts and protocol changes with real numbers instead of DEBUG logs.
+"""
+
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Dict, List, Optional, Iterator
+
+LOG = logging.getLogger(__name__)
+
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)  # ms, upper bounds. Last bucket is everything slower
+
+
+@dataclass
+class CommandStats:
+    """Counters for 1 command"""
+    count: int = 0
+    retries: int = 0
+    timeouts: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    histogram: List[int] = field(default_factory=lambda: [0] * (len(BUCKETS) + 1))
+
+    def add(self, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.histogram[bisect_left(BUCKETS, elapsed_ms)] += 1
+
+    def percentile(self, fraction: float) -> Optional[int]:
+        """:return: upper bound (ms) of the bucket containing the given fraction of the round trips, None if empty"""
+        if not self.count:
+            return None
+        limit = fraction * self.count
+        seen = 0
+        for index, amount in enumerate(self.histogram):
+            seen += amount
+            if seen >= limit:
+                return BUCKETS[index] if index < len(BUCKETS) else int(self.max_ms)
+        return int(self.max_ms)
+
+
+class _RoundTrip(threading.local):
+    """Round trip in progress, per thread: the serial link thread and the main thread both talk to the arduino"""
+    def __init__(self) -> None:
+        self.command: Optional[bytes] = None  # command inside round_trip()
+        self.sends = 0
+
+
+class LinkStats:
+    """Thread-safe telemetry for the serial link"""
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._active = _RoundTrip()
+        self.commands: Dict[bytes, CommandStats] = {}
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.flushes = 0
+        self.timeouts = 0
+
+    def __str__(self) -> str:
+        return self.summary()
+
+    def _command(self, command: bytes) -> CommandStats:
+        if command not in self.commands:
+            self.commands[command] = CommandStats()
+        return self.commands[command]
+
+    # ---------------
+    # -- Recording --
+    # ---------------
+    @contextmanager
+    def round_trip(self, command: bytes) -> Iterator[None]:
+        """
+        Measure a complete request/answer, retries included
+        :param command: bytes: command char
+        """
+        self._active.command = command
+        self._active.sends = 0
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (perf_counter() - start) * 1000
+            with self._lock:
+                self._command(command).add(elapsed)
+            self._active.command = None
+
+    def sent(self, command: bytes, size: int) -> None:
+        """
+        Record an outgoing command. Sending the active command again counts as a retry
+        :param command: bytes: command char
+        :param size: nr of bytes written
+        """
+        with self._lock:
+            self.bytes_out += size
+            if command == self._active.command:
+                self._active.sends += 1
+                if self._active.sends > 1:
+                    self._command(command).retries += 1
+
+    def received(self, size: int, timeout: bool = False) -> None:
+        """
+        Record incoming bytes
+        :param size: nr of bytes read
+        :param timeout: set True when the read returned before the expected data arrived
+        """
+        with self._lock:
+            self.bytes_in += size
+            if timeout:
+                self.timeouts += 1
+                if self._active.command is not None:
+                    self._command(self._active.command).timeouts += 1
+
+    def flushed(self) -> None:
+        with self._lock:
+            self.flushes += 1
+
+    # ---------
+    # -- API --
+    # ---------
+    def snapshot(self) -> dict:
+        """:return: dict with all counters"""
+        with self._lock:
+            return {
+                'bytes_out': self.bytes_out,
+                'bytes_in': self.bytes_in,
+                'flushes': self.flushes,
+                'timeouts': self.timeouts,
+                'commands': {
+                    command.decode(errors='replace'): {
+                        'count': stats.count,
+                        'retries': stats.retries,
+                        'timeouts': stats.timeouts,
+                        'avg_ms': round(stats.total_ms / stats.count, 2) if stats.count else None,
+                        'p50_ms': stats.percentile(0.5),
+                        'p95_ms': stats.percentile(0.95),
+                        'max_ms': round(stats.max_ms, 2),
+                        'histogram': dict(zip([*BUCKETS, 'slower'], stats.histogram)),
+                    } for command, stats in self.commands.items()},
+            }
+
+    def summary(self) -> str:
+        """:return: compact one line summary"""
+        data = self.snapshot()
+        commands = ' '.join('{0}:n={1} avg={2}ms p95<={3}ms r={4} t={5}'.format(
+            name, item['count'], item['avg_ms'], item['p95_ms'], item['retries'], item['timeouts'])
+            for name, item in data['commands'].items())
+        return 'Serial link: out={0}B in={1}B flush={2} timeouts={3} | {4}'.format(
+            data['bytes_out'], data['bytes_in'], data['flushes'], data['timeouts'], commands)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.commands.clear()
+            self.bytes_out = self.bytes_in = self.flushes = self.timeouts = 0
+
+    def start_logging(self, interval: float) -> None:
+        """
+        Log the summary every 'interval' seconds
+        :param interval: seconds
+        """
+        def log_summary() -> None:
+            LOG.info(self.summary())
+            self.start_logging(interval)
+
+        self.stop_logging()
+        self._timer = threading.Timer(interval, log_summary)
+        self._timer.name = 'LinkStatsThread'
+        self._timer.daemon = True
+        self._timer.start()
+
+    def stop_logging(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -4,13 +4,13 @@ You can choose different chess engines to play against and configure them where
 The board uses reed contacts + chess pieces with magnets to scan for moves and positions.
 The squares on the board are animated with 9x9 RGB led matrix."""
 
-from time import sleep, strftime, localtime
+from time import sleep, strftime, localtime, monotonic
 import logging.handlers
 import signal
 from subprocess import run
 from enum import Enum
 from dataclasses import dataclass
-from typing import Set, Dict, Callable
+from typing import Set, Dict, Callable, Optional, Union
 import chess
 import chess.pgn
 import chess.engine
@@ -19,10 +19,28 @@ import config
 import gpio
 import files
 import serial_arduino
+import serial_async
 import epaper
 import button
-
-# import lights  DISABLED FOR NOW
+import reed_filter
+import move_recognizer
+import position_index
+import resync
+import search
+import governor
+import book
+import tablebase
+import hints
+import clock
+from clock import ChessClock
+from engine_cache import ENGINE_CACHE
+import engine_cache
+from engine_pool import ENGINE_POOL
+import engine_pool
+import events
+from events import EVENTS, EventType
+
+import lights
 
 # Todo: 2 new options:
 #     - move score (-> python-chess module)
@@ -67,7 +85,10 @@ class Game:
     pgn_notes: chess.pgn = chess.pgn.Game()
     pgn_headers: chess.pgn.Headers = chess.pgn.Headers()
     setup: config.Setup = config.DEFAULT_SETUP
-    computer_move: chess.engine.PlayResult = None
+    computer_move: chess.engine.PlayResult = chess.engine.PlayResult(move=None, ponder=None)  # move and ponder None --> no move yet
+    engine_options: Optional[dict] = None  # uci options sent to the engine
+    engine_game: object = None  # key of the game for the engine searches, a new key --> 'ucinewgame'
+    clock: Optional[ChessClock] = None  # None --> no clock, the engine uses the movetime
     piece_up: int = -1
     # confirm: bool = False
     hint: bool = False
@@ -92,6 +113,10 @@ class State:
     def is_set(cls, _state) -> bool:
         return cls._program_state == _state
 
+    @classmethod
+    def get(cls) -> States:
+        return cls._program_state
+
     @classmethod
     def set(cls, _state) -> None:
         if _state not in States:
@@ -118,22 +143,23 @@ def signal_exit_program(game, signr, *args) -> None:
     exit_program(game, shutdown=False)
 
 
-def arduido_interrupt(self, gpio_pin: int, level: int, tick: int):
-    """Callback function for interrupt coming from arduino"""
-    incoming = serial_arduino.get_interrupt_reason()
-    if incoming == serial_arduino.ReasonInterrupt.NONE:
-        LOG.warning("Got an arduino interrupt but recieved code NONE")
-    elif incoming == serial_arduino.ReasonInterrupt.BUTTONPRESS:
-        LOG.debug("Arduino interrupt: BUTTONPRESS")
-        button_panel.handler_callbacks()
-    elif incoming == serial_arduino.ReasonInterrupt.SHUTDOWN:
-        LOG.debug("Arduino interrupt: SHUTDOWN")
-        shutdown_interrupt()
-    elif incoming == serial_arduino.ReasonInterrupt.MOVE:
-        LOG.debug("Arduino interrupt: MOVE")
-        button_panel.move_event.set()
-    else:
-        LOG.warning("Arduino interrupt: Got invalid interrupt flag!")
+async def arduino_events() -> None:
+    """Post the interrupts of the arduino as events. Runs on the loop of the serial link"""
+    async for event in SERIAL_LINK.events():
+        if isinstance(event, serial_async.ReedEvent):
+            LOG.debug("Arduino interrupt: MOVE %s", event)
+            EVENTS.post(EventType.REED, event)
+        elif event == serial_arduino.ReasonInterrupt.BUTTONPRESS:
+            LOG.debug("Arduino interrupt: BUTTONPRESS")
+            try:
+                button_panel.handler_callbacks()
+            except ValueError as error:
+                LOG.error(error)
+        elif event == serial_arduino.ReasonInterrupt.SHUTDOWN:
+            LOG.debug("Arduino interrupt: %s", event.name)
+            EVENTS.post(EventType.SHUTDOWN, event)
+        else:
+            LOG.warning("Arduino interrupt: Got invalid interrupt flag!")
 
 
 def exit_program(game: Game, shutdown: bool = True) -> None:
@@ -143,27 +169,31 @@ def exit_program(game: Game, shutdown: bool = True) -> None:
     """
     LOG.info("Exit program")
     button_panel.update_buttons([])  # turn off btn led
+    lights.clear_leds()
+    button_panel.disarm_reeds()
     # Save if necessary
     try:
         game.board.peek()
+        search.cancel()
         if not game.engine.ping():
-            game.engine.close()
-            game.engine.quit()
             save_pgn(game)
     except IndexError:
         LOG.debug("Board.moves_stack is empty")
     except NameError:
         LOG.debug("No active game so no need to save anything")
+    ENGINE_POOL.shutdown()
+    book.close()
+    tablebase.close()
 
     # frame goodbye
     frame = epaper.Frame(name='exit', items=[epaper.FrameImage('images/calvin/sleeping.png')])
     epaper_screen.update_frame(button_panel, frame)
     # Wait for possible screen thread to finish
-    while epaper_screen.busy():
-        sleep(0.05)
+    epaper_screen.wait_until_done()
     epaper_screen.sleep()
     gpio.cleanup()
     LOG.debug('GPIO cleaned')
+    LOG.info(serial_arduino.STATS.summary())
     if shutdown:
         LOG.info('exit_program: shutdown pi')
         run(['sudo', 'poweroff'], check=True)
@@ -184,12 +214,10 @@ def question(line: str) -> bool:
     return button_panel.execute_task(timeout=30)
     
 
-def shutdown_interrupt(*args) -> None:
+def shutdown_interrupt(event: Optional[events.Event] = None) -> None:
     """
-    Arduino send shutdown intterupt for three possible reasons:
-        - User pressed power button
-        - Coulomb counter reached minimum --> warning on epaper and power led
-        - Low voltage --> info on epaper and start shutdown
+    Handler for SHUTDOWN events, the user pressed the power button.
+    The battery reasons (coulomb counter minimum, low voltage) need the coulomb counter on the arduino first.
     """
     epaper_screen.enabled = True
     if question("Shutdown chessboard?"):
@@ -200,6 +228,29 @@ def shutdown_interrupt(*args) -> None:
         back_to_game(main_game) if state.is_set(States.GAME) else epaper_screen.get_menu_item(first=True)
 
 
+def run_button_task(event: events.Event) -> None:
+    """Handler for BUTTON events that arrive while the program waits for something else"""
+    event.data()
+
+
+def ignore_reed(event: events.Event) -> None:
+    """Handler for REED events in the menus, nobody is waiting for them"""
+    LOG.debug('Reed event ignored in state %s', State.get())
+
+
+def timer_expired(event: events.Event) -> None:
+    """Handler for TIMER events"""
+    if event.data == button.AUTOSHUTDOWN_TIMER:
+        LOG.info('Program idle for %s seconds', config.AUTOSHUTDOWN)
+        exit_program(main_game, shutdown=False)
+    elif event.data == clock.CLOCK_TIMER:
+        clock_tick(main_game)
+    elif event.data == engine_pool.PREFETCH_TIMER:
+        ENGINE_POOL.prefetch(main_game.setup.engine)
+    else:
+        LOG.warning('Unknown timer %s', event.data)
+
+
 # ----------
 # -- Game --
 # ----------
@@ -214,33 +265,38 @@ def play_game(game: Game, saved_game: chess.pgn.Game = None) -> None:
     new_game(game) if saved_game is None else load_game(game, saved_game)
 
     LOG.info('start engine')
-    game.engine = chess.engine.SimpleEngine.popen_uci(game.setup.engine.path)
-
-    engine_setup = game.setup.engine.options
-    # todo assemble engine options to an engine.ConfigMapping (+ extra options)
-
-    game.engine.configure(engine_setup)
+    game.engine = ENGINE_POOL.acquire(game.setup.engine)
+    game.engine_options = engine_pool.engine_config(game.setup.engine, game.engine)
+    game.engine_game = object()
     LOG.debug('start loop')
 
-    # Game loop
-    State.set(States.GAME)
-    while state.is_set(States.GAME):
-        if not state.is_set(States.GAME):
-            break
+    try:
+        # Game loop
+        State.set(States.GAME)
+        button_panel.arm_reeds()
+        while state.is_set(States.GAME):
+            if not state.is_set(States.GAME):
+                break
 
-        validate_board(game)
+            validate_board(game)
 
-        if game.board.turn == game.setup.color.value:
-            player_move(game)
-            game.computer_move = chess.engine.PlayResult(move=None, ponder=None)
+            if game.board.turn == game.setup.color.value:
+                player_move(game)
+                game.computer_move = chess.engine.PlayResult(move=None, ponder=None)
 
-        else:
-            computer_move(game)
+            else:
+                computer_move(game)
 
-        update_pgn_notes(game)
-        save_pgn(game, )
+            if game.clock is not None and game.clock.flagged() is not None:
+                State.set(States.END_GAME)
+            update_pgn_notes(game)
+            save_pgn(game, )
 
-    end_game(game)
+        button_panel.disarm_reeds()
+        end_game(game)
+    finally:
+        search.cancel()
+        ENGINE_POOL.release(game.engine)
 
 
 def new_game(game: Game) -> None:
@@ -248,6 +304,7 @@ def new_game(game: Game) -> None:
     LOG.info('new GAME')
     engine = game.setup.engine
     game.board = chess.Board()
+    game.computer_move = chess.engine.PlayResult(move=None, ponder=None)
     game.pgn_headers['Event'] = 'Player vs {0} {1}'.format(engine.name, engine.version)
     game.pgn_headers['Date'] = strftime('%A %d %B %Y - %H:%M', localtime())
     setup_text = ['{0} = {1}{2}'.format(item.name, item.value, item.unit) for _, item in engine.options.items()]
@@ -257,6 +314,9 @@ def new_game(game: Game) -> None:
     game.pgn_headers['Site'] = '-'
     game.pgn_headers['Round'] = '-'
     game.pgn_headers['Result'] = str(game.board.result())
+    control = clock.time_control(engine)
+    game.clock = None if control is None else clock.ChessClock(control)
+    game.pgn_headers['TimeControl'] = '-' if game.clock is None else game.clock.headers()['TimeControl']
     try:
         run(['rm', config.COMPUTER_MOVE])
     except FileNotFoundError:
@@ -273,8 +333,9 @@ def load_game(game: Game, saved_game: chess.pgn.Game) -> None:
     :return:
     """
     LOG.info('load GAME')
+    game.computer_move = chess.engine.PlayResult(move=None, ponder=None)
     try:
-        moves_string = files.open_move(config.COMPUTER_MOVE)
+        moves_string = files.open_move(config.COMPUTER_MOVE).strip()
         move0 = chess.Move.from_uci(moves_string[:4])
         # There is not always a ponder move
         move1 = chess.Move.from_uci(moves_string[4:]) if len(moves_string) > 4 else None
@@ -288,6 +349,10 @@ def load_game(game: Game, saved_game: chess.pgn.Game) -> None:
             game.board.push(move)
         # load pgn
         game.pgn_headers = saved_game.headers
+        control = clock.time_control(game.setup.engine)
+        game.clock = None if control is None else clock.ChessClock(control)
+        if game.clock is not None:
+            game.clock.restore(saved_game.headers)
         update_pgn_notes(game)
         LOG.info('GAME loaded')
     except (TypeError, ValueError):
@@ -304,8 +369,11 @@ def end_game(game: Game) -> None:
     :return:
     """
     LOG.info('GAME finished!')
-    result = game.board.result()
+    EVENTS.cancel_timer(clock.CLOCK_TIMER)
+    result = game.board.result() if game.clock is None else game.clock.result(game.board)
     game.pgn_notes.headers['Result'] = result
+    if game.clock is not None and game.clock.flagged() is not None:
+        game.pgn_notes.headers['Termination'] = 'time forfeit'
     epaper_screen.enabled = True
     epaper_screen.update_frame(button_panel, epaper.end_game(button_panel, result, game.setup, game.board))
     button_panel.execute_task(timeout=60)
@@ -318,6 +386,9 @@ def update_pgn_notes(game: Game) -> None:
     # TODO: add comment tag to nodes. --> openings...
     game.pgn_notes = chess.pgn.Game.from_board(game.board)
     game.pgn_notes.headers = game.pgn_headers.copy()
+    if game.clock is not None:
+        game.pgn_notes.headers.update(game.clock.headers())
+    hints.HINTS.annotate(game.pgn_notes, game.setup.color.value)
     LOG.debug('pgn notes updated')
 
 
@@ -326,12 +397,14 @@ def validate_board(game: Game, message: str = 'Board invalid!') -> None:
     holds the Game in case the fysical board doesn't matches the GAME.board.
     Indicates pieces who are missing and pieces on a wrong square.
     The GAME is released as soon as the psysical board matches with the chess.Board.
+    When the board stays the same, a line of moves that explains it is offered (resync). Confirming plays the moves.
     On release the frame on the screen is refreshed based on chess.Board.turn -> computer or player.
      """
     LOG.debug('validate_board')
     current_board = get_board_square_set(game.board)
     LOG.info('current board:\n%s', game.board.__str__())
     old_incoming_board = current_board.copy()
+    resync_tried: Set[int] = set()
     loop_count = 0
     state.set(States.BOARD_INVALID)
     while state.is_set(States.BOARD_INVALID):
@@ -341,6 +414,8 @@ def validate_board(game: Game, message: str = 'Board invalid!') -> None:
             state.set(States.GAME)
             LOG.debug('pieces are ok')
             game.piece_up = -1
+            reed_glitch_filter.clear(int(current_board))  # the scan is the truth now
+            lights.clear_leds()
             break
         else:
             # Do not update epaper when wait_for_reed_switch_interrupt() was
@@ -359,12 +434,40 @@ def validate_board(game: Game, message: str = 'Board invalid!') -> None:
                     epaper_screen.update_frame(button_panel, frame, important=False)
                     loop_count += 1
 
+            elif int(incoming_board) not in resync_tried:  # board is stable, maybe moves have been made
+                resync_tried.add(int(incoming_board))
+                if offer_resync(game, incoming_board):
+                    current_board = get_board_square_set(game.board)
+                old_incoming_board = current_board.copy()  # redraw the frame
+                continue
+
             LOG.debug(validate_board_debug(current_board, incoming_board))
-            # TODO LED: mark according squares with leds
+            lights.indicate_missing_pieces(current_board - incoming_board, incoming_board - current_board)
             incoming_board.clear()
             button_panel.wait_for_move(timeout=3)
 
 
+def offer_resync(game: Game, incoming_board: chess.SquareSet) -> bool:
+    """
+    Search a line of moves that explains the board and ask the player to confirm it
+    :return: True if the moves have been played
+    """
+    lines = resync.find_lines(game.board, int(incoming_board))
+    if not lines:
+        return False
+
+    line = lines[0]
+    if not question('Did you play {0}?'.format(game.board.variation_san(line))):
+        LOG.info('Resync refused')
+        return False
+
+    for move in line:
+        game.board.push(move)
+    game.computer_move = chess.engine.PlayResult(move=None, ponder=None)
+    LOG.info('Resync: played %s', [move.uci() for move in line])
+    return True
+
+
 def validate_board_debug(current_board: chess.SquareSet, incoming_board: chess.SquareSet) -> None:
     """Print missing and wrong moves. Only used for debugging"""
     missing = [square for square in current_board if square not in incoming_board]
@@ -410,14 +513,54 @@ def push_move(game: Game, move: chess.Move) -> None:
     game.board.push(move)
     game.piece_up = -1
     LOG.info('move pushed')
+    if game.setup.mark_last_move.value:
+        lights.mark_last_move(move.from_square, move.to_square)
+    else:
+        lights.clear_leds()
 
 
 # ---------------------
 # -- Move validation --
 # ---------------------
+def wait_for_square(timeout: float = config.AUTOSHUTDOWN + 30, expected: Optional[Set[int]] = None) -> Optional[int]:
+    """
+    Wait for the next reed change that passes the glitch filter. Short lift/place pairs on the same square are dropped,
+    so they never end up in validate_board.
+    :param timeout: seconds
+    :param expected: only return changes on these squares, changes on other squares are ignored. The board is
+        validated at the start of every turn so nothing gets lost. None --> all squares
+    :return: square nr (0-63) or None on timeout or when the game has been stopped or ended (time is up)
+    """
+    end = monotonic() + timeout
+    while True:
+        square = reed_glitch_filter.pop()
+        if square is not None:
+            if expected is None or square in expected:
+                return square
+            LOG.debug('wait_for_square: ignored unexpected change on %s', chess.square_name(square))
+            continue
+
+        if state.is_set(States.MAIN) or state.is_set(States.END_GAME):
+            return None
+
+        remaining = end - monotonic()
+        settle = reed_glitch_filter.time_to_settle()
+        if settle is None:
+            if remaining <= 0:
+                return None
+            wait = remaining
+        else:  # always wait until pending squares are settled
+            wait = settle if remaining <= 0 else min(settle, remaining)
+
+        event = button_panel.wait_for_move(timeout=wait)
+        if event is not None:
+            reed_glitch_filter.feed(event.data.square, timestamp=event.data.timestamp)
+
+
 def player_move(game: Game) -> None:
     """
-    loop to wait for move from player = eventdetected from reed switch matrix. The loop is finished when a valid move has been made.
+    loop to wait for move from player = events detected from reed switch matrix. The loop is finished when a valid move has been made.
+    Every reed change goes to a MoveRecognizer, all physical orders of the legal moves are accepted.
     """
     State.set(States.PLAYER_TURN)
     LOG.info('player turn')
@@ -425,115 +568,147 @@ def player_move(game: Game) -> None:
     epaper_screen.update_frame(button_panel, epaper.game_engine_info(player_turn=True, engine=game.setup.engine), important=False)
     epaper_screen.update_frame(button_panel, epaper.game_player_turn(button_panel=button_panel, content=epaper.PLAYER_WAIT, partial_frame=True), important=False)
 
-    legal_moves = game.board.legal_moves
-    legal_move_from = {move.from_square for move in game.board.legal_moves}
+    start_clock(game, game.board.turn)
+    search_hints(game)
+    recognizer = move_recognizer.MoveRecognizer(position_index.get(game.board))
+    reed_glitch_filter.take_suppressed()  # glitches of an earlier wait
+    game.piece_up = None
+    invalid = False  # a change didn't fit, the board is scanned as soon as it is quiet
+    scanned = True  # no changes since the last scan
     while State.is_set(States.PLAYER_TURN):
-        if game.piece_up is None:
-            legal_squares = legal_move_from
-        else:
-            legal_squares = {move.to_square for move in legal_moves if move.from_square == game.piece_up}
-
         LOG.debug('waiting for move...')
-        button_panel.wait_for_move()
+        # Wait shortly when a complete move can still continue (eg. rook first castling) or changes may be lost
+        status = recognizer.status
+        quick = invalid or (status == move_recognizer.Status.COMPLETE and recognizer.expected()) or \
+            (status == move_recognizer.Status.PARTIAL and not scanned)
+        if not quick:
+            incoming = wait_for_square()
+        elif status == move_recognizer.Status.COMPLETE and recognizer.moves[0].promotion is not None:
+            incoming = wait_for_square(timeout=config.TIME_CONFIRM_MOVE)  # time to swap the pawn with the new piece
+        else:
+            incoming = wait_for_square(timeout=config.TIME_CONTINUE_MOVE)
+        recognizer.note(reed_glitch_filter.take_suppressed())  # glitches came before the change
         if state.is_set(States.MAIN):
             return
+        if incoming is None and not quick:
+            continue
 
-        incoming = serial_arduino.new_detected_move()
         if game.hint:
             erase_hint = epaper.PartialFrame(name='erase_hint', width=200, height=40, pos=(200, 165), important=False)
             epaper_screen.update_frame(button_panel, erase_hint)
             game.hint = False
 
-        new_move = validate_player_move(game, incoming, legal_squares)
-        if isinstance(new_move, chess.Move):
-            break
+        new_move = None
+        if incoming is not None:
+            scanned = False
+            if recognizer.feed(incoming) == move_recognizer.Status.INVALID:
+                invalid = True
+            elif not invalid:
+                show_player_progress(game, recognizer)
+                if recognizer.status == move_recognizer.Status.COMPLETE and not recognizer.expected():
+                    new_move = move_recognizer.preferred(recognizer.moves)
+
+        elif status == move_recognizer.Status.COMPLETE and not invalid:
+            new_move = move_recognizer.preferred(recognizer.moves)
+
+        else:  # quiet after changes that got lost or came in an unexpected order: the board scan decides
+            scanned = True
+            new_move = detect_by_occupancy(game, recognizer)
+            if new_move is not None:
+                epaper_screen.update_frame(button_panel, epaper.game_player_turn(button_panel=button_panel, content=epaper.get_move_text(new_move, game.board), partial_frame=True))
+            elif not recognizer.history:  # board back at the start position
+                invalid = False
+                show_player_progress(game, recognizer)
+            elif invalid:
+                LOG.info('invalid move!')
+                invalid_move(game)
+                recognizer.reset()
+                invalid = False
+
+        if new_move is None:
+            continue
 
+        LOG.info('new move: %s', new_move.uci())
         if game.setup.wait_to_confirm:
             epaper_screen.update_frame(button_panel, epaper.PLAYER_CONFIRM)
-            while not confirm_move(game):
-                pass
-
-        new_move = chess.Move(game.piece_up, incoming)
+            if game.clock is not None:
+                game.clock.pause()  # confirming is free
+            speculate(game, new_move)
+            if not confirm_move(game, new_move):
+                search.cancel()
+                start_clock(game, game.board.turn)
+                recognizer.reset()
+                invalid = False
+                continue
+
+        if game.computer_move.ponder is not None:
+            governor.PONDER.record(new_move == game.computer_move.ponder)
+        press_clock(game)
         push_move(game, new_move)
         State.set(States.GAME)
 
 
-def validate_player_move(game: Game, move: int, legal_moves: Set[chess.Move]) -> chess.Move:
+def detect_by_occupancy(game: Game, recognizer: move_recognizer.MoveRecognizer) -> Optional[chess.Move]:
     """
-    validations:    - can the piece make any move (black and white)?
-                    - did the piece made a valid move?
-                    - is the move a capture?
-                    - detects special moves: castling, promotion, en passant
-                    - did the player put a piece back on it"s original square (Which is against some chess rule...)?
-    if any kind of move appears to be invalid the program will get stuck in a loop from the "indicate_missing_pieces"
-    function until all pieces are putted back to the original position (at the beginning of the turn)
-    :returns the valid chess.Move or None in case of a wrong move
+    Scan the board and look the occupancy up in the index of the position. Finds moves when reed changes got lost
+    or came in an order the recognizer doesn't know. Resets the recognizer when the board is back at the start.
+    :return: chess.Move or None
     """
-    result = None
-    LOG.debug('validate new player move')
-
-    legal_squares_up = set(move.from_square for move in legal_moves)
-    legal_squares_down = set(move.to_square for move in legal_moves)
-
-    # INVALID MOVE
-    if move not in legal_squares_up.union(legal_squares_down):
-        LOG.info('invalid move!')
-        invalid_move(game)
-
-    # VALID MOVE
-    elif move in legal_squares_up:
-        # 1: Put piece back
-        # 2: Piece up
-        # put piece back on same square (not always valid by the chess rules :-)
-        if move == game.piece_up:
-            LOG.info('piece putted back')
-            game.piece_up = None
-            epaper_screen.update_frame(button_panel, epaper.game_player_turn(button_panel=button_panel, content=epaper.PLAYER_WAIT, partial_frame=True), important=False)
-        # Piece up
-        else:
-            game.piece_up = move
-            LOG.info('piece up: %s square_nr:%s', chess.square_name(move), move)
-            epaper_screen.update_frame(button_panel, epaper.game_player_turn(button_panel=button_panel, content=epaper.get_half_move_text(move, game.board), partial_frame=True))
-
-    else:
-        new_move = chess.Move(game.piece_up, move)
-        LOG.info('new move: %s', new_move.uci())
-
-        # 1: En passant?
-        # 2: Castling?
-        # 3: Promotion?
-        # 4: normal move
-
-        # en passant, capture or castling
-        if validate_en_passant(game, new_move) or validate_caputure(game, new_move) or validate_castling(game, new_move):
-            text = epaper.get_move_text(new_move, game.board)
-
-        # promotion
-        elif game.board.piece_type_at(game.piece_up) == chess.PAWN and chess.square_rank(move) in [0, 7] and validate_promotion(new_move):
-            text = epaper.get_move_text(new_move, game.board)
-            LOG.info('promotion succesfull!')
-
-        # normal move
-        else:
-            LOG.info('move is valid')
-            text = epaper.get_move_text(new_move, game.board)
-
+    index = position_index.get(game.board)
+    observed = int(chess.SquareSet(squares=serial_arduino.ask_board()))
+    if observed == index.occupied:
+        LOG.debug('board is back at the start position')
+        recognizer.reset()
+        return None
+
+    move = move_recognizer.resolve(index.moves_with_occupancy(observed), recognizer.history)
+    if move is not None:
+        LOG.info('move found by occupancy: %s', move.uci())
+    return move
+
+
+def show_player_progress(game: Game, recognizer: move_recognizer.MoveRecognizer) -> None:
+    """Show the piece that has been picked up or the move on the screen"""
+    if recognizer.status == move_recognizer.Status.COMPLETE:
+        move = move_recognizer.preferred(recognizer.moves)
+        LOG.info('move is valid: %s', move.uci())
+        text = epaper.get_move_text(move, game.board)
         epaper_screen.update_frame(button_panel, epaper.game_player_turn(button_panel=button_panel, content=text, partial_frame=True))
-        result = new_move
 
-    return result
+    elif recognizer.status == move_recognizer.Status.WAITING:
+        LOG.info('piece putted back')
+        game.piece_up = None
+        epaper_screen.update_frame(button_panel, epaper.game_player_turn(button_panel=button_panel, content=epaper.PLAYER_WAIT, partial_frame=True), important=False)
+
+    elif len(recognizer.events) == 1 and position_index.get(game.board).can_move(recognizer.events[0]):
+        game.piece_up = recognizer.events[0]
+        LOG.info('piece up: %s square_nr:%s', chess.square_name(game.piece_up), game.piece_up)
+        epaper_screen.update_frame(button_panel, epaper.game_player_turn(button_panel=button_panel, content=epaper.get_half_move_text(game.piece_up, game.board), partial_frame=True))
 
 
-def confirm_move(game: Game) -> bool:
+def confirm_move(game: Game, move: Optional[chess.Move] = None) -> bool:
     """
     a move is confirmed by leaving the moved piece on the board a few seconds (as set in the config file)
     Confirmation is positive --> move gets pushed to board
     Confirmation is negative --> call indicate_missing_pieces
+    :param move: chess.Move waiting for confirmation. Only changes on its squares undo the confirmation. Swapping a
+        promoted pawn with the new piece (2 changes on the to square) doesn't
     """
-    if button_panel.wait_for_move(timeout=config.TIME_CONFIRM_MOVE):
-        LOG.info('not confirmed')
-        validate_board(game)
-        return False
+    expected = None if move is None else {move.from_square, move.to_square}
+    swapping = False  # the promoted pawn is lifted, the new piece isn't placed yet
+    while True:
+        square = wait_for_square(timeout=config.TIME_CONFIRM_MOVE, expected=expected)
+        if state.is_set(States.MAIN):
+            return False
+        if square is None and not swapping:
+            break
+        if move is not None and move.promotion is not None and square == move.to_square:
+            swapping = not swapping
+            LOG.debug('promotion: %s', 'pawn lifted' if swapping else 'new piece placed')
+        elif square is not None:
+            LOG.info('not confirmed')
+            validate_board(game)
+            return False
 
     LOG.info('move is confirmed')
     return True
@@ -558,18 +733,20 @@ def computer_move(game: Game) -> None:
     button_panel.toggle_alarm()
     epaper_screen.update_frame(button_panel, epaper.game_computer_turn(button_panel=button_panel))
     epaper_screen.update_frame(button_panel, (epaper.game_engine_info(player_turn=False, engine=game.setup.engine)))
-    epaper_screen.update_frame(button_panel, epaper.game_computer_turn(button_panel=button_panel, move_text=epaper.game_computer_thinking(game.setup), partial_frame=True), important=False)
+    epaper_screen.update_frame(button_panel, epaper.game_computer_turn(button_panel=button_panel, move_text=epaper.game_computer_thinking(game.setup), partial_frame=True, thinking=True), important=False)
 
     button_panel.toggle_alarm(active=False)
 
     # get a new move or load from savegame
     if state.is_set(States.MAIN):
         return
+    start_clock(game, game.board.turn)
     if game.computer_move.move is not None:
         new_move = game.computer_move.move
     else:
         calculate_move(game)
         new_move = game.computer_move.move
+    press_clock(game)  # executing the move on the board is free
 
     # Show the computer move
     LOG.info('new move: %s', new_move)
@@ -577,226 +754,261 @@ def computer_move(game: Game) -> None:
     while state.is_set(States.COMPUTER_TURN):
         epaper_screen.update_frame(button_panel, epaper.COMPUTER_CONFIRM)
         epaper_screen.update_frame(button_panel, epaper.game_computer_turn(button_panel=button_panel, move_text=epaper.get_move_text(new_move, game.board), partial_frame=True))
-        # Led --> mark from and to_square
-        button_panel.wait_for_move()
+        lights.animate_move(new_move.from_square, new_move.to_square)
+        result = validate_computer_move(game, new_move)
         if state.is_set(States.MAIN):
             break
 
-        if validate_computer_move(game, new_move) is True:
+        if result is True:
             push_move(game, new_move)
             State.set(States.GAME)
-        elif new_move == 100:
-            LOG.debug('computer_move: dummy new_move')
         else:
             validate_board(game, message='Wrong move!')
             epaper_screen.update_frame(button_panel, epaper.game_computer_turn(button_panel=button_panel))
             epaper_screen.update_frame(button_panel, epaper.game_engine_info(player_turn=False, engine=game.setup.engine))
 
 
-def calculate_move(game: Game) -> None:
-    """Update GAME.computer move with new calculation. Save the move to file as well"""
-    LOG.info('thinking...')
-    movetime = game.setup.engine.options['movetime'].value
-    game.computer_move = game.engine.play(game.board, chess.engine.Limit(time=movetime), ponder=game.setup.engine.ponder)
-    files.save_move(config.COMPUTER_MOVE, "".format(game.computer_move.move, game.computer_move.ponder))
+def start_clock(game: Game, color: chess.Color) -> None:
+    """Run the clock of 'color', the clock frame is refreshed by CLOCK_TIMER"""
+    if game.clock is not None:
+        game.clock.start(color)
+        show_clock(game, force=True)
 
 
-def validate_computer_move(game: Game, new_move: chess.Move) -> bool:
-    """
-    Shows the computer move on the screen
-    validate if the computer piece is moved as instructed
-    :returns True/False"""
-    incoming_move = serial_arduino.new_detected_move()
-    # TODO: finish promotion
-    # 1: Capture
-    # 2: Castling
-    # 3: En passant?
-    # 4: Piece up?
-    # 5: Piece back
-    # 6: Move Done
-    # 7: Invalid
-    # 8: promotion
-    if incoming_move == new_move.from_square:
-        if game.board.is_en_passant(new_move):
-            LOG.debug('en passant')
-            result = validate_en_passant(game, new_move, player=False)
-        elif game.board.is_capture(new_move):
-            LOG.debug('capture')
-            result = validate_caputure(game, new_move, player=False)
-        elif game.board.is_castling(new_move):
-            LOG.debug('castling')
-            result = validate_castling(game, new_move, player=False)
-        elif chess.square_rank(new_move.to_square) in [0, 7] and game.board.piece_type_at(new_move.from_square) is chess.PAWN:
-            LOG.debug('promotion')
-            result = validate_promotion(new_move)
-        else:
-            LOG.debug('normal move')
-            result = validate_normal_computer_move(new_move)
-    else:
-        result = False  # invalid move
+def press_clock(game: Game) -> None:
+    """End the move on the clock, the clocks stop until the next turn starts"""
+    if game.clock is not None:
+        game.clock.press()
+        EVENTS.cancel_timer(clock.CLOCK_TIMER)
+        LOG.info('%s', game.clock)
 
-    return result
+
+def show_clock(game: Game, force: bool = False) -> None:
+    """
+    Partial frame with the clocks, only when the text changed and the game frame is on the screen. Sets CLOCK_TIMER
+    for the next frame while a clock runs
+    :param force: True --> draw the frame also without changes, eg. after a full frame
+    """
+    if game.clock is None:
+        return
+    if game.clock.running is not None:
+        EVENTS.set_timer(clock.CLOCK_TIMER, game.clock.interval())
+    text = game.clock.text()
+    if (force or text != game.clock.shown) and button_panel.reeds_armed and epaper_screen.enabled:
+        game.clock.shown = text
+        epaper_screen.update_frame(button_panel, epaper.game_clock(text), important=False)
 
 
-def validate_normal_computer_move(move: chess.Move) -> bool:
+def clock_tick(game: Game) -> None:
+    """Refresh the clock frame. When the time of a side is up, the game ends at once: a search is stopped"""
+    if game.clock is None or game.clock.running is None:
+        return
+    show_clock(game)
+    flagged = game.clock.flagged()
+    if flagged is not None:
+        LOG.info('time is up for %s', chess.COLOR_NAMES[flagged])
+        game.clock.pause()
+        EVENTS.cancel_timer(clock.CLOCK_TIMER)
+        search.stop()
+        State.set(States.END_GAME)
+        EVENTS.wakeup()
+
+
+def engine_limit(game: Game) -> chess.engine.Limit:
     """
-    Player picked up the right piece. Now place it on thye right square...
-    :param move: chess.Move: move given by the chess engine
-    :return:
+    :return: both clocks in games with a clock, the engine divides its time. Otherwise the movetime of the user,
+    shortened by the governor when the pi is hot or throttled
     """
-    button_panel.wait_for_move()
-    if state.is_set(States.MAIN):
-        return False
+    if game.clock is not None:
+        return game.clock.limit()
+    return chess.engine.Limit(time=engine_movetime(game))
 
-    incoming = serial_arduino.new_detected_move()
-    if incoming == move.to_square:
-        return True
 
-    return False
+def engine_movetime(game: Game) -> float:
+    """:return: seconds for the computer move in games without a clock"""
+    return governor.RESOURCES.movetime(game.setup.engine.options['movetime'].value)
+
 
+def expected_movetime(game: Game) -> float:
+    """:return: seconds the engine is expected to use for its next move"""
+    if game.clock is not None:
+        return game.clock.movetime(not game.setup.color.value)
+    return engine_movetime(game)
 
-def validate_caputure(game: Game, new_move: chess.Move, player: bool = True) -> bool:
+
+def cache_time(game: Game) -> Union[float, str]:
+    """:return: the search time in the context of the engine cache: the movetime or the time control"""
+    if game.clock is not None:
+        return str(game.clock.control)
+    return engine_movetime(game)
+
+
+def speculate(game: Game, move: chess.Move) -> None:
     """
-    validate a new_move detected as a "capture"
-    :returns True/False
+    Start the search for the computer move on the position after a move that still has to be confirmed
+    A ponder search on the same position (the expected move) keeps running
     """
-    if game.board.is_capture(new_move):
-        LOG.debug('capture!')
-        step = 1 if player else 0
-        while True:
-            button_panel.wait_for_move()
-            if state.is_set(States.MAIN):
-                result = False
-                break
-            incoming_move = serial_arduino.new_detected_move()
-            if incoming_move == new_move.to_square and step == 0:
-                step += 1
-                LOG.debug('removed captured piece')
-            elif incoming_move == new_move.to_square and step == 1:
-                LOG.debug('capture done!')
-                result = True
-                break
-            else:
-                LOG.debug('wrong piece or square')
-                LOG.debug('try the move again!')
-                result = False
-                break
-    else:
-        result = False
-
-    return result
+    board = game.board.copy()
+    board.push(move)
+    if not board.is_game_over() and search.get(board) is None and instant_move(game, board) is None:
+        search.start(game.engine, board, engine_limit(game), early_stop=game.setup.engine.early_stop, game=game.engine_game)
 
 
-def get_castling_type(game: Game, move: chess.Move) -> chess.Move:
+def search_hints(game: Game) -> None:
     """
-    returns the correct tower move from a castling move
-    :param game: Game
-    :param move: chess.Move
-    :return:
+    Start the multi-pv search for hints on the position of the player, within the ponder budget. Pondering starts
+    when it is done (hint_search_done), or at once when the hints of the position are known or there is no budget
     """
-    if game.board.turn is chess.WHITE:
-        tower_move = chess.Move(7, 5) if game.board.is_kingside_castling(move) else chess.Move(0, 3)
+    budget = governor.PONDER.budget(config.HINT_TIME)
+    if budget > 0 and not hints.HINTS.get(game.board) and not game.board.is_game_over():
+        LOG.info('searching hints for %s sec', budget)
+        search.start(game.engine, game.board, chess.engine.Limit(time=budget), ponder=True, multipv=config.HINT_LINES,
+                     game=game.engine_game)
     else:
-        tower_move = chess.Move(63, 61) if game.board.is_kingside_castling(move) else chess.Move(56, 59)
-    LOG.info('castling move: %s', tower_move.uci())
-    return tower_move
+        ponder(game)
+
+
+def hint_search_done(event: events.Event) -> None:
+    """Handler for ENGINE_RESULT events on the turn of the player: keep the hints and start pondering"""
+    finished: search.Search = event.data
+    if not finished.multipv or isinstance(finished.result, Exception) or search.get(main_game.board) is not finished:
+        return
+    hints.HINTS.put(finished.board, finished.lines)
+    ponder(main_game)
 
 
-def validate_castling(game: Game, new_move: chess.Move, player: bool = True):
+def ponder(game: Game) -> None:
+    """Search the position after the expected reply of the player while the player thinks"""
+    expected = game.computer_move.ponder
+    if not game.setup.engine.ponder or expected is None or expected not in game.board.legal_moves:
+        return
+
+    budget = governor.PONDER.budget(expected_movetime(game))
+    if budget > 0:
+        board = game.board.copy()
+        board.push(expected)
+        LOG.info('pondering on %s for %s sec', expected.uci(), budget)
+        search.start(game.engine, board, chess.engine.Limit(time=budget), ponder=True, game=game.engine_game)
+
+
+def instant_move(game: Game, board: chess.Board) -> Optional[chess.engine.PlayResult]:
     """
-     validate a new_move detected as"castling
-    :param game: Game
-    :param new_move: int, square nr of king's move TO square.
-    :param player: Set this True if the move is made by the player
-    :return: True if move is correct castling else False
+    :return: a move without engine search (opening book, endgame tablebase, engine cache), None --> the engine has to
+    search
     """
-    if game.board.is_castling(new_move):
-        LOG.info('castling!')
-        tower_move = get_castling_type(game, new_move)
-        step = 1 if player else 0
-        while True:
-            button_panel.wait_for_move()
-            if state.is_set(States.MAIN):
-                result = False
-                break
+    move = book.book_move(game.setup.engine, board)
+    if move is not None:
+        LOG.info('book move: %s', move.uci())
+        return chess.engine.PlayResult(move, None)
 
-            incoming_move = serial_arduino.new_detected_move()
-            if step == 0 and incoming_move == new_move.to_square:
-                step += 1
-                LOG.info('king ok')
-            elif step == 1 and incoming_move == tower_move.from_square:
-                step += 1
-                LOG.info('tower up')
-            elif step == 2 and incoming_move == tower_move.to_square:
-                LOG.info('castling done!')
-                result = True
-                break
-            else:
-                result = False
-                break
-    else:
-        result = False
+    move = tablebase.best_move(board)
+    if move is not None:
+        LOG.info('tablebase move: %s', move.uci())
+        return chess.engine.PlayResult(move, None)
 
-    return result
+    cached = ENGINE_CACHE.get(board, game.setup.engine, cache_time(game))
+    if cached is not None:
+        LOG.info('cached move: %s', cached.move.uci())
+        return chess.engine.PlayResult(cached.move, cached.ponder)
+    return None
 
 
-def validate_promotion(new_move: chess.Move, player: bool = True) -> bool:
-    """validate a new_move detected as a "promotion"""
-    LOG.debug('promotion: ')
-    step = 1 if player else 0
-    while True:
-        button_panel.wait_for_move()
-        if state.is_set(States.MAIN):
-            result = False
-            break
+def calculate_move(game: Game) -> None:
+    """
+    Update GAME.computer move with new calculation. Save the move to file as well
+    Moves from the opening book don't need the engine.
+    """
+    result = instant_move(game, game.board)
+    if result is not None:
+        search.cancel()
+        game.computer_move = result
+    else:
+        game.computer_move = think(game)
+    move, ponder = game.computer_move.move, game.computer_move.ponder
+    if move is not None:  # saved as uci move + optional uci ponder move, see load_game
+        files.save_move(config.COMPUTER_MOVE, '{0}{1}'.format(move.uci(), '' if ponder is None else ponder.uci()))
 
-        incoming_move = serial_arduino.new_detected_move()
-        if incoming_move == new_move.to_square and step == 0:
-            step += 1
-            LOG.debug('piece down')
-        if incoming_move == new_move.to_square and step == 1:
-            step += 1
-            LOG.debug('replace pawn with queen')
-
-        elif incoming_move == new_move.to_square and step == 2:
-            LOG.debug('replaced with new queen')
-            result = True
-            break
-        else:
-            result = False
-            break
 
+def think(game: Game) -> chess.engine.PlayResult:
+    """
+    Engine search for the computer move
+    A search started while the player confirmed the move is continued. After a ponder hit the move is instant or,
+    when the ponder budget was smaller than the movetime, the engine searches the rest of the time with a warm hash.
+    With a clock the ponder search is stopped at once and the engine searches again on its clock, with a warm hash
+    """
+    LOG.info('thinking...')
+    limit = engine_limit(game)
+    movetime = cache_time(game)
+    current = search.take(game.board)
+    if current is not None and current.ponder:
+        if limit.time is None:
+            current.stop()
+            current.wait()
+            LOG.info('ponder hit, searching on the clock')
+            current = None
+        elif current.limit.time is not None and current.limit.time < limit.time:
+            current.wait()
+            limit = chess.engine.Limit(time=limit.time - current.limit.time)
+            LOG.info('ponder hit, %s sec left', limit.time)
+            current = None
+        else:
+            LOG.info('ponder hit')
+
+    if current is None:
+        govern_engine(game)
+        current = search.start(game.engine, game.board, limit, early_stop=game.setup.engine.early_stop, game=game.engine_game)
+    result = current.wait(on_info=lambda running: show_engine_progress(game, running))
+    if result.move is not None and not current.stopped:
+        score = current.info.get('score')
+        centipawns = None if score is None else score.relative.score(mate_score=engine_cache.MATE_SCORE)
+        ENGINE_CACHE.put(game.board, game.setup.engine, movetime, result.move, result.ponder, centipawns)
     return result
 
 
-def validate_en_passant(game: Game, new_move: chess.Move, player: bool = True) -> bool:
-    """validate a new_move detected as a "en passant"""
-    if game.board.is_en_passant(new_move):
-        LOG.info('en passant!')
-        step = 2 if player else 0
-        captured_piece = new_move.to_square - 8 if game.board.turn is chess.WHITE else new_move.to_square + 8
-        while True:
-            button_panel.wait_for_move()
-            if state.is_set(States.MAIN):
-                result = False
-                break
+def govern_engine(game: Game) -> None:
+    """
+    Threads and Hash for the resource level of the governor. Only changed options are sent: a new Hash clears the
+    hash table of the engine. Call without a running search
+    """
+    options = governor.RESOURCES.engine_options(engine_pool.engine_config(game.setup.engine, game.engine))
+    sent = game.engine_options or {}
+    changed = {name: value for name, value in options.items() if sent.get(name) != value}
+    if changed:
+        game.engine.configure(changed)
+        game.engine_options = options
 
-            incoming_move = serial_arduino.new_detected_move()
-            if incoming_move is new_move.from_square and step == 0:
-                step += 1
-                LOG.debug('piece up')
-            elif incoming_move is new_move.to_square and step == 1:
-                step += 1
-                LOG.info('piece down')
-            elif incoming_move is captured_piece and step == 2:
-                LOG.debug('removed captured pawn')
-                result = True
-                break
 
-    else:
-        result = False
+def show_engine_progress(game: Game, running: search.Search) -> None:
+    """Partial frame with depth, best move and score of the running search. ENGINE_INFO is already throttled"""
+    text = epaper.game_computer_progress(game.setup, running.info, game.board)
+    epaper_screen.update_frame(button_panel, epaper.game_computer_turn(button_panel=button_panel, move_text=text, partial_frame=True, thinking=True), important=False)
 
-    return result
+
+def validate_computer_move(game: Game, new_move: chess.Move, board: Optional[chess.Board] = None, undo: bool = False) -> bool:
+    """
+    validate if the computer piece is moved as instructed. Captures, castling and en passant are accepted in every
+    physical order. A promotion is done when the pawn has been replaced with the new piece
+    :param new_move: chess.Move
+    :param board: chess.Board before new_move, None --> game.board
+    :param undo: True --> validate taking new_move back
+    :returns True/False"""
+    index = position_index.get(game.board if board is None else board)
+    recognizer = move_recognizer.MoveRecognizer(index, moves=[new_move], undo=undo)
+    while True:
+        incoming = wait_for_square()
+        if state.is_set(States.MAIN) or incoming is None:
+            return False
+
+        status = recognizer.feed(incoming)
+        if status == move_recognizer.Status.INVALID:
+            LOG.debug('wrong piece or square')
+            return False
+        if status == move_recognizer.Status.COMPLETE and new_move.promotion is not None and recognizer.expected():
+            LOG.debug('promotion: replace the pawn with the new piece')
+            lights.promotion(new_move.to_square)
+        elif status == move_recognizer.Status.COMPLETE:
+            LOG.debug('move done: %s', new_move.uci())
+            return True
 
 
 # ###############################
@@ -846,12 +1058,14 @@ def stop_game(game: Game) -> None:
     button_panel.execute_task(timeout=30)
     if game.confirm is True:
         game.confirm = False
-        if not game.engine.ping():
-            game.engine.close()
-            game.engine.quit()
+        search.cancel()
+        if game.clock is not None:
+            game.clock.pause()
+        EVENTS.cancel_timer(clock.CLOCK_TIMER)
 
+        button_panel.disarm_reeds()
         state.set(States.MAIN)
-        serial_arduino.trigger_arduino_int()
+        EVENTS.wakeup()
 
     else:
         epaper_screen.enabled = True
@@ -883,25 +1097,26 @@ def undo(game: Game) -> None:
     # copy the move stack fir when the redo function is called
     game.move_stack_copy.append(move1)
     game.move_stack_copy.append(move2)
+    # position before the computer move
+    board1 = game.board.copy(stack=False)
+    board1.push(move2)
 
     # reverse moves
-    move1 = chess.Move(move1.to_square, move1.from_square)
-    move2 = chess.Move(move2.to_square, move2.from_square)
+    reversed1 = chess.Move(move1.to_square, move1.from_square)
+    reversed2 = chess.Move(move2.to_square, move2.from_square)
 
     text0 = epaper.FrameText(pos=(214, 15), content='Undo move:', fill=config.WHITE)
-    text1 = epaper.FrameText(pos=(30, 40), content=''.join([str(move2), str(move1)]), font=config.FONT_BIG)
+    text1 = epaper.FrameText(pos=(30, 40), content=''.join([str(reversed2), str(reversed1)]), font=config.FONT_BIG)
     epaper_screen.update_frame(button_panel, epaper.game_player_turn(button_panel=button_panel, content=(text0, text1), partial_frame=True), important=False)
     # Interrupt active on buttons  'undo' 'redo'
     # Undo 1 computer move
     while True:
-        button_panel.wait_for_move()
-        if validate_computer_move(game, move1):
+        if validate_computer_move(game, move1, board=board1, undo=True):
             break
 
     # Undo 1 player move
     while True:
-        button_panel.wait_for_move()
-        if validate_computer_move(game, move2):
+        if validate_computer_move(game, move2, undo=True):
             break
 
     epaper_screen.update_frame(button_panel, epaper.game_player_turn(button_panel=button_panel))
@@ -932,24 +1147,24 @@ def redo(game: Game) -> None:
     epaper_screen.update_frame(button_panel, epaper.game_player_turn(button_panel=button_panel, content=text, partial_frame=True))
 
     while True:
-        button_panel.wait_for_move()
         if validate_computer_move(game, move1):
             game.board.push(move1)
             break
 
     while True:
-        button_panel.wait_for_move()
         if validate_computer_move(game, move2):
             game.board.push(move2)
             break
 
 
 def give_hint(game: Game) -> None:
-    """Write ponder move on the frame --> frame_player_turn"""
+    """Write ponder move (or the tablebase move in endgames) on the frame --> frame_player_turn"""
     LOG.debug('BUTTON_EVENT give hint')
     epaper_screen.update_frame(button_panel, epaper.PLAYER_HINT)
-    if game.computer_move.ponder is not None:
-        text = epaper.get_move_text(game.computer_move.ponder, game.board)
+    best = hints.HINTS.best(game.board)
+    hint = tablebase.best_move(game.board) or (best and best.move) or game.computer_move.ponder
+    if hint is not None:
+        text = epaper.get_move_text(hint, game.board)
     else:
         text = epaper.FrameText(content='No hint available', pos=(75, 25), fill=config.WHITE, font=config.FONT_BIGGER, align=config.CENTER)
 
@@ -959,7 +1174,8 @@ def give_hint(game: Game) -> None:
 
 def show_board(game: Game) -> None:
     """Show complete board on epaper"""
-    epaper_screen.update_frame(button_panel, epaper.game_show_board(button_panel, game.board))
+    button_panel.disarm_reeds()
+    epaper_screen.update_frame(button_panel, epaper.game_show_board(button_panel, game.board, hints.HINTS.best(game.board)))
     button_panel.execute_task(timeout=60)
 
 
@@ -1021,14 +1237,9 @@ def save_pgn(game: Game, backup=False) -> None:
 
 
 def engine_stop(game: Game) -> None:
-    """make engine stop calculating"""
+    """make engine stop calculating, computer_move plays the best move so far"""
     LOG.debug('BUTTON_EVENT engine stop')
-    if not game.engine.ping():
-        game.engine.close()  # TODO check in real-time if this could be use as the equivalent of the UCI 'stop' command and the bestmove is present
-        part_frame = epaper.game_computer_turn(button_panel=button_panel, move_text=epaper.get_move_text(game.computer_move.move, game.board),
-                                               partial_frame=True)
-        epaper_screen.update_frame(button_panel, part_frame)
-    else:
+    if not search.stop():
         LOG.debug('engine has already stopped')
 
 
@@ -1040,29 +1251,32 @@ def back_to_game(game: Game) -> None:
     - Computer turn
     """
     LOG.debug('BUTTON_EVENT back to GAME')
+    button_panel.arm_reeds()
     if state.is_set(States.BOARD_INVALID):  # redraw the 'validate board' frame
         current_board = get_board_square_set(game.board)
         incoming_board = chess.SquareSet(squares=serial_arduino.ask_board())
         frame = epaper.game_validate_board(button_panel, "board invalid", current_board, incoming_board, game.board)
         epaper_screen.update_frame(button_panel, frame, important=True)
-        serial_arduino.trigger_arduino_int()  # wait again for a reed interrupt
+        EVENTS.wakeup()  # scan the board again
 
     elif state.is_set(States.PLAYER_TURN):
         engine_info = epaper.game_engine_info(player_turn=True, engine=game.setup.engine)
         epaper_screen.update_frame(button_panel, epaper.game_player_turn(button_panel))
         epaper_screen.update_frame(button_panel, engine_info, important=False)
+        show_clock(game, force=True)
 
     elif state.is_set(States.COMPUTER_TURN):
         engine_info = epaper.game_engine_info(player_turn=False, engine=game.setup.engine)
         epaper_screen.update_frame(button_panel, epaper.game_computer_turn(button_panel=button_panel))
         epaper_screen.update_frame(button_panel, engine_info, important=False)
+        show_clock(game, force=True)
         if game.computer_move.move:
             new_move = game.computer_move.move
             epaper_screen.update_frame(button_panel, epaper.COMPUTER_CONFIRM)
             epaper_screen.update_frame(button_panel, epaper.game_computer_turn(button_panel=button_panel, move_text=epaper.get_move_text(new_move, game.board), partial_frame=True))
 
         else:
-            epaper_screen.update_frame(button_panel, epaper.game_computer_turn(button_panel=button_panel, move_text=epaper.game_computer_thinking(game.setup), partial_frame=True), important=False)
+            epaper_screen.update_frame(button_panel, epaper.game_computer_turn(button_panel=button_panel, move_text=epaper.game_computer_thinking(game.setup), partial_frame=True, thinking=True), important=False)
             # Waiting for player to make computer move
             button_panel.toggle_alarm(active=False)
 
@@ -1087,12 +1301,9 @@ def show_next_menu_item(game: Game, first=False) -> None:
 def show_next_engine(game: Game) -> None:
     """Show next engine on epaper"""
     LOG.debug('BUTTON_EVENT Next engine')
-    selected_engine = iter(config.ENGINES)
-    try:
-        game.engine = next(selected_engine)
-    except StopIteration:
-        selected_engine = iter(config.ENGINES)
-        game.engine = next(selected_engine)
+    engines = config.ENGINES
+    game.setup.engine = engines[(engines.index(game.setup.engine) + 1) % len(engines)]
+    EVENTS.set_timer(engine_pool.PREFETCH_TIMER, config.ENGINE_PREFETCH_DELAY)
 
     epaper_screen.update_engine_options(game.setup.engine)
     epaper_screen.update_frame(button_panel, epaper.engine_logo(game.setup), important=False)
@@ -1174,6 +1385,7 @@ def restore_defaults(game: Game) -> None:
 def led_options(game: Game) -> None:
     """"Menu to change led options during a GAME"""
     LOG.debug('BUTTON_EVENT ingame led options')
+    button_panel.disarm_reeds()
     epaper_screen.update_frame(button_panel, epaper.game_led_options(button_panel, game.setup, partial_frame=False))
     epaper_screen.update_frame(button_panel, epaper.game_led_options(button_panel, game.setup, partial_frame=True))
 
@@ -1184,10 +1396,17 @@ gpio.init()
 
 signal.signal(signal.SIGINT, signal_exit_program)
 signal.signal(signal.SIGTERM, signal_exit_program)
-signal.signal(signal.SIGALRM, signal_exit_program)
 
 button_panel = button.Panel(callbacks=get_dict_callbacks())
-gpio.set_callback(config.ARDUINO_INT_PIN, arduido_interrupt)
+SERIAL_LINK = serial_async.SerialLink()
+reed_glitch_filter = reed_filter.ReedFilter()
+
+EVENTS.bind_state(State.get)
+EVENTS.register(EventType.BUTTON, run_button_task, states=[item for item in States if item != States.BOOT])
+EVENTS.register(EventType.SHUTDOWN, shutdown_interrupt)
+EVENTS.register(EventType.REED, ignore_reed, states=[States.MAIN])
+EVENTS.register(EventType.TIMER, timer_expired)
+EVENTS.register(EventType.ENGINE_RESULT, hint_search_done, states=[States.PLAYER_TURN])
 
 epaper_screen = epaper.Screen(
     menu_items=[
@@ -1203,6 +1422,11 @@ epaper_screen = epaper.Screen(
 LOG.debug('waiting for arduino...')
 if serial_arduino.say_hello() is True:
     LOG.debug('Arduino found!')
+    serial_arduino.STATS.start_logging(config.LINK_STATS_INTERVAL)
+    lights.upload_animations()
+    SERIAL_LINK.start()
+    SERIAL_LINK.spawn(arduino_events())
+    gpio.set_callback(config.ARDUINO_INT_PIN, SERIAL_LINK.interrupt_callback)
 else:
     LOG.critical('Cannot find arduino')
     epaper_screen.clear_screen(message='Critical: cannot find arduino')
@@ -1216,6 +1440,8 @@ if __name__ == '__main__':
     LOG.info('Start program')
     epaper_screen.clear_screen(button_panel, full_refresh=True)
     main_game = Game()
+    ENGINE_POOL.prefetch(main_game.setup.engine)
+    book.open_books(config.ENGINES)
     epaper_screen.update_engine_options(main_game.setup.engine)
     save_file = files.open_saved_game(config.SAVEGAME)
     state.set(States.MAIN)
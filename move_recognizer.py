@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Table-driven recognizer for moves on the physical board.
+A reed event only says 'something changed on square x'. A move is a short sequence of these changes, eg. a capture is
+'lift mover, lift captured piece, place mover' or 'lift captured piece, lift mover, place mover'. For every legal move
+all physical orders are generated once per position and stored in a trie. Every reed event is then one dict lookup.
+The same square twice in a row cancels the last change: a piece put back or lifted again. After a promotion the
+to square changes twice more when the pawn is swapped with the new piece.
+"""
+
+import logging
+from enum import Enum
+from typing import Dict, List, Tuple, Iterable, Optional
+
+import chess
+from position_index import PositionIndex, castling_rook
+
+LOG = logging.getLogger(__name__)
+
+Sequence = Tuple[int, ...]
+
+
+class Status(Enum):
+    """Result of a reed event"""
+    WAITING = 0  # board is back at the start position
+    PARTIAL = 1  # the changes are the start of one or more moves
+    COMPLETE = 2  # the changes form a complete move
+    INVALID = 3  # the change does not fit any move, it is not recorded
+
+
+class _Node:
+    """Trie node: next square --> node, moves that are complete at this node"""
+    __slots__ = ('children', 'moves')
+
+    def __init__(self) -> None:
+        self.children: Dict[int, _Node] = {}
+        self.moves: List[chess.Move] = []
+
+
+def _interleavings(first: Sequence, second: Sequence) -> List[Sequence]:
+    """:return: all merges of 2 sequences that keep the order inside each sequence"""
+    if not first:
+        return [second]
+    if not second:
+        return [first]
+    return [(first[0],) + rest for rest in _interleavings(first[1:], second)] + \
+           [(second[0],) + rest for rest in _interleavings(first, second[1:])]
+
+
+def move_sequences(index: PositionIndex, move: chess.Move) -> List[Sequence]:
+    """
+    All physical orders of the reed changes of a move. A promotion is complete when the pawn is placed, swapping the
+    pawn with the new piece adds 2 changes on the to square (lift pawn, place piece).
+    :param index: PositionIndex of the position before the move
+    :param move: chess.Move
+    :return: list with sequences of square nrs
+    """
+    lift, place = move.from_square, move.to_square
+    if index.is_castling(move):
+        rook = castling_rook(move)
+        king = (lift, chess.square(6 if rook.from_square > lift else 2, chess.square_rank(lift)))
+        return _interleavings(king, (rook.from_square, rook.to_square))
+
+    if index.is_en_passant(move):
+        captured = chess.square(chess.square_file(place), chess.square_rank(lift))
+        return _interleavings((lift, place), (captured,))
+
+    if index.is_capture(move):
+        sequences = [(lift, place, place), (place, lift, place)]
+    else:
+        sequences = [(lift, place)]
+
+    if move.promotion is not None:
+        sequences += [sequence + (place, place) for sequence in sequences]
+    return sequences
+
+
+class MoveRecognizer:
+    """Follows the reed events of 1 turn and tells which move has been made"""
+    def __init__(self, index: PositionIndex, moves: Optional[Iterable[chess.Move]] = None, undo: bool = False):
+        """
+        :param index: PositionIndex of the position before the move(s)
+        :param moves: moves to recognize, None --> all legal moves
+        :param undo: True --> recognize taking the move back (sequences in reverse order)
+        """
+        self._root = _Node()
+        self.size = 0  # nr of trie nodes
+        for move in index.moves if moves is None else moves:
+            for sequence in move_sequences(index, move):
+                self._add(sequence[::-1] if undo else sequence, move)
+        self._path: List[_Node] = []
+        self.events: List[int] = []  # accepted changes of the current attempt
+        self.history: List[int] = []  # all changes of the current attempt, also the ones that didn't fit
+        self.reset()
+
+    def __str__(self) -> str:
+        return 'MoveRecognizer: {0} nodes, events={1}, status={2}'.format(
+            self.size, [chess.square_name(square) for square in self.events], self.status.name)
+
+    def _add(self, sequence: Sequence, move: chess.Move) -> None:
+        node = self._root
+        for square in sequence:
+            if square not in node.children:
+                node.children[square] = _Node()
+                self.size += 1
+            node = node.children[square]
+        if move not in node.moves:
+            node.moves.append(move)
+
+    def reset(self) -> None:
+        """Back to the start position, eg. after validate_board"""
+        self._path = [self._root]
+        self.events = []
+        self.history = []
+
+    def feed(self, square: int) -> Status:
+        """
+        :param square: square nr (0-63) of a reed change
+        :return: Status after the change
+        """
+        self.history.append(square)
+        child = self._path[-1].children.get(square)
+        if child is not None:
+            self._path.append(child)
+            self.events.append(square)
+        elif self.events and square == self.events[-1]:
+            self._path.pop()
+            self.events.pop()
+        else:
+            LOG.debug('MoveRecognizer: change on %s does not fit', chess.square_name(square))
+            return Status.INVALID
+
+        return self.status
+
+    def note(self, squares: Iterable[int]) -> None:
+        """:param squares: changes the glitch filter dropped, only recorded in the history for resolve()"""
+        self.history.extend(squares)
+
+    @property
+    def status(self) -> Status:
+        if not self.events:
+            return Status.WAITING
+        return Status.COMPLETE if self._path[-1].moves else Status.PARTIAL
+
+    @property
+    def moves(self) -> List[chess.Move]:
+        """:return: moves complete at this point. More than 1 for promotions (same changes for every piece)"""
+        return list(self._path[-1].moves)
+
+    def expected(self) -> List[int]:
+        """:return: squares that continue one of the candidate moves"""
+        return list(self._path[-1].children)
+
+
+def preferred(moves: List[chess.Move]) -> chess.Move:
+    """:return: the move to play from the complete moves, a queen for promotions"""
+    for move in moves:
+        if move.promotion in (None, chess.QUEEN):
+            return move
+    return moves[0]
+
+
+def resolve(candidates: List[chess.Move], history: List[int]) -> Optional[chess.Move]:
+    """
+    Choose between the moves that leave the same occupancy (see PositionIndex.moves_with_occupancy). Captures by
+    the same piece and promotions look the same, the move whose to square had the latest reed change wins.
+    :param candidates: moves with the scanned occupancy
+    :param history: squares with reed changes in order
+    :return: chess.Move or None if there is no candidate or the changes don't tell which one
+    """
+    if not candidates:
+        return None
+
+    targets = {move.to_square for move in candidates}
+    if len(targets) > 1:
+        last = {square: index for index, square in enumerate(history)}
+        touched = [square for square in targets if square in last]
+        if not touched:
+            LOG.debug('resolve: %s moves fit the board, no changes to choose', len(candidates))
+            return None
+        target = max(touched, key=last.__getitem__)
+        candidates = [move for move in candidates if move.to_square == target]
+
+    return preferred(candidates)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Legal move indexes for 1 position.
+python-chess generates legal moves lazily, every 'for move in board.legal_moves' runs the generator again. A
+PositionIndex walks the generator once per ply and keeps the answers the move validation needs: which squares can
+move, where to, which moves end on a square, the type of every move and the occupancy of the board after every move.
+The reed switches only see occupancy, so the occupancy index maps a board scan straight to the moves that explain it.
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+import chess
+
+LOG = logging.getLogger(__name__)
+
+# Move flags
+CAPTURE = 0x01
+CASTLING = 0x02
+EN_PASSANT = 0x04
+PROMOTION = 0x08
+
+
+def _kingside(move: chess.Move) -> bool:
+    return chess.square_file(move.to_square) > chess.square_file(move.from_square)
+
+
+def castling_rook(move: chess.Move) -> chess.Move:
+    """:return: the rook part of a castling move"""
+    rank = chess.square_rank(move.from_square)
+    if _kingside(move):
+        return chess.Move(chess.square(7, rank), chess.square(5, rank))
+    return chess.Move(chess.square(0, rank), chess.square(3, rank))
+
+
+def occupancy_after(occupied: int, move: chess.Move, flags: int) -> int:
+    """
+    :param occupied: occupancy bitboard before the move
+    :param move: chess.Move
+    :param flags: move flags
+    :return: occupancy bitboard after the move, without making the move
+    """
+    result = occupied & ~chess.BB_SQUARES[move.from_square] | chess.BB_SQUARES[move.to_square]
+    if flags & EN_PASSANT:
+        result &= ~chess.BB_SQUARES[chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square))]
+    elif flags & CASTLING:
+        rook = castling_rook(move)
+        result = result & ~chess.BB_SQUARES[rook.from_square] | chess.BB_SQUARES[rook.to_square]
+    return result
+
+
+class PositionIndex:
+    """Indexes built from board.legal_moves"""
+    def __init__(self, board: chess.Board):
+        self.key = board.fen()
+        self.turn = board.turn
+        self.occupied = board.occupied
+        self.moves: List[chess.Move] = []
+        self.flags: Dict[chess.Move, int] = {}
+        self.from_squares = chess.BB_EMPTY  # bitboard with all squares that can move
+        self.targets: Dict[int, int] = {}  # from square: bitboard with to squares
+        self.moves_to: Dict[int, List[chess.Move]] = {}  # to square: moves
+        self.occupancy: Dict[chess.Move, int] = {}  # move: occupancy bitboard after the move
+        self.after: Dict[int, List[chess.Move]] = {}  # occupancy bitboard after the move: moves
+
+        for move in board.legal_moves:
+            flags = 0
+            if board.is_castling(move):
+                flags |= CASTLING
+            elif board.is_en_passant(move):
+                flags |= EN_PASSANT | CAPTURE
+            elif board.is_capture(move):
+                flags |= CAPTURE
+            if move.promotion:
+                flags |= PROMOTION
+
+            self.moves.append(move)
+            self.flags[move] = flags
+            self.from_squares |= chess.BB_SQUARES[move.from_square]
+            self.targets[move.from_square] = self.targets.get(move.from_square, chess.BB_EMPTY) | chess.BB_SQUARES[move.to_square]
+            self.moves_to.setdefault(move.to_square, []).append(move)
+            occupancy = occupancy_after(self.occupied, move, flags)
+            self.occupancy[move] = occupancy
+            self.after.setdefault(occupancy, []).append(move)
+
+    def __str__(self) -> str:
+        return 'PositionIndex: {0} legal moves from {1} squares'.format(len(self.moves), len(self.targets))
+
+    def matches(self, board: chess.Board) -> bool:
+        """:return: True if the index belongs to this board position"""
+        return self.key == board.fen()
+
+    def can_move(self, square: int) -> bool:
+        """:return: True if the piece on square has a legal move"""
+        return bool(self.from_squares & chess.BB_SQUARES[square])
+
+    def targets_of(self, square: int) -> chess.SquareSet:
+        """:return: to squares of the piece on square"""
+        return chess.SquareSet(self.targets.get(square, chess.BB_EMPTY))
+
+    def moves_from(self, square: int) -> List[chess.Move]:
+        return [move for move in self.moves if move.from_square == square]
+
+    def is_capture(self, move: chess.Move) -> bool:
+        return bool(self.flags.get(move, 0) & CAPTURE)
+
+    def is_castling(self, move: chess.Move) -> bool:
+        return bool(self.flags.get(move, 0) & CASTLING)
+
+    def is_en_passant(self, move: chess.Move) -> bool:
+        return bool(self.flags.get(move, 0) & EN_PASSANT)
+
+    def is_promotion(self, move: chess.Move) -> bool:
+        return bool(self.flags.get(move, 0) & PROMOTION)
+
+    def moves_with_occupancy(self, occupied: int) -> List[chess.Move]:
+        """:return: moves that leave the board with this occupancy bitboard"""
+        return self.after.get(occupied, [])
+
+
+_CURRENT: Optional[PositionIndex] = None
+
+
+def get(board: chess.Board) -> PositionIndex:
+    """
+    :param board: chess.Board
+    :return: the index of this position. Built once, the same position returns the same index
+    """
+    global _CURRENT
+    if _CURRENT is None or not _CURRENT.matches(board):
+        _CURRENT = PositionIndex(board)
+        LOG.debug(_CURRENT)
+    return _CURRENT
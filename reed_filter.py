@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Glitch filter for reed switch events.
+A magnet sliding past a reed switch or a piece put down crooked gives short lift/place pairs. Every event only says
+'something changed on square x', so the filter counts the changes per square. A square is settled when it had no
+new event during the glitch window. An odd nr of changes is one net change. An even nr leaves the square as it was
+before the burst: a glitch, unless a piece is in the hand and the square was occupied. Then it is a capture faster
+than the window (lift captured piece, place mover) and it is passed on as 2 changes.
+"""
+
+import logging
+from collections import deque
+from time import monotonic
+from typing import Dict, List, Optional, Deque, Tuple
+
+import chess
+import config
+
+LOG = logging.getLogger(__name__)
+
+
+class ReedFilter:
+    """Time-window filter between the serial event source and the move validation"""
+    def __init__(self, window: float = config.REED_GLITCH_WINDOW):
+        """:param window: seconds a square must be quiet before its change is accepted"""
+        self.window = window
+        self._changes: Dict[int, int] = {}  # square: nr of events inside the window
+        self._last_event: Dict[int, float] = {}  # square: timestamp last event
+        self._settled: Deque[Tuple[int, bool]] = deque()  # (square, True for a glitch) in the order they settled
+        self.glitches = 0
+        self.suppressed: List[int] = []  # squares of dropped glitches passed by pop(), until take_suppressed()
+        self.occupied: Optional[int] = None  # occupancy after the settled changes, None --> unknown
+        self._pieces = 0  # nr of pieces on the board at clear()
+
+    def __str__(self) -> str:
+        return 'ReedFilter: window={0}s, pending={1}, settled={2}'.format(self.window, len(self._changes), len(self._settled))
+
+    def feed(self, square: int, timestamp: Optional[float] = None) -> None:
+        """
+        Add a reed event
+        :param square: square nr (0-63)
+        :param timestamp: time.monotonic() of the event
+        """
+        if timestamp is None:
+            timestamp = monotonic()
+        self._changes[square] = self._changes.get(square, 0) + 1
+        self._last_event[square] = timestamp
+
+    def update(self, now: Optional[float] = None) -> List[int]:
+        """
+        Move squares which are quiet for longer than the window to the settled queue
+        :param now: time.monotonic()
+        :return: list with squares settled during this update
+        """
+        if now is None:
+            now = monotonic()
+
+        settled = [square for square, stamp in self._last_event.items() if now - stamp >= self.window]
+        settled.sort(key=lambda square: self._last_event[square])
+        result = []
+        for square in settled:
+            changes = self._changes.pop(square)
+            del self._last_event[square]
+            if changes % 2:
+                result.append(square)
+                self._settled.append((square, False))
+                if self.occupied is not None:
+                    self.occupied ^= chess.BB_SQUARES[square]
+                if changes > 1:
+                    LOG.debug('Reed filter: %s events on %s merged into 1 change', changes, chess.square_name(square))
+            elif self._fast_capture(square):
+                result += [square, square]
+                self._settled.extend(((square, False), (square, False)))
+                LOG.debug('Reed filter: %s events on %s taken as a capture', changes, chess.square_name(square))
+            else:
+                self.glitches += 1
+                self._settled.append((square, True))
+                LOG.debug('Reed filter: glitch on %s suppressed (%s events)', chess.square_name(square), changes)
+
+        return result
+
+    def _fast_capture(self, square: int) -> bool:
+        """:return: True if an even nr of changes on 'square' is a capture: it was occupied and a piece is in the hand"""
+        if self.occupied is None or not self.occupied & chess.BB_SQUARES[square]:
+            return False
+        return bin(self.occupied).count('1') < self._pieces
+
+    def pop(self, now: Optional[float] = None) -> Optional[int]:
+        """:return: oldest settled square or None. Glitches settled before it go to 'suppressed'"""
+        self.update(now)
+        while self._settled:
+            square, glitch = self._settled.popleft()
+            if not glitch:
+                return square
+            self.suppressed.append(square)
+        return None
+
+    def take_suppressed(self) -> List[int]:
+        """:return: squares of the glitches passed by pop() in order, eg. for the history of the move recognizer"""
+        suppressed, self.suppressed = self.suppressed, []
+        return suppressed
+
+    def time_to_settle(self, now: Optional[float] = None) -> Optional[float]:
+        """:return: seconds until the next pending square settles, None if nothing is pending"""
+        if not self._last_event:
+            return None
+        if now is None:
+            now = monotonic()
+        return max(0.0, min(self._last_event.values()) + self.window - now)
+
+    def pending(self) -> bool:
+        """:return: True if there are events waiting for the window to pass or settled squares"""
+        return bool(self._last_event or self._settled)
+
+    def clear(self, occupied: Optional[int] = None) -> None:
+        """
+        Drop all events. Use when the board has been validated with a complete scan
+        :param occupied: bitboard of the occupied squares, None --> unknown, every even nr of changes is a glitch
+        """
+        self._changes.clear()
+        self._last_event.clear()
+        self._settled.clear()
+        self.suppressed.clear()
+        self.occupied = occupied
+        self._pieces = 0 if occupied is None else bin(occupied).count('1')
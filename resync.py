@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Board resynchronisation.
+When the reed switches don't match game.board, search for a short line of legal moves that explains the scanned
+occupancy (eg. the player also made the computer move, or moved on while the program was busy). The last ply of every
+line is a lookup in the occupancy index of PositionIndex. Lines that change too many squares are cut off early.
+"""
+
+import logging
+from typing import List
+
+import chess
+import config
+from position_index import PositionIndex
+
+LOG = logging.getLogger(__name__)
+
+MAX_CHANGES = 4  # squares one move can change: castling
+
+
+def _popcount(bitboard: int) -> int:
+    return bin(bitboard).count('1')
+
+
+def _search(board: chess.Board, index: PositionIndex, observed: int, plies: int) -> List[List[chess.Move]]:
+    """:return: lines of exactly 'plies' moves from board that end with the observed occupancy"""
+    if plies == 1:
+        return [[move] for move in index.moves_with_occupancy(observed)]
+
+    lines: List[List[chess.Move]] = []
+    for move in index.moves:
+        if _popcount(index.occupancy[move] ^ observed) > MAX_CHANGES * (plies - 1):
+            continue
+        board.push(move)
+        lines.extend([move] + line for line in _search(board, PositionIndex(board), observed, plies - 1))
+        board.pop()
+    return lines
+
+
+def find_lines(board: chess.Board, observed: int, max_plies: int = config.RESYNC_PLIES) -> List[List[chess.Move]]:
+    """
+    :param board: chess.Board, position of the game
+    :param observed: occupancy bitboard from the reed switches
+    :param max_plies: longest line to search
+    :return: the shortest matching lines, empty if nothing explains the board
+    """
+    if observed == board.occupied:
+        return []
+
+    work = board.copy(stack=False)
+    index = PositionIndex(work)
+    for plies in range(1, max_plies + 1):
+        lines = _search(work, index, observed, plies)
+        if lines:
+            LOG.info('Resync: %s line(s) of %s plies match', len(lines), plies)
+            return lines
+
+    LOG.info('Resync: no line of %s plies or less matches the board', max_plies)
+    return []
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Engine search in a background thread.
+The search for the computer move starts as soon as the move of the player is recognized, on the position after that
+tentative move. Confirming the move keeps the search running, taking it back cancels the search. The confirmation
+window (config.TIME_CONFIRM_MOVE) becomes thinking time of the engine.
+The search runs as SimpleEngine.analysis() and not as play(), because an analysis can be stopped from another thread.
+Stopping a search (UCI 'stop') keeps the best move so far, the progress of the engine is posted as ENGINE_INFO.
+A search with config.EarlyStop stops itself when the best move has been the same for some depths with close scores,
+or at the first pv when there is only 1 legal move: obvious moves don't use the full movetime.
+"""
+
+import logging
+import threading
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import chess
+import chess.engine
+import config
+import governor
+from engine_cache import MATE_SCORE
+from events import EVENTS, EventType
+
+LOG = logging.getLogger(__name__)
+
+
+class Search:
+    """1 search for the best move in a position. Posts ENGINE_RESULT with itself as data when done"""
+    def __init__(self, engine: chess.engine.SimpleEngine, board: chess.Board, limit: chess.engine.Limit, ponder: bool = False,
+                 multipv: Optional[int] = None, early_stop: Optional[config.EarlyStop] = None, game: object = None):
+        """
+        :param engine: chess.engine.SimpleEngine
+        :param board: position to search, copied with the move stack (repetitions)
+        :param limit: chess.engine.Limit
+        :param ponder: True --> search on the turn of the player, the time is counted by governor.PONDER
+        :param multipv: nr of best lines to search (hints), None --> only the best move
+        :param early_stop: config.EarlyStop, None --> search until the limit
+        :param game: key of the game, the engine gets 'ucinewgame' when it differs from the previous search
+        """
+        self.engine = engine
+        self.board = board.copy()
+        self.key = board.fen()
+        self.limit = limit
+        self.ponder = ponder
+        self.multipv = multipv
+        self.early_stop = early_stop
+        self.game = game
+        self.stopped_early = False
+        self._only_move = self.board.legal_moves.count() == 1
+        self._depths: Dict[int, Tuple[chess.Move, int]] = {}  # depth: latest best move and score (centipawns)
+        self.lines: List[chess.engine.InfoDict] = []  # info of the best lines when multipv is set
+        self.started = 0.0
+        self.result: Union[chess.engine.PlayResult, Exception, None] = None
+        self.info: chess.engine.InfoDict = {}  # latest depth, score, pv... of the engine
+        self.cancelled = False
+        self.taken = False  # the computer move uses this search, see take()
+        self._stopping = False
+        self._info_posted = 0.0
+        self._analysis: Optional[chess.engine.SimpleAnalysisResult] = None
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='EngineThread', daemon=True)
+
+    def __str__(self) -> str:
+        return 'Search: {0}, ponder={1}, done={2}, cancelled={3}'.format(self.key, self.ponder, self.done, self.cancelled)
+
+    def _run(self) -> None:
+        try:
+            with self._lock:
+                if self.cancelled:
+                    return
+                multipv = self.multipv if 'MultiPV' in self.engine.options else None  # not every engine has it
+                analysis = self._analysis = self.engine.analysis(self.board, self.limit, multipv=multipv, game=self.game)
+                if self._stopping:
+                    analysis.stop()
+            for info in analysis:
+                self._progress(info, analysis)
+            best = analysis.wait()
+            if self.multipv:
+                self.lines = analysis.multipv
+            self.result = chess.engine.PlayResult(best.move, best.ponder)
+        except Exception as error:  # re-raised by wait() on the main thread
+            self.result = error
+
+        if self.ponder:
+            governor.PONDER.used(monotonic() - self.started)
+        if not self.cancelled:
+            EVENTS.post(EventType.ENGINE_RESULT, self)
+
+    def _progress(self, info: chess.engine.InfoDict, analysis: chess.engine.SimpleAnalysisResult) -> None:
+        """Keep the engine info, ENGINE_INFO is posted at most every config.ENGINE_INFO_INTERVAL seconds"""
+        self.info.update(info)
+        now = monotonic()
+        if self.early_stop is not None and not self.stopped_early and self._stable(info, now, self.early_stop):
+            self.stopped_early = True
+            LOG.info('early stop at depth %s after %.1f sec', self.info.get('depth'), now - self.started)
+            analysis.stop()
+        if not self.ponder and 'pv' in info and now - self._info_posted >= config.ENGINE_INFO_INTERVAL:
+            self._info_posted = now
+            EVENTS.post(EventType.ENGINE_INFO, self)
+
+    def _stable(self, info: chess.engine.InfoDict, now: float, stop: config.EarlyStop) -> bool:
+        """:return: True if the best move is not going to change within the limit"""
+        pv, score, depth = info.get('pv'), info.get('score'), info.get('depth')
+        if not pv or info.get('multipv', 1) != 1:
+            return False
+        if self._only_move:
+            return True
+        centipawns = None if score is None else score.relative.score(mate_score=MATE_SCORE)
+        if centipawns is None or depth is None:
+            return False
+        self._depths[depth] = (pv[0], centipawns)
+
+        if depth <= stop.min_depth or now - self.started < stop.min_part * (self.limit.time or 0):
+            return False
+        completed = [self._depths[item] for item in range(depth - stop.stable_depths, depth) if item in self._depths]
+        if len(completed) < stop.stable_depths or len({move for move, _ in completed}) > 1 or completed[-1][0] != pv[0]:
+            return False
+        scores = [centipawns for _, centipawns in completed]
+        return max(scores) - min(scores) <= stop.max_spread
+
+    def start(self) -> 'Search':
+        self.started = monotonic()
+        self._thread.start()
+        return self
+
+    def stop(self) -> bool:
+        """
+        Stop the engine now (UCI 'stop'), the best move so far is the result
+        :return: False if the search had already finished
+        """
+        with self._lock:
+            if self.done or self._stopping:
+                return False
+            self._stopping = True
+            analysis = self._analysis
+        if analysis is not None:
+            analysis.stop()
+        return True
+
+    def cancel(self) -> None:
+        """Stop the engine and wait until it is free for the next search"""
+        with self._lock:
+            self.cancelled = True
+            analysis = self._analysis
+        if analysis is not None:
+            analysis.stop()
+        if self._thread.is_alive():
+            self._thread.join()
+        LOG.debug('%s', self)
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    @property
+    def stopped(self) -> bool:
+        """:return: True if the search was stopped before its limit (engine stop), the result is less deep"""
+        return self._stopping
+
+    def matches(self, board: chess.Board) -> bool:
+        """:return: True if the search is for this board position and not taken"""
+        return not self.cancelled and not self.taken and self.key == board.fen()
+
+    def wait(self, on_info: Optional[Callable[['Search'], Any]] = None) -> chess.engine.PlayResult:
+        """
+        Wait for the result on the main thread. Button events are handled meanwhile, eg. engine_stop or stop_game
+        :param on_info: function called with the search on every ENGINE_INFO event
+        :return: chess.engine.PlayResult, without a move if the search was cancelled before the engine started
+        :raises: the exception of the engine
+        """
+        while not self.done and not self.cancelled:
+            event = EVENTS.wait_for((EventType.ENGINE_RESULT, EventType.ENGINE_INFO))
+            if event is None:
+                continue
+            if event.data is not self:
+                LOG.debug('dropped %s of %s', event.type.name, event.data)
+            elif event.type == EventType.ENGINE_INFO and on_info is not None:
+                on_info(self)
+        EVENTS.discard(EventType.ENGINE_RESULT)
+        EVENTS.discard(EventType.ENGINE_INFO)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result or chess.engine.PlayResult(None, None)
+
+
+_CURRENT: Optional[Search] = None
+
+
+def start(engine: chess.engine.SimpleEngine, board: chess.Board, limit: chess.engine.Limit, ponder: bool = False,
+          multipv: Optional[int] = None, early_stop: Optional[config.EarlyStop] = None, game: object = None) -> Search:
+    """
+    Start a search, a running search is cancelled first (1 engine, 1 search)
+    :return: Search
+    """
+    global _CURRENT
+    cancel()
+    _CURRENT = Search(engine, board, limit, ponder, multipv, early_stop, game).start()
+    LOG.debug('started %s', _CURRENT)
+    return _CURRENT
+
+
+def cancel() -> None:
+    """Cancel the running search, eg. when the player takes the move back"""
+    global _CURRENT
+    if _CURRENT is not None:
+        _CURRENT.cancel()
+        _CURRENT = None
+
+
+def stop() -> bool:
+    """:return: False if no search was running, see Search.stop()"""
+    return _CURRENT is not None and _CURRENT.stop()
+
+
+def get(board: chess.Board) -> Optional[Search]:
+    """:return: the running or finished search for this position, None if there is none"""
+    if _CURRENT is not None and _CURRENT.matches(board):
+        return _CURRENT
+    return None
+
+
+def take(board: chess.Board) -> Optional[Search]:
+    """
+    :return: like get(), get() doesn't return the search anymore. It stays the current search, so stop() and
+        cancel() still reach the engine until the next start()
+    """
+    current = get(board)
+    if current is not None:
+        current.taken = True
+    return current
@@ -2,10 +2,13 @@
 """Serial communication with the arduino """
 
 import logging
-import serial
+import threading
 import time
-import lights
 from enum import Enum
+from functools import wraps
+from typing import Any, Callable
+import gpio
+import link_stats
 
 log = logging.getLogger(__name__)
 
@@ -13,52 +16,93 @@ START_CHAR = b'<'
 STOP_CHAR = b'>'
 SPLIT_CHAR = b'\t'
 HELLO = b'H'
+GIVE_FLAG = b'F'
 GIVE_BOARD = b'B'
 GIVE_MOVE = b'M'
 REED_ON = b'R'
 REED_OFF = b'O'
 ARDUINO_INT = b'I'
 LED_MATRIX = b'L'
+LED_FRAME = b'U'
+LED_UPLOAD = b'A'
+LED_PLAY = b'P'
+LED_STOP = b'Q'
 WHY_SHUTDOWN = b'S'
 
-SER = serial.Serial(
-    port="/dev/ttyAMA0",
-    baudrate=115200,
-    parity=serial.PARITY_NONE,
-    stopbits=serial.STOPBITS_ONE,
-    bytesize=serial.EIGHTBITS,
-    timeout=0.5
-)
+PORT = '/dev/ttyAMA0'
+BAUDRATE = 115200
+TIMEOUT = 0.5
+
+_SER: Any = None  # opened by port()
+# One packet exchange at a time. Round trips come from the main thread and the serial link (serial_async).
+# A plain Lock: the link acquires it in an executor thread and releases it on its loop thread
+LOCK = threading.Lock()
+STATS = link_stats.LinkStats()
 
 
 # -------------------
 # -- General stuff --
 # -------------------
+def port() -> Any:
+    """:return: serial port to the arduino, opened through the gpio backend on first use"""
+    global _SER
+    if _SER is None:
+        _SER = gpio.backend().uart(PORT, BAUDRATE, TIMEOUT)
+    return _SER
+
+
 def _send_command(command: bytes) -> None:
     """
     Write to serial
     :param: command: bytes: command as a single char
     """
     cmd = b''.join([START_CHAR, command, STOP_CHAR])
-    SER.write(cmd)
+    _write(cmd, command)
+
+
+def _write(packet: bytes, command: bytes) -> None:
+    """
+    Write packet to serial
+    :param packet: bytes: complete packet
+    :param command: bytes: command char, used for the telemetry
+    """
+    port().write(packet)
+    STATS.sent(command, len(packet))
 
 
 def _read_data() -> bytes:
     """Recieve from serial"""
-    return SER.read_until(terminator=STOP_CHAR)
+    data = port().read_until(terminator=STOP_CHAR)
+    STATS.received(len(data), timeout=not data.endswith(STOP_CHAR))
+    return data
 
 
 def _read() -> bytes:
     """Read 1 char"""
-    return SER.read(1)
+    data = port().read(1)
+    STATS.received(len(data), timeout=not data)
+    return data
 
 
 def _flush() -> None:
     """flush buffers"""
-    SER.flushInput()
-    SER.flushOutput()
+    port().flushInput()
+    port().flushOutput()
+    STATS.flushed()
+
+
+def _round_trip(command: bytes) -> Callable:
+    """Decorator: hold the LOCK and measure the function as 1 round trip for 'command' in STATS"""
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with LOCK, STATS.round_trip(command):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
 
 
+@_round_trip(HELLO)
 def say_hello() -> bool:
     """
     mini 'pingtest'
@@ -84,19 +128,38 @@ class ReasonInterrupt(Enum):
     """Interrupt codes coming from arduino"""
     NONE = 0
     MOVE = 1
-    SHUTDOWN = 2
+    SHUTDOWN = 2  # power button
     BUTTONPRESS = 3
 
 
-def get_interrupt_reason() -> int:
-    """get the interrupt code"""
-    incoming = _read_data().strip(START_CHAR + STOP_CHAR)
-    return ReasonInterrupt(incoming)
+@_round_trip(GIVE_FLAG)
+def get_interrupt_reason() -> ReasonInterrupt:
+    """Ask the interrupt flag: <F> --> <[flag]>. The arduino clears the flag after sending it"""
+    _send_command(GIVE_FLAG)
+    tried = 1
+    while _read() != START_CHAR:
+        if tried == 10:
+            log.error('Interrupt reason: no answer')
+            _flush()
+            return ReasonInterrupt.NONE
+
+        time.sleep(0.01)
+        tried += 1
+        _send_command(GIVE_FLAG)
+
+    incoming = _read_data()
+    _flush()
+    try:
+        return ReasonInterrupt(incoming[0])
+    except (IndexError, ValueError):
+        log.warning('Interrupt reason: invalid flag %s', incoming)
+        return ReasonInterrupt.NONE
 
 
 # ------------------
 # -- Board, moves --
 # ------------------
+@_round_trip(GIVE_BOARD)
 def ask_board():
     """ask complete board. Returns list with 64 bits."""
     log.debug('Arduino, please give board')
@@ -155,6 +218,7 @@ def make_square_set(incoming_data):
     return nr
 
 
+@_round_trip(GIVE_MOVE)
 def new_detected_move():
     """Returns nr representing square where arduino detected movement.(0-63)"""
     log.debug('Asking move')
@@ -183,6 +247,7 @@ def new_detected_move():
     return new_move
 
 
+@_round_trip(REED_ON)
 def reed_on():
     _send_command(REED_ON)
     log.debug('Reed on')
@@ -197,6 +262,7 @@ def reed_on():
     _flush()
 
 
+@_round_trip(REED_OFF)
 def reed_off():
     _send_command(REED_OFF)
     log.debug('Reed off')
@@ -213,33 +279,70 @@ def reed_off():
 
 def trigger_arduino_int():
     log.debug('reed triggered')
-    _send_command(ARDUINO_INT)
+    with LOCK:
+        _send_command(ARDUINO_INT)
 
 
 # -----------------
 # -- board leds ---
 # -----------------
-def update_leds(action, *args):
+def send_led_frame(runs: bytes) -> None:
     """
-    Send action to square.
-    :param action: Action from lights.LedCommands
-    :param args:
-    :return:
+    Send a led frame in 1 packet: <U[nr of runs][runs...]>
+    :param runs: bytes: run-length encoded led changes from lights.encode_runs
     """
-    if action not in lights.LedCommands:
-        log.fatal("Update leds: Incorrect action")
+    if not runs or runs[0] * 5 != len(runs) - 1:
+        log.fatal("Send led frame: Incorrect led frame")
         raise ValueError
 
-    SER.write(LED_MATRIX)
-    SER.write(action)
-    for item in args:
-        if isinstance(item, list):
-            for square in item:
-                SER.write(square)
+    log.debug('Led frame: %s runs, %s bytes', runs[0], len(runs) + 3)
+    with LOCK:
+        _write(b''.join([START_CHAR, LED_FRAME, runs, STOP_CHAR]), LED_FRAME)
 
-            SER.write(SPLIT_CHAR)
 
-        else:
-            SER.write(item)
+@_round_trip(LED_UPLOAD)
+def upload_animation(slot: int, program: bytes) -> bool:
+    """
+    Store an animation program in a slot on the arduino: <A[slot][size][program]>
+    :param slot: int: slot nr
+    :param program: bytes: from led_animations.encode
+    :return: True if the arduino confirmed the upload
+    """
+    packet = b''.join([START_CHAR, LED_UPLOAD, bytes([slot, len(program)]), program, STOP_CHAR])
+    _write(packet, LED_UPLOAD)
+    tried = 1
+    while _read() != START_CHAR:
+        if tried == 10:
+            log.error('Upload animation slot %s: no answer', slot)
+            _flush()
+            return False
+
+        time.sleep(0.01)
+        tried += 1
+        _write(packet, LED_UPLOAD)
+
+    confirm = _read_data()
+    _flush()
+    if confirm != bytes([slot]) + STOP_CHAR:
+        log.critical('Upload animation slot %s: NOT confirmed! --> %s', slot, confirm)
+        return False
+
+    log.debug('Animation uploaded to slot %s (%s bytes)', slot, len(program))
+    return True
+
+
+def play_animation(slot: int, squares: list) -> None:
+    """
+    Play an uploaded animation: <P[slot][nr of squares][squares...]>
+    :param slot: int: slot nr
+    :param squares: list with square nrs (0-63). One square for every target of the animation
+    """
+    log.debug('Play animation slot %s on squares %s', slot, squares)
+    with LOCK:
+        _write(b''.join([START_CHAR, LED_PLAY, bytes([slot, len(squares)]), bytes(squares), STOP_CHAR]), LED_PLAY)
+
 
-    SER.write(SPLIT_CHAR)
+def stop_animations() -> None:
+    """Stop all running animations"""
+    with LOCK:
+        _send_command(LED_STOP)
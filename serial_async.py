@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Asyncio serial communication with the arduino.
+Same protocol as serial_arduino but without blocking reads: the uart file descriptor is watched by the event loop.
+Reed events, interrupt reasons and board scans are awaitables and async iterators, so engine search, serial io and
+screen jobs can share one loop (eg. the loop of chess.engine.SimpleEngine, see attach()).
+The blocking functions of serial_arduino stay usable. Every request holds serial_arduino.LOCK and the uart is only
+watched during a request, so the link and the blocking functions never read each others answers.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from time import monotonic
+from typing import Optional, AsyncIterator, Union, Coroutine, Any
+
+import chess
+import serial_arduino
+from serial_arduino import START_CHAR, STOP_CHAR, ReasonInterrupt
+
+LOG = logging.getLogger(__name__)
+
+BOARD_SIZE = 8
+NO_MOVE = 100
+
+
+@dataclass
+class ReedEvent:
+    """Reed switch change on a square"""
+    square: int
+    timestamp: float
+
+    def __str__(self) -> str:
+        return 'ReedEvent: {0} at {1:.3f}'.format(chess.square_name(self.square), self.timestamp)
+
+
+@dataclass
+class _Request:
+    """Command waiting for an answer"""
+    command: bytes
+    size: Optional[int]  # nr of bytes between START_CHAR and STOP_CHAR, None --> read until STOP_CHAR
+    future: asyncio.Future
+
+
+class SerialLink:
+    """Reader/writer for the arduino over the uart file descriptor"""
+    def __init__(self, ser: Any = None, timeout: float = 0.5, retries: int = 10):
+        """
+        :param ser: serial port with the pyserial api, None --> serial_arduino.port()
+        :param timeout: seconds to wait for an answer
+        :param retries: nr of tries before a request fails
+        """
+        self.ser = ser
+        self.timeout = timeout
+        self.retries = retries
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._buffer = bytearray()
+        self._request: Optional[_Request] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._interrupt: Optional[asyncio.Event] = None
+
+    def __str__(self) -> str:
+        return 'SerialLink: {0}, {1}'.format(self.ser.name if self.ser else None,
+                                             'open' if self.loop is not None else 'closed')
+
+    # -----------
+    # -- Setup --
+    # -----------
+    def open(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Prepare the link. Must be called from the thread running the loop, see attach() otherwise.
+        :param loop: asyncio loop, eg. game.engine.protocol.loop
+        """
+        if self.ser is None:
+            self.ser = serial_arduino.port()
+        self.loop = loop
+        self._lock = asyncio.Lock()
+        self._interrupt = asyncio.Event()
+        LOG.debug('Serial link open')
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Open the link on a loop running in another thread (eg. the SimpleEngine background thread)
+        :param loop: asyncio loop
+        """
+        async def _open() -> None:
+            self.open(loop)
+
+        asyncio.run_coroutine_threadsafe(_open(), loop).result()
+
+    def start(self) -> None:
+        """Open the link on its own loop in a background thread"""
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, name='SerialLinkThread', daemon=True).start()
+        self.attach(loop)
+
+    def close(self) -> None:
+        """Cancel the waiting request. Thread-safe"""
+        loop, self.loop = self.loop, None
+        if loop is not None and self._request is not None:
+            loop.call_soon_threadsafe(self._request.future.cancel)
+        LOG.debug('Serial link closed')
+
+    def run(self, coro: Coroutine) -> Any:
+        """
+        Run a coroutine on the link loop from another thread and wait for the result
+        :param coro: coroutine, eg. link.board()
+        """
+        return self.spawn(coro).result()
+
+    def spawn(self, coro: Coroutine) -> Future:
+        """
+        Start a coroutine on the link loop from another thread, eg. a task that posts the events() as program events
+        :param coro: coroutine
+        :return: concurrent.futures.Future with the result
+        """
+        if self.loop is None:
+            raise RuntimeError('Serial link is not open')
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def interrupt_callback(self, pin: int) -> None:
+        """Callback for the arduino interrupt pin (gpio.set_callback). Thread-safe"""
+        loop = self.loop
+        if loop is not None and self._interrupt is not None:
+            loop.call_soon_threadsafe(self._interrupt.set)
+
+    # -------------
+    # -- Reading --
+    # -------------
+    def _on_readable(self) -> None:
+        """Called by the loop when the uart has data. The uart is only watched during a request"""
+        try:
+            data = os.read(self.ser.fileno(), 256)
+        except BlockingIOError:
+            return
+
+        serial_arduino.STATS.received(len(data))
+        self._buffer.extend(data)
+        self._parse()
+
+    def _parse(self) -> None:
+        """Match a complete answer in the buffer with the waiting request"""
+        while self._request is not None:
+            request = self._request
+            start = self._buffer.find(START_CHAR)
+            if start < 0:
+                self._buffer.clear()
+                return
+            del self._buffer[:start]
+
+            if request.size is None:
+                stop = self._buffer.find(STOP_CHAR, 1)
+                if stop < 0:
+                    return
+                payload = bytes(self._buffer[1:stop])
+                del self._buffer[:stop + 1]
+            else:
+                if len(self._buffer) < request.size + 2:
+                    return
+                if self._buffer[request.size + 1:request.size + 2] != STOP_CHAR:
+                    LOG.error('Serial link: %s: incorrect STOP_CHAR. Retry...', request.command)
+                    del self._buffer[:1]
+                    continue
+                payload = bytes(self._buffer[1:request.size + 1])
+                del self._buffer[:request.size + 2]
+
+            self._request = None
+            if not request.future.done():
+                request.future.set_result(payload)
+
+    async def _acquire_port(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Wait in an executor thread until the blocking functions of serial_arduino are done with the uart"""
+        acquired = loop.run_in_executor(None, serial_arduino.LOCK.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            acquired.add_done_callback(lambda _: serial_arduino.LOCK.release())
+            raise
+
+    async def request(self, command: bytes, size: Optional[int] = None) -> bytes:
+        """
+        Send command and wait for the answer. Retries on timeout.
+        :param command: bytes: command as a single char
+        :param size: nr of bytes in the answer, None for answers ending on STOP_CHAR
+        :return: bytes: answer without START_CHAR and STOP_CHAR
+        :raises asyncio.TimeoutError: when the arduino doesn't answer
+        """
+        loop, lock = self.loop, self._lock
+        if loop is None or lock is None:
+            raise RuntimeError('Serial link is not open')
+
+        async with lock:
+            await self._acquire_port(loop)
+            fd = self.ser.fileno()
+            loop.add_reader(fd, self._on_readable)
+            try:
+                with serial_arduino.STATS.round_trip(command):
+                    for tried in range(1, self.retries + 1):
+                        self._request = _Request(command, size, loop.create_future())
+                        packet = b''.join([START_CHAR, command, STOP_CHAR])
+                        self.ser.write(packet)
+                        serial_arduino.STATS.sent(command, len(packet))
+                        try:
+                            return await asyncio.wait_for(self._request.future, self.timeout)
+                        except asyncio.TimeoutError:
+                            LOG.error('Serial link: no answer on %s (try %s). Retry...', command, tried)
+                            serial_arduino.STATS.received(0, timeout=True)
+                            self._buffer.clear()
+            finally:
+                self._request = None
+                self._buffer.clear()
+                loop.remove_reader(fd)
+                serial_arduino.LOCK.release()
+
+        raise asyncio.TimeoutError('Arduino does not answer on {0!r}'.format(command))
+
+    # --------------
+    # -- Commands --
+    # --------------
+    async def say_hello(self) -> bool:
+        """mini 'pingtest'"""
+        return await self.request(serial_arduino.HELLO) == b'hello pi!'
+
+    async def interrupt_reason(self) -> ReasonInterrupt:
+        """get the interrupt code. The arduino clears the flag after sending it"""
+        answer = await self.request(serial_arduino.GIVE_FLAG, size=1)
+        try:
+            return ReasonInterrupt(answer[0])
+        except ValueError:
+            LOG.warning('Serial link: invalid interrupt flag %s', answer)
+            return ReasonInterrupt.NONE
+
+    async def board(self) -> chess.SquareSet:
+        """ask complete board"""
+        answer = await self.request(serial_arduino.GIVE_BOARD, size=BOARD_SIZE)
+        return chess.SquareSet(serial_arduino.make_square_set(list(answer)))
+
+    async def detected_move(self) -> int:
+        """Returns square where arduino detected movement (0-63) or 100 for 'no move'"""
+        while True:
+            square = (await self.request(serial_arduino.GIVE_MOVE, size=1))[0]
+            if square in range(64) or square == NO_MOVE:
+                return square
+            LOG.warning('Serial link: incoming move not possible retry... %s', square)
+
+    async def reed_on(self) -> None:
+        await self.request(serial_arduino.REED_ON)
+
+    async def reed_off(self) -> None:
+        await self.request(serial_arduino.REED_OFF)
+
+    # ------------
+    # -- Events --
+    # ------------
+    async def next_interrupt(self, timeout: Optional[float] = None) -> ReasonInterrupt:
+        """
+        Wait for the interrupt pin and ask the reason
+        :param timeout: seconds, None waits forever
+        :return: ReasonInterrupt, NONE on timeout
+        """
+        if self._interrupt is None:
+            raise RuntimeError('Serial link is not open')
+        try:
+            await asyncio.wait_for(self._interrupt.wait(), timeout)
+        except asyncio.TimeoutError:
+            return ReasonInterrupt.NONE
+        self._interrupt.clear()
+        return await self.interrupt_reason()
+
+    async def events(self) -> AsyncIterator[Union[ReedEvent, ReasonInterrupt]]:
+        """
+        Async iterator with a ReedEvent for every move interrupt and the ReasonInterrupt for all other interrupts.
+        Only one consumer: the interrupt flag is cleared by reading it.
+        """
+        while True:
+            try:
+                reason = await self.next_interrupt()
+                if reason == ReasonInterrupt.MOVE:
+                    square = await self.detected_move()
+                    if square != NO_MOVE:
+                        yield ReedEvent(square, monotonic())
+                elif reason == ReasonInterrupt.NONE:
+                    LOG.warning('Serial link: got an arduino interrupt but recieved code NONE')
+                else:
+                    yield reason
+            except asyncio.TimeoutError as error:
+                LOG.error('Serial link: %s', error)
+
+    async def reed_events(self) -> AsyncIterator[ReedEvent]:
+        """Async iterator with reed events only. Other interrupts are logged and dropped"""
+        async for event in self.events():
+            if isinstance(event, ReedEvent):
+                yield event
+            else:
+                LOG.debug('Serial link: dropped interrupt %s', event)
+
+    async def board_scans(self, interval: float = 3.0) -> AsyncIterator[chess.SquareSet]:
+        """
+        Async iterator with a board scan every 'interval' seconds. Leaves the interrupts to events()
+        :param interval: seconds
+        """
+        while True:
+            yield await self.board()
+            await asyncio.sleep(interval)
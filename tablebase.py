@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Syzygy endgame tablebases.
+Positions with at most config.SYZYGY_MAX_PIECES pieces are probed (WDL and DTZ) instead of searched: the move that
+keeps the best result with the shortest distance to a zeroing move is played at once. Minmaxing DTZ this way never
+spoils a win or a draw. The tables open on the first probe, chess.syzygy keeps at most config.SYZYGY_MAX_FDS files open.
+"""
+
+import logging
+from typing import Optional, Tuple
+
+import chess
+import chess.syzygy
+import config
+
+LOG = logging.getLogger(__name__)
+
+_TABLEBASE: Optional[chess.syzygy.Tablebase] = None
+_AVAILABLE = True  # False when the directory has no tables
+
+
+def tablebase() -> Optional[chess.syzygy.Tablebase]:
+    """:return: the tablebase, opened on the first call. None if there are no tables"""
+    global _TABLEBASE, _AVAILABLE
+    if _TABLEBASE is None and _AVAILABLE:
+        try:
+            _TABLEBASE = chess.syzygy.open_tablebase(config.SYZYGY_PATH, max_fds=config.SYZYGY_MAX_FDS)
+        except OSError as error:
+            LOG.warning('syzygy tables not available: %s', error)
+            _AVAILABLE = False
+            return None
+        if not _TABLEBASE.wdl or not _TABLEBASE.dtz:
+            LOG.warning('no syzygy tables in %s', config.SYZYGY_PATH)
+            _AVAILABLE = False
+            _TABLEBASE = None
+    return _TABLEBASE
+
+
+def _rank(tables: chess.syzygy.Tablebase, board: chess.Board, move: chess.Move) -> Tuple[int, int]:
+    """
+    :return: (wdl, progress) after the move for the side to move. Higher is better: a win with a zeroing move or a
+    short DTZ, a loss with a long DTZ
+    """
+    zeroing = board.is_zeroing(move)
+    board.push(move)
+    try:
+        if board.is_checkmate():
+            return 3, 0
+        wdl = -tables.probe_wdl(board)
+        dtz = -tables.probe_dtz(board)
+    finally:
+        board.pop()
+
+    if wdl > 0:
+        return wdl, 0 if zeroing else -dtz
+    return wdl, -dtz
+
+
+def best_move(board: chess.Board) -> Optional[chess.Move]:
+    """
+    :param board: chess.Board
+    :return: the DTZ optimal move, None if the position has too many pieces, castling rights or missing tables
+    """
+    if chess.popcount(board.occupied) > config.SYZYGY_MAX_PIECES or board.castling_rights or board.is_game_over():
+        return None
+    tables = tablebase()
+    if tables is None:
+        return None
+
+    probe = board.copy(stack=False)
+    try:
+        move = max(probe.legal_moves, key=lambda legal: _rank(tables, probe, legal))
+    except KeyError as error:  # chess.syzygy.MissingTableError
+        LOG.debug('syzygy: %s', error)
+        return None
+    LOG.debug('syzygy: %s', move.uci())
+    return move
+
+
+def close() -> None:
+    global _TABLEBASE
+    if _TABLEBASE is not None:
+        _TABLEBASE.close()
+        _TABLEBASE = None
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+
+import struct
+from types import SimpleNamespace
+
+import chess
+import chess.polyglot
+import pytest
+
+import book
+
+
+def polyglot_move(move):
+    return chess.square_file(move.to_square) | chess.square_rank(move.to_square) << 3 | \
+        chess.square_file(move.from_square) << 6 | chess.square_rank(move.from_square) << 9
+
+
+@pytest.fixture
+def book_path(tmp_path):
+    """Book with 1.e4 (weight 10) and 1.d4 (weight 1), and 1...e5 after 1.e4"""
+    board = chess.Board()
+    entries = [(chess.polyglot.zobrist_hash(board), chess.Move.from_uci('e2e4'), 10),
+               (chess.polyglot.zobrist_hash(board), chess.Move.from_uci('d2d4'), 1)]
+    board.push_uci('e2e4')
+    entries.append((chess.polyglot.zobrist_hash(board), chess.Move.from_uci('e7e5'), 1))
+    path = tmp_path / 'book.bin'
+    entries.sort(key=lambda entry: entry[0])
+    path.write_bytes(b''.join(struct.pack('>QHHI', key, polyglot_move(move), weight, 0) for key, move, weight in entries))
+    yield str(path)
+    book.close()
+
+
+def engine(path, max_plies=20, weighted=False):
+    return SimpleNamespace(book=SimpleNamespace(path=path, max_plies=max_plies, weighted=weighted))
+
+
+def test_book_move(book_path):
+    board = chess.Board()
+    assert book.book_move(engine(book_path), board) == chess.Move.from_uci('e2e4')
+    board.push_uci('e2e4')
+    assert book.book_move(engine(book_path), board) == chess.Move.from_uci('e7e5')
+    board.push_uci('e7e5')
+    assert book.book_move(engine(book_path), board) is None
+
+
+def test_weighted_choice(book_path):
+    moves = {book.book_move(engine(book_path, weighted=True), chess.Board()) for _ in range(50)}
+    assert moves <= {chess.Move.from_uci('e2e4'), chess.Move.from_uci('d2d4')}
+
+
+def test_no_book_moves_after_max_plies(book_path):
+    board = chess.Board()
+    board.push_uci('e2e4')
+    assert book.book_move(engine(book_path, max_plies=1), board) is None
+
+
+def test_missing_book(tmp_path):
+    path = str(tmp_path / 'missing.bin')
+    assert book.reader(path) is None
+    assert book.book_move(engine(path), chess.Board()) is None
+    book.close()
+
+
+def test_engine_without_book():
+    assert book.book_move(SimpleNamespace(book=None), chess.Board()) is None
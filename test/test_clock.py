@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+
+import chess
+import chess.pgn
+import pytest
+import clock
+import config
+from clock import ChessClock, format_time, parse_time
+
+
+@pytest.fixture
+def now(monkeypatch):
+    """Clock time set by the test"""
+    time = [100.0]
+    monkeypatch.setattr(clock, 'monotonic', lambda: time[0])
+    return time
+
+
+def test_format_and_parse():
+    assert format_time(65) == '1:05'
+    assert format_time(0.2) == '0:01'
+    assert format_time(-3) == '0:00'
+    assert format_time(3725) == '1:02:05'
+    assert parse_time('1:02:05') == 3725
+    assert parse_time('0:30') == 30
+
+
+def test_increment(now):
+    chess_clock = ChessClock(config.TimeControl(minutes=5, increment=3))
+    chess_clock.start(chess.WHITE)
+    now[0] += 10
+    assert chess_clock.time_left(chess.WHITE) == 290
+    chess_clock.start(chess.BLACK)
+    assert chess_clock.remaining[chess.WHITE] == 293
+    assert chess_clock.running == chess.BLACK
+
+
+def test_delay(now):
+    chess_clock = ChessClock(config.TimeControl(minutes=5, delay=5))
+    chess_clock.start(chess.WHITE)
+    now[0] += 4
+    assert chess_clock.time_left(chess.WHITE) == 300
+    now[0] += 3
+    assert chess_clock.time_left(chess.WHITE) == 298
+    chess_clock.press()
+    assert chess_clock.remaining[chess.WHITE] == 298
+    assert chess_clock.running is None
+
+
+def test_pause_is_free(now):
+    chess_clock = ChessClock(config.TimeControl(minutes=1))
+    chess_clock.start(chess.WHITE)
+    now[0] += 10
+    chess_clock.pause()
+    now[0] += 20
+    assert chess_clock.time_left(chess.WHITE) == 50
+    chess_clock.start(chess.WHITE)
+    now[0] += 5
+    assert chess_clock.time_left(chess.WHITE) == 45
+
+
+def test_flag_and_no_increment_afterwards(now):
+    chess_clock = ChessClock(config.TimeControl(minutes=1, increment=2))
+    chess_clock.start(chess.BLACK)
+    now[0] += 61
+    assert chess_clock.flagged() == chess.BLACK
+    chess_clock.press()
+    assert chess_clock.remaining[chess.BLACK] == -1
+    assert chess_clock.result(chess.Board()) == '1-0'
+
+
+def test_flag_against_a_lone_king_is_a_draw(now):
+    chess_clock = ChessClock(config.TimeControl(minutes=1))
+    chess_clock.start(chess.WHITE)
+    now[0] += 60
+    assert chess_clock.result(chess.Board('4k3/8/8/8/8/8/4P3/4K3 w - - 0 1')) == '1/2-1/2'
+
+
+def test_headers_restore(now):
+    chess_clock = ChessClock(config.TimeControl(minutes=10, delay=2))
+    chess_clock.start(chess.WHITE)
+    now[0] += 32
+    headers = chess_clock.headers()
+    assert headers == {'TimeControl': '600d2', 'WhiteClock': '9:30', 'BlackClock': '10:00'}
+    restored = ChessClock(config.TimeControl(minutes=10, delay=2))
+    restored.restore(chess.pgn.Headers(**headers))
+    assert restored.remaining[chess.WHITE] == 570
+
+
+def test_limit_counts_the_delay_as_increment(now):
+    chess_clock = ChessClock(config.TimeControl(minutes=3, increment=1, delay=2))
+    limit = chess_clock.limit()
+    assert (limit.white_clock, limit.black_clock, limit.white_inc, limit.black_inc) == (180, 180, 3, 3)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+
+import chess
+import config
+from engine_cache import EngineCache, RECORD, decode_move, encode_move
+
+
+def test_move_encoding():
+    for uci in ('e2e4', 'a7a8q', 'h2h1n'):
+        move = chess.Move.from_uci(uci)
+        assert decode_move(encode_move(move)) == move
+    assert encode_move(None) == 0
+    assert decode_move(0) is None
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'engine.cache')
+    board = chess.Board()
+    cache = EngineCache(path=path, size=8)
+    assert cache.get(board, config.STOCKFISH, 5) is None
+    cache.put(board, config.STOCKFISH, 5, chess.Move.from_uci('e2e4'), chess.Move.from_uci('e7e5'), 30)
+
+    reloaded = EngineCache(path=path, size=8)
+    result = reloaded.get(board, config.STOCKFISH, 5)
+    assert result.move == chess.Move.from_uci('e2e4')
+    assert result.ponder == chess.Move.from_uci('e7e5')
+    assert result.score == 30
+    assert reloaded.get(board, config.STOCKFISH, 10) is None
+    assert (reloaded.hits, reloaded.misses) == (1, 1)
+
+
+def test_without_ponder_and_score(tmp_path):
+    board = chess.Board()
+    cache = EngineCache(path=str(tmp_path / 'engine.cache'), size=8)
+    cache.put(board, config.STOCKFISH, '5+0', chess.Move.from_uci('d2d4'))
+    result = cache.get(board, config.STOCKFISH, '5+0')
+    assert result.ponder is None
+    assert result.score is None
+
+
+def test_half_record_is_ignored(tmp_path):
+    path = tmp_path / 'engine.cache'
+    board = chess.Board()
+    EngineCache(path=str(path), size=8).put(board, config.STOCKFISH, 5, chess.Move.from_uci('e2e4'))
+    with open(str(path), 'ab') as file:
+        file.write(b'\x01\x02\x03')
+    assert EngineCache(path=str(path), size=8).get(board, config.STOCKFISH, 5).move == chess.Move.from_uci('e2e4')
+
+
+def test_least_recently_used_are_dropped_and_the_log_compacted(tmp_path):
+    path = tmp_path / 'engine.cache'
+    cache = EngineCache(path=str(path), size=2)
+    boards = []
+    board = chess.Board()
+    for san in ('e4', 'e5', 'Nf3', 'Nc6', 'Bb5'):
+        move = board.parse_san(san)
+        boards.append(board.copy())
+        cache.put(board, config.STOCKFISH, 5, move)
+        board.push(move)
+
+    assert path.stat().st_size % RECORD.size == 0
+    assert path.stat().st_size // RECORD.size <= 2 * cache.size
+    reloaded = EngineCache(path=str(path), size=2)
+    assert reloaded.get(boards[0], config.STOCKFISH, 5) is None
+    assert reloaded.get(boards[-1], config.STOCKFISH, 5).move == chess.Move.from_uci('f1b5')
+    assert reloaded.get(boards[-2], config.STOCKFISH, 5).move == chess.Move.from_uci('b8c6')
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+
+import threading
+from types import SimpleNamespace
+
+import chess.engine
+import pytest
+
+import engine_pool
+from engine_pool import EnginePool
+
+
+class FakeEngine:
+    """Engine process that only records its options"""
+    def __init__(self, path):
+        self.path = path
+        self.options = {'Hash': None, 'Threads': None, 'Ponder': None, 'Skill Level': None}
+        self.configured = []
+        self.quit_called = threading.Event()
+
+    def configure(self, options):
+        self.configured.append(options)
+
+    def quit(self):
+        self.quit_called.set()
+
+
+def setup(name, hash_size=16, **options):
+    level = options.pop('level', 'no levels')
+    return SimpleNamespace(name=name, path=name.lower(), extra_options=dict(options, Hash=hash_size),
+                           options={'level': SimpleNamespace(name='Skill Level', value=level)})
+
+
+@pytest.fixture
+def started(monkeypatch):
+    """paths of the started engines"""
+    paths = []
+
+    def popen_uci(path):
+        if path == 'broken':
+            raise FileNotFoundError(path)
+        paths.append(path)
+        return FakeEngine(path)
+
+    monkeypatch.setattr(chess.engine.SimpleEngine, 'popen_uci', popen_uci)
+    return paths
+
+
+def test_engine_stays_warm_between_games(started):
+    pool = EnginePool(budget=400)
+    stockfish = setup('Stockfish', level=20)
+    engine = pool.acquire(stockfish)
+    assert engine.configured == [{'Hash': 16, 'Skill Level': 20}]
+    pool.release(engine)
+    assert pool.acquire(stockfish) is engine
+    assert started == ['stockfish']
+
+
+def test_idle_engines_are_stopped_for_memory(started):
+    pool = EnginePool(budget=320)
+    stockfish = pool.acquire(setup('Stockfish', hash_size=128))
+    pool.release(stockfish)
+    rodent = pool.acquire(setup('Rodent', hash_size=128))
+    assert not stockfish.quit_called.is_set()
+    pool.release(rodent)
+    pool.acquire(setup('Komodo', hash_size=128))
+    assert stockfish.quit_called.wait(2)
+    assert not rodent.quit_called.is_set()
+    assert pool.used() == 2 * (128 + 24)
+
+
+def test_engines_in_use_are_not_stopped(started):
+    pool = EnginePool(budget=100)
+    stockfish = pool.acquire(setup('Stockfish', hash_size=64))
+    pool.prefetch(setup('Rodent', hash_size=64))
+    assert started == ['stockfish']
+    assert not stockfish.quit_called.is_set()
+
+
+def test_start_error(started):
+    pool = EnginePool(budget=400)
+    broken = setup('Broken')
+    with pytest.raises(FileNotFoundError):
+        pool.acquire(broken)
+    assert pool.used() == 0
+
+
+def test_shutdown(started):
+    pool = EnginePool(budget=400)
+    engine = pool.acquire(setup('Stockfish'))
+    pool.prefetch(setup('Rodent'))
+    pool.shutdown()
+    assert engine.quit_called.is_set()
+    assert pool.used() == 0
+
+
+def test_engine_config_leaves_managed_options_out():
+    engine = FakeEngine('stockfish')
+    options = engine_pool.engine_config(setup('Stockfish', Ponder=True, Contempt=10), engine)
+    assert options == {'Hash': 16}
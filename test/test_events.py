@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+
+import os
+import threading
+
+import pytest
+
+from events import Dispatcher, EventType
+
+
+@pytest.fixture
+def dispatcher():
+    return Dispatcher(size=4)
+
+
+def test_events_are_never_dropped(dispatcher):
+    for square in range(10):
+        dispatcher.post(EventType.REED, square)
+    squares = [dispatcher.wait_for(EventType.REED, timeout=0).data for _ in range(10)]
+    assert squares == list(range(10))
+    assert dispatcher.wait_for(EventType.REED, timeout=0) is None
+
+
+def test_only_the_last_progress_counts(dispatcher):
+    dispatcher.post(EventType.ENGINE_INFO, 1)
+    dispatcher.post(EventType.REED, 'e2')
+    dispatcher.post(EventType.ENGINE_INFO, 2)
+    dispatcher.post(EventType.REED, 'e4')
+    assert dispatcher.wait_for(EventType.ENGINE_INFO, timeout=0).data == 2
+    assert dispatcher.wait_for(EventType.ENGINE_INFO, timeout=0) is None
+    assert [dispatcher.wait_for(EventType.REED, timeout=0).data for _ in range(2)] == ['e2', 'e4']
+
+
+def test_other_events_are_dispatched_while_waiting(dispatcher):
+    handled = []
+    dispatcher.register(EventType.BUTTON, lambda event: handled.append(event.data))
+    dispatcher.post(EventType.BUTTON, 'menu')
+    dispatcher.post(EventType.SHUTDOWN)  # no handler, stays in the queue
+    assert dispatcher.wait_for(EventType.REED, timeout=0) is None
+    assert handled == ['menu']
+    assert dispatcher.wait_for(EventType.SHUTDOWN, timeout=0, dispatch=False) is not None
+
+
+def test_handlers_per_state(dispatcher):
+    state = ['menu']
+    handled = []
+    dispatcher.bind_state(lambda: state[0])
+    dispatcher.register(EventType.REED, lambda event: handled.append('ignored'), states=['menu'])
+    dispatcher.post(EventType.REED)
+    dispatcher.wait_for(EventType.BUTTON, timeout=0)
+    state[0] = 'game'
+    dispatcher.post(EventType.REED)
+    dispatcher.wait_for(EventType.BUTTON, timeout=0)
+    assert handled == ['ignored']
+    assert dispatcher.wait_for(EventType.REED, timeout=0) is not None
+
+
+def test_timers(dispatcher):
+    dispatcher.set_timer('clock', 0.01)
+    dispatcher.set_timer('autoshutdown', 0.02)
+    dispatcher.cancel_timer('autoshutdown')
+    assert dispatcher.wait_for(EventType.TIMER, timeout=1).data == 'clock'
+    assert dispatcher.wait_for(EventType.TIMER, timeout=0.05) is None
+
+
+def test_wakeup_from_another_thread(dispatcher):
+    threading.Timer(0.01, dispatcher.wakeup).start()
+    assert dispatcher.wait_for(EventType.REED, timeout=2) is None
+
+
+def test_wakeup_before_the_wait_is_not_lost(dispatcher):
+    dispatcher.wakeup()
+    assert dispatcher.wait_for(EventType.REED, timeout=None, dispatch=True) is None
+
+
+def test_reader(dispatcher):
+    read_fd, write_fd = os.pipe()
+    dispatcher.add_reader(read_fd, lambda: dispatcher.post(EventType.REED, os.read(read_fd, 1)))
+    os.write(write_fd, b'x')
+    assert dispatcher.wait_for(EventType.REED, timeout=1).data == b'x'
+    dispatcher.remove_reader(read_fd)
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+def test_discard(dispatcher):
+    dispatcher.post(EventType.REED)
+    dispatcher.post(EventType.REED)
+    dispatcher.discard(EventType.REED)
+    assert dispatcher.wait_for(EventType.REED, timeout=0) is None
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+
+import pytest
+
+import governor
+from governor import Level, PonderGovernor, ResourceGovernor, Sample
+
+
+class FixedResources(ResourceGovernor):
+    """Resources at a fixed level, no sampling"""
+    def __init__(self, level=Level.NORMAL):
+        super().__init__()
+        self.level = level
+
+    def update(self):
+        return self.level
+
+
+@pytest.fixture
+def resources():
+    return FixedResources()
+
+
+def test_no_moves_yet(resources):
+    ponder = PonderGovernor(resources, max_time=60, min_tries=5, min_hit_rate=0.25, window=20)
+    assert ponder.hit_rate is None
+    assert ponder.budget(10) == 10
+    assert 'hit rate=-' in str(ponder)
+
+
+def test_budget_is_limited_by_max_time(resources):
+    assert PonderGovernor(resources, max_time=60).budget(90) == 60
+
+
+def test_no_pondering_on_an_unpredictable_player(resources):
+    ponder = PonderGovernor(resources, max_time=60, min_tries=5, min_hit_rate=0.25, window=20)
+    for _ in range(4):
+        ponder.record(False)
+    assert ponder.budget(10) == 10  # not enough tries yet
+    ponder.record(False)
+    assert ponder.hit_rate == 0
+    assert ponder.budget(10) == 0
+
+
+def test_pondering_comes_back_within_the_window(resources):
+    ponder = PonderGovernor(resources, max_time=60, min_tries=2, min_hit_rate=0.5, window=4)
+    for hit in (False, False, True, True, True):
+        ponder.record(hit)
+    assert ponder.hit_rate == 0.75
+    assert ponder.budget(10) == 10
+
+
+def test_no_pondering_when_warm():
+    ponder = PonderGovernor(FixedResources(Level.WARM))
+    assert ponder.budget(10) == 0
+
+
+def test_time_used(resources):
+    ponder = PonderGovernor(resources)
+    ponder.used(1.5)
+    ponder.used(2)
+    assert ponder.time_used == 3.5
+
+
+@pytest.fixture
+def sampled(monkeypatch):
+    """ResourceGovernor on a fixed sample"""
+    sample = Sample(temperature=50, throttled=0, memory=512)
+    monkeypatch.setattr(governor, 'read_temperature', lambda: sample.temperature)
+    monkeypatch.setattr(governor, 'read_throttled', lambda: sample.throttled)
+    monkeypatch.setattr(governor, 'read_memory', lambda: sample.memory)
+    return sample
+
+
+@pytest.mark.parametrize('temperature, throttled, level', [
+    (50, 0, Level.NORMAL),
+    (None, None, Level.NORMAL),
+    (72, 0, Level.WARM),
+    (50, governor.SOFT_TEMPERATURE_LIMIT, Level.WARM),
+    (80, 0, Level.CRITICAL),
+    (50, governor.UNDER_VOLTAGE, Level.CRITICAL),
+])
+def test_levels(sampled, temperature, throttled, level):
+    sampled.temperature, sampled.throttled = temperature, throttled
+    assert ResourceGovernor().update() == level
+
+
+def test_samples_within_the_interval(sampled):
+    resources = ResourceGovernor(interval=3600)
+    assert resources.update() == Level.NORMAL
+    sampled.temperature = 80
+    assert resources.update() == Level.NORMAL
+
+
+def test_movetime(sampled):
+    sampled.temperature = 80
+    resources = ResourceGovernor()
+    assert resources.movetime(20) == 5
+    assert resources.movetime(4) == 2  # config.MOVETIME_MIN
+    assert resources.movetime(1) == 1
+
+
+def test_engine_options(sampled):
+    options = {'Threads': 4, 'Hash': 256, 'Ponder': True}
+    assert ResourceGovernor().engine_options(options) == options
+    sampled.temperature, sampled.memory = 72, 32
+    assert ResourceGovernor().engine_options(options) == {'Threads': 2, 'Hash': 128, 'Ponder': True}
+    sampled.temperature = 80
+    assert ResourceGovernor().engine_options(options)['Threads'] == 1
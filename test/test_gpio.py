@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+
+import pytest
+
+import gpio
+from gpio_backends import MockBackend
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    mock = MockBackend()
+    monkeypatch.setattr(gpio, '_BACKEND', mock)
+    monkeypatch.setattr(gpio, 'SPI_BUTTONS', None)
+    monkeypatch.setattr(gpio, '_MCP_SHADOW', {})
+    gpio.init_buttons()
+    mock.transactions.clear()
+    return mock
+
+
+def spi_writes(backend):
+    return [item.data for item in backend.transactions if item.device == 'spi 0.0']
+
+
+def test_unchanged_button_leds_are_not_written(backend):
+    gpio.set_button_led(0x05)
+    gpio.set_button_led(0x05)
+    gpio.set_button_led(0x00)
+    assert spi_writes(backend) == [[gpio.MCP_WRITE, gpio.GPIOB, 0x05], [gpio.MCP_WRITE, gpio.GPIOB, 0x00]]
+
+
+def test_forced_write(backend):
+    gpio.mcp23s17_write_register(gpio.GPINTENA, 0xFF, force=True)
+    assert len(spi_writes(backend)) == 1
+
+
+def test_burst_write_updates_the_shadow(backend):
+    gpio.mcp23s17_write_registers(gpio.DEFVALA, [0x00, 0x00])
+    gpio.mcp23s17_write_register(gpio.DEFVALB, 0x00)
+    assert spi_writes(backend) == [[gpio.MCP_WRITE, gpio.DEFVALA, 0x00, 0x00]]
+    assert backend.responders[(0, 0)].registers[gpio.DEFVALB] == 0x00
+
+
+def test_burst_read_is_one_transaction(backend):
+    chip = backend.responders[(0, 0)].registers
+    chip[gpio.INTFA], chip[gpio.INTFB], chip[gpio.INTCAPA] = 0x04, 0x00, 0xFB
+    assert gpio.mcp23s17_read_registers(gpio.INTFA, 3) == [0x04, 0x00, 0xFB]
+    assert len(spi_writes(backend)) == 1
+
+
+def test_reset_forgets_the_shadow(backend):
+    gpio.set_button_led(0x01)
+    gpio.button_reset()
+    gpio.set_button_led(0x01)
+    assert len(spi_writes(backend)) == 2
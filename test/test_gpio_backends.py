@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+
+import pytest
+
+import gpio
+import gpio_backends
+import serial_arduino
+from gpio_backends import FALLING, HIGH, LOW, MockBackend
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    mock = MockBackend()
+    monkeypatch.setattr(gpio, '_BACKEND', mock)
+    monkeypatch.setattr(serial_arduino, '_SER', None)
+    return mock
+
+
+def test_create_unknown_backend():
+    with pytest.raises(ValueError):
+        gpio_backends.create('parport')
+
+
+def test_inputs_read_high_without_pull_down():
+    mock = MockBackend()
+    mock.setup_input(5)
+    mock.setup_input(6, pull_down=True)
+    assert mock.read(5) == HIGH
+    assert mock.read(6) == LOW
+
+
+def test_callbacks_run_on_their_edge():
+    mock = MockBackend()
+    mock.setup_input(25, pull_down=True)
+    pins = []
+    mock.add_callback(25, FALLING, pins.append)
+    mock.set_input(25, HIGH)
+    mock.set_input(25, LOW)
+    mock.set_input(25, LOW)
+    assert pins == [25]
+
+
+def test_delay_only_moves_the_virtual_clock():
+    mock = MockBackend()
+    mock.delay(3600)
+    assert mock.clock == 3600
+
+
+def test_mcp23s17_registers():
+    mock = MockBackend()
+    spi = mock.spi(0, 0, 10000000)
+    spi.xfer2([0x40, 0x0D, 0xFF])  # GPPUB
+    assert spi.xfer2([0x41, 0x0D, 0]) == [0, 0, 0xFF]
+    assert spi.xfer2([0x41, 0x12, 0]) == [0, 0, 0xFF]  # no button pressed
+    assert mock.transactions[0].device == 'spi 0.0'
+    assert mock.transactions[0].duration == pytest.approx(24 / 10000000)
+
+
+def test_uart_waits_for_the_complete_packet():
+    mock = MockBackend()
+    uart = mock.uart('/dev/ttyAMA0', 115200, timeout=0.05)
+    uart.write(b'<A\x02\x03')
+    uart.write(b'\x01>\x02')
+    assert uart.read(1) == b''
+    uart.write(b'\x03>')
+    assert uart.read_until(b'>') == b'<\x02>'
+    assert mock.arduino.slots[2] == b'\x01>\x02'
+
+
+def test_unsolicited_bytes_are_flushed():
+    mock = MockBackend()
+    uart = mock.uart('/dev/ttyAMA0', 115200, timeout=0.05)
+    uart.answer(b'Not a start char')
+    uart.flushInput()
+    assert uart.read(1) == b''
+
+
+def test_serial_arduino_on_the_mock(backend):
+    assert serial_arduino.say_hello() is True
+    backend.arduino.flag = serial_arduino.ReasonInterrupt.MOVE.value
+    backend.arduino.move = 28
+    assert serial_arduino.get_interrupt_reason() is serial_arduino.ReasonInterrupt.MOVE
+    assert serial_arduino.get_interrupt_reason() is serial_arduino.ReasonInterrupt.NONE
+    assert serial_arduino.new_detected_move() == 28
+    assert serial_arduino.new_detected_move() == 100
+    assert serial_arduino.upload_animation(1, bytes([4, 5, 6])) is True
+    serial_arduino.send_led_frame(bytes([1, 0, 2, 255, 0, 0]))
+    assert backend.arduino.frames == [bytes([1, 0, 2, 255, 0, 0])]
+
+
+def test_board_rows(backend):
+    backend.arduino.board = [0xFF, 0, 0, 0, 0, 0, 0, 0]
+    assert serial_arduino.ask_board() == serial_arduino.make_square_set([0xFF, 0, 0, 0, 0, 0, 0, 0])
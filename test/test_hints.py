@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+
+import chess
+import chess.engine
+import chess.pgn
+
+from hints import HintCache, score_text
+
+
+def line(score, *moves, mate=False):
+    value = chess.engine.Mate(score) if mate else chess.engine.Cp(score)
+    return {'score': chess.engine.PovScore(value, chess.WHITE), 'pv': [chess.Move.from_uci(move) for move in moves]}
+
+
+def test_score_text():
+    assert score_text(None) == ''
+    assert score_text(chess.engine.Cp(35)) == '+0.35'
+    assert score_text(chess.engine.Cp(-120)) == '-1.20'
+    assert score_text(chess.engine.Mate(3)) == '#3'
+
+
+def test_hints_best_first():
+    cache = HintCache()
+    board = chess.Board()
+    cache.put(board, [line(40, 'e2e4', 'e7e5'), line(30, 'd2d4'), {'depth': 10}])
+    assert [hint.move.uci() for hint in cache.get(board)] == ['e2e4', 'd2d4']
+    assert cache.best(board).score == chess.engine.Cp(40)
+    assert cache.best(board).pv == [chess.Move.from_uci('e2e4'), chess.Move.from_uci('e7e5')]
+
+
+def test_score_for_the_side_to_move():
+    cache = HintCache()
+    board = chess.Board()
+    board.push_uci('e2e4')
+    score = chess.engine.PovScore(chess.engine.Cp(25), chess.BLACK)
+    cache.put(board, [{'score': score, 'pv': [chess.Move.from_uci('e7e5')]}])
+    assert score.white() == chess.engine.Cp(-25)
+    assert cache.best(board).score == chess.engine.Cp(25)
+
+
+def test_unknown_position():
+    cache = HintCache()
+    cache.put(chess.Board(), [])
+    assert cache.get(chess.Board()) == []
+    assert cache.best(chess.Board()) is None
+
+
+def test_least_recently_used_positions_are_dropped():
+    cache = HintCache(size=2)
+    boards = []
+    for uci in ('e2e4', 'd2d4', 'c2c4'):
+        board = chess.Board()
+        board.push_uci(uci)
+        cache.put(board, [line(0, 'g8f6')])
+        boards.append(board)
+    assert cache.best(boards[0]) is None
+    assert cache.best(boards[2]) is not None
+    assert str(cache) == 'HintCache: 2 positions'
+
+
+def test_annotate_the_moves_of_the_player():
+    cache = HintCache()
+    board = chess.Board()
+    cache.put(board, [line(40, 'e2e4')])
+    board.push_uci('d2d4')
+    cache.put(board, [line(-30, 'd7d5')])
+    board.push_uci('g8f6')
+    cache.put(board, [line(2, 'c2c4', mate=True)])
+    board.push_uci('c2c4')
+    pgn = chess.pgn.Game.from_board(board)
+    cache.annotate(pgn, chess.WHITE)
+    assert [node.comment for node in pgn.mainline()] == ['Best: e4 +0.40', '', '']
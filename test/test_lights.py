@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+
+from unittest import mock
+
+import gpio
+import led_animations
+import lights
+import serial_arduino
+from gpio_backends import MockBackend
+from lights import MAX_RUN, LedMatrix, encode_runs, square_leds
+
+RED = (255, 0, 0)
+BLUE = (0, 0, 255)
+
+
+def test_no_changes():
+    assert encode_runs([]) == bytes([0])
+
+
+def test_consecutive_leds_with_the_same_color_are_one_run():
+    assert encode_runs([(3, RED), (4, RED), (5, RED)]) == bytes([1, 3, 3, 255, 0, 0])
+
+
+def test_gap_or_other_color_starts_a_run():
+    changed = [(0, RED), (1, BLUE), (3, BLUE)]
+    assert encode_runs(changed) == bytes([3, 0, 1, 255, 0, 0, 1, 1, 0, 0, 255, 3, 1, 0, 0, 255])
+
+
+def test_long_runs_are_split():
+    changed = [(index, RED) for index in range(MAX_RUN + 1)]
+    assert encode_runs(changed) == bytes([2, 0, MAX_RUN, 255, 0, 0, MAX_RUN, 1, 255, 0, 0])
+
+
+def test_square_leds():
+    assert square_leds(0) == (0, 1, 9, 10)
+    assert square_leds(63) == (70, 71, 79, 80)
+
+
+def test_show_sends_only_changes():
+    matrix = LedMatrix()
+    with mock.patch.object(lights.serial_arduino, 'send_led_frame') as send:
+        matrix.set_square(0, RED)
+        assert matrix.show() == 4
+        send.assert_called_once_with(bytes([2, 0, 2, 255, 0, 0, 9, 2, 255, 0, 0]))
+        assert matrix.show() == 0
+        matrix.invalidate([0])
+        assert matrix.show() == 4
+        assert matrix.show(force=True) == 81
+
+
+def test_play_uploads_the_animations_first(monkeypatch):
+    backend = MockBackend()
+    monkeypatch.setattr(gpio, '_BACKEND', backend)
+    monkeypatch.setattr(serial_arduino, '_SER', None)
+    monkeypatch.setattr(lights, '_uploaded', False)
+    monkeypatch.setattr(lights, '_animating', [])
+    lights.blink_square(0)
+    assert set(backend.arduino.slots) == {animation.slot for animation in led_animations.ANIMATIONS}
+    lights.clear_leds()
+    assert backend.arduino.frames == [bytes([2, 0, 2, 0, 0, 0, 9, 2, 0, 0, 0])]  # the blinking leds off again
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+
+import threading
+
+from link_stats import BUCKETS, CommandStats, LinkStats
+
+
+def test_histogram_buckets():
+    stats = CommandStats()
+    for elapsed in (0.5, 1.5, 4, 4, 700, 2500):
+        stats.add(elapsed)
+    assert stats.count == 6
+    assert stats.histogram[0] == 1  # <= 1 ms
+    assert stats.histogram[BUCKETS.index(5)] == 2
+    assert stats.histogram[-1] == 1  # slower than the last bucket
+    assert stats.max_ms == 2500
+
+
+def test_percentiles():
+    stats = CommandStats()
+    assert stats.percentile(0.5) is None
+    for elapsed in (3, 3, 3, 15):
+        stats.add(elapsed)
+    assert stats.percentile(0.5) == 5
+    assert stats.percentile(0.95) == 20
+    stats.add(5000)
+    assert stats.percentile(1.0) == 5000
+
+
+def test_retries_and_timeouts_of_a_round_trip():
+    stats = LinkStats()
+    with stats.round_trip(b'B'):
+        stats.sent(b'B', 3)
+        stats.received(0, timeout=True)
+        stats.sent(b'B', 3)
+        stats.received(10)
+    stats.flushed()
+    snapshot = stats.snapshot()
+    assert snapshot['bytes_out'] == 6
+    assert snapshot['bytes_in'] == 10
+    assert snapshot['flushes'] == 1
+    assert snapshot['timeouts'] == 1
+    assert snapshot['commands']['B']['count'] == 1
+    assert snapshot['commands']['B']['retries'] == 1
+    assert snapshot['commands']['B']['timeouts'] == 1
+
+
+def test_commands_outside_a_round_trip_are_no_retries():
+    stats = LinkStats()
+    stats.sent(b'U', 10)
+    stats.sent(b'U', 10)
+    assert stats.snapshot()['commands'] == {}
+    assert stats.bytes_out == 20
+
+
+def test_round_trips_per_thread():
+    stats = LinkStats()
+    inside = threading.Event()
+    done = threading.Event()
+
+    def other_thread():
+        with stats.round_trip(b'F'):
+            inside.set()
+            done.wait(2)
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    inside.wait(2)
+    with stats.round_trip(b'M'):
+        stats.sent(b'M', 3)
+        stats.sent(b'M', 3)
+    done.set()
+    thread.join(2)
+    snapshot = stats.snapshot()['commands']
+    assert snapshot['M']['retries'] == 1
+    assert snapshot['F']['retries'] == 0
+
+
+def test_summary_and_reset():
+    stats = LinkStats()
+    with stats.round_trip(b'H'):
+        stats.sent(b'H', 3)
+    assert 'H:n=1' in stats.summary()
+    stats.reset()
+    assert stats.snapshot()['commands'] == {}
+    assert stats.bytes_out == 0
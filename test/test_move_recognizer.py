@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+
+import chess
+from move_recognizer import MoveRecognizer, Status, move_sequences, preferred, resolve
+from position_index import PositionIndex
+
+
+def feed(recognizer: MoveRecognizer, *names: str) -> Status:
+    status = Status.WAITING
+    for name in names:
+        status = recognizer.feed(chess.SQUARE_NAMES.index(name))
+    return status
+
+
+def test_quiet_move():
+    recognizer = MoveRecognizer(PositionIndex(chess.Board()))
+    assert feed(recognizer, 'e2') == Status.PARTIAL
+    assert feed(recognizer, 'e4') == Status.COMPLETE
+    assert recognizer.moves == [chess.Move.from_uci('e2e4')]
+    assert not recognizer.expected()
+
+
+def test_piece_put_back():
+    recognizer = MoveRecognizer(PositionIndex(chess.Board()))
+    assert feed(recognizer, 'g1', 'g1') == Status.WAITING
+    assert recognizer.history == [chess.G1, chess.G1]
+
+
+def test_change_that_does_not_fit():
+    recognizer = MoveRecognizer(PositionIndex(chess.Board()))
+    assert feed(recognizer, 'e4') == Status.INVALID
+    assert recognizer.events == []
+    assert recognizer.history == [chess.E4]
+
+
+def test_capture_in_both_orders():
+    board = chess.Board('rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2')
+    capture = chess.Move.from_uci('e4d5')
+    for order in (('e4', 'd5', 'd5'), ('d5', 'e4', 'd5')):
+        recognizer = MoveRecognizer(PositionIndex(board))
+        assert feed(recognizer, *order) == Status.COMPLETE
+        assert recognizer.moves == [capture]
+
+
+def test_castling_rook_first():
+    board = chess.Board('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1')
+    recognizer = MoveRecognizer(PositionIndex(board))
+    assert feed(recognizer, 'h1', 'f1', 'e1') == Status.PARTIAL
+    assert feed(recognizer, 'g1') == Status.COMPLETE
+    assert recognizer.moves == [chess.Move.from_uci('e1g1')]
+
+
+def test_king_first_castling():
+    board = chess.Board('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1')
+    recognizer = MoveRecognizer(PositionIndex(board))
+    assert feed(recognizer, 'e1', 'f1') == Status.COMPLETE
+    assert recognizer.moves == [chess.Move.from_uci('e1f1')]
+    assert feed(recognizer, 'f1', 'g1') == Status.PARTIAL
+    assert recognizer.expected() == [chess.H1]
+    assert feed(recognizer, 'h1', 'f1') == Status.COMPLETE
+    assert recognizer.moves == [chess.Move.from_uci('e1g1')]
+
+
+def test_en_passant_sequences():
+    board = chess.Board('4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2')
+    index = PositionIndex(board)
+    sequences = move_sequences(index, chess.Move.from_uci('e5d6'))
+    assert len(sequences) == 3
+    assert all(sorted(sequence) == sorted((chess.E5, chess.D6, chess.D5)) for sequence in sequences)
+
+
+def test_promotion_prefers_a_queen():
+    board = chess.Board('8/4P3/8/8/8/8/k7/4K3 w - - 0 1')
+    recognizer = MoveRecognizer(PositionIndex(board))
+    assert feed(recognizer, 'e7', 'e8') == Status.COMPLETE
+    assert len(recognizer.moves) == 4
+    assert preferred(recognizer.moves) == chess.Move.from_uci('e7e8q')
+
+
+def test_promotion_with_the_swap():
+    board = chess.Board('8/4P3/8/8/8/8/k7/4K3 w - - 0 1')
+    recognizer = MoveRecognizer(PositionIndex(board))
+    assert feed(recognizer, 'e7', 'e8') == Status.COMPLETE
+    assert recognizer.expected() == [chess.E8]
+    assert feed(recognizer, 'e8') == Status.PARTIAL  # pawn lifted again for the swap, not put back
+    assert feed(recognizer, 'e8') == Status.COMPLETE
+    assert not recognizer.expected()
+    assert preferred(recognizer.moves) == chess.Move.from_uci('e7e8q')
+
+
+def test_capture_promotion_sequences():
+    board = chess.Board('3r4/4P3/8/8/8/8/k7/4K3 w - - 0 1')
+    sequences = move_sequences(PositionIndex(board), chess.Move.from_uci('e7d8q'))
+    assert sorted(sequences) == sorted([
+        (chess.E7, chess.D8, chess.D8), (chess.D8, chess.E7, chess.D8),
+        (chess.E7, chess.D8, chess.D8, chess.D8, chess.D8), (chess.D8, chess.E7, chess.D8, chess.D8, chess.D8)])
+
+
+def test_computer_promotion_is_complete_after_the_swap():
+    board = chess.Board('8/4P3/8/8/8/8/k7/4K3 w - - 0 1')
+    move = chess.Move.from_uci('e7e8q')
+    recognizer = MoveRecognizer(PositionIndex(board), moves=[move])
+    assert feed(recognizer, 'e7', 'e8', 'e8', 'e8') == Status.COMPLETE
+    assert recognizer.moves == [move]
+    undo = MoveRecognizer(PositionIndex(board), moves=[move], undo=True)
+    assert feed(undo, 'e8', 'e7') == Status.COMPLETE
+
+
+def test_undo():
+    board = chess.Board()
+    move = chess.Move.from_uci('e2e4')
+    recognizer = MoveRecognizer(PositionIndex(board), moves=[move], undo=True)
+    assert feed(recognizer, 'e4', 'e2') == Status.COMPLETE
+    assert recognizer.moves == [move]
+
+
+def test_note_keeps_the_order():
+    recognizer = MoveRecognizer(PositionIndex(chess.Board()))
+    feed(recognizer, 'e2')
+    recognizer.note([chess.D5])
+    feed(recognizer, 'e4')
+    assert recognizer.history == [chess.E2, chess.D5, chess.E4]
+
+
+def test_resolve_latest_target():
+    candidates = [chess.Move.from_uci('d4c6'), chess.Move.from_uci('d4e6')]
+    assert resolve(candidates, [chess.D4, chess.C6, chess.E6]) == candidates[1]
+    assert resolve(candidates, [chess.D4, chess.E6, chess.C6]) == candidates[0]
+    assert resolve(candidates, [chess.D4]) is None
+    assert resolve([], [chess.D4]) is None
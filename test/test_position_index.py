@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+
+import chess
+import position_index
+from position_index import PositionIndex
+
+
+def test_indexes_of_the_start_position():
+    index = PositionIndex(chess.Board())
+    assert len(index.moves) == 20
+    assert index.can_move(chess.G1)
+    assert not index.can_move(chess.E1)
+    assert set(index.targets_of(chess.G1)) == {chess.F3, chess.H3}
+    assert len(index.moves_from(chess.E2)) == 2
+
+
+def test_move_flags():
+    board = chess.Board('r3k2r/8/8/3pP3/8/6p1/8/R3K2R w KQkq d6 0 2')
+    index = PositionIndex(board)
+    assert index.is_castling(chess.Move.from_uci('e1g1'))
+    assert index.is_en_passant(chess.Move.from_uci('e5d6'))
+    assert index.is_capture(chess.Move.from_uci('e5d6'))
+    assert index.is_capture(chess.Move.from_uci('h1h8'))
+    assert not index.is_capture(chess.Move.from_uci('e1f1'))
+
+
+def test_get_builds_once_per_position():
+    board = chess.Board()
+    index = position_index.get(board)
+    assert position_index.get(board.copy()) is index
+    board.push_san('e4')
+    assert position_index.get(board) is not index
+
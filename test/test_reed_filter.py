@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+
+import chess
+from reed_filter import ReedFilter
+
+START = chess.BB_RANK_1 | chess.BB_RANK_2 | chess.BB_RANK_7 | chess.BB_RANK_8
+
+
+def test_single_change_settles_after_the_window():
+    reeds = ReedFilter(window=0.25)
+    reeds.feed(chess.E2, timestamp=0.0)
+    assert reeds.pop(now=0.1) is None
+    assert reeds.time_to_settle(now=0.1) == 0.15
+    assert reeds.pop(now=0.3) == chess.E2
+    assert not reeds.pending()
+
+
+def test_odd_burst_is_one_change():
+    reeds = ReedFilter(window=0.25)
+    for stamp in (0.0, 0.05, 0.1):
+        reeds.feed(chess.E4, timestamp=stamp)
+    assert reeds.update(now=1.0) == [chess.E4]
+    assert reeds.glitches == 0
+
+
+def test_glitch_on_an_empty_square():
+    reeds = ReedFilter(window=0.25)
+    reeds.clear(START)
+    reeds.feed(chess.E2, timestamp=0.0)
+    reeds.feed(chess.E3, timestamp=0.5)
+    reeds.feed(chess.E3, timestamp=0.6)
+    reeds.feed(chess.E4, timestamp=0.7)
+    assert reeds.pop(now=2.0) == chess.E2
+    assert reeds.pop(now=2.0) == chess.E4
+    assert reeds.take_suppressed() == [chess.E3]
+    assert reeds.glitches == 1
+
+
+def test_crooked_piece_without_a_piece_in_the_hand():
+    reeds = ReedFilter(window=0.25)
+    reeds.clear(START)
+    reeds.feed(chess.D7, timestamp=0.0)
+    reeds.feed(chess.D7, timestamp=0.1)
+    assert reeds.pop(now=1.0) is None
+    assert reeds.take_suppressed() == [chess.D7]
+
+
+def test_fast_capture():
+    board = chess.Board('rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2')
+    reeds = ReedFilter(window=0.25)
+    reeds.clear(board.occupied)
+    reeds.feed(chess.E4, timestamp=0.0)
+    reeds.feed(chess.D5, timestamp=1.0)
+    reeds.feed(chess.D5, timestamp=1.1)
+    assert [reeds.pop(now=2.0) for _ in range(4)] == [chess.E4, chess.D5, chess.D5, None]
+    assert reeds.glitches == 0
+
+
+def test_even_burst_is_a_glitch_when_the_occupancy_is_unknown():
+    reeds = ReedFilter(window=0.25)
+    reeds.feed(chess.E4, timestamp=0.0)
+    reeds.feed(chess.D5, timestamp=1.0)
+    reeds.feed(chess.D5, timestamp=1.1)
+    assert reeds.pop(now=2.0) == chess.E4
+    assert reeds.pop(now=2.0) is None
+    assert reeds.take_suppressed() == [chess.D5]
+
+
+def test_clear():
+    reeds = ReedFilter(window=0.25)
+    reeds.feed(chess.E2, timestamp=0.0)
+    reeds.clear()
+    assert not reeds.pending()
+    assert reeds.time_to_settle() is None
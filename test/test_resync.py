@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+
+import chess
+import resync
+from position_index import PositionIndex
+
+
+def test_occupancy_after_every_move():
+    board = chess.Board('r3k2r/8/8/3pP3/8/6p1/8/R3K2R w KQkq d6 0 2')
+    index = PositionIndex(board)
+    for move in index.moves:
+        after = board.copy()
+        after.push(move)
+        assert index.occupancy[move] == after.occupied
+        assert move in index.moves_with_occupancy(after.occupied)
+
+
+def test_resync_finds_the_shortest_line():
+    board = chess.Board()
+    played = board.copy()
+    for san in ('e4', 'e5', 'Nf3'):
+        played.push_san(san)
+    lines = resync.find_lines(board, played.occupied, max_plies=3)
+    assert lines
+    assert all(len(line) == 3 for line in lines)
+    assert [chess.Move.from_uci(uci) for uci in ('e2e4', 'e7e5', 'g1f3')] in lines
+
+
+def test_resync_without_a_line():
+    board = chess.Board()
+    assert resync.find_lines(board, board.occupied) == []
+    assert resync.find_lines(board, chess.BB_EMPTY, max_plies=2) == []
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+
+import threading
+
+import chess
+import chess.engine
+import pytest
+
+import config
+import search
+from events import EVENTS, EventType
+
+
+class FakeAnalysis:
+    """Analysis that sends the infos and then thinks until it is stopped"""
+    def __init__(self, board, infos, think):
+        self.board = board
+        self.infos = infos
+        self.think = think
+        self.multipv = []
+        self.stopped = threading.Event()
+
+    def __iter__(self):
+        for info in self.infos:
+            if self.stopped.is_set():
+                return
+            self.multipv = [info]
+            yield info
+        self.stopped.wait(self.think)
+
+    def stop(self):
+        self.stopped.set()
+
+    def wait(self):
+        pv = self.multipv[0]['pv'] if self.multipv else [next(iter(self.board.legal_moves))]
+        return chess.engine.BestMove(pv[0], pv[1] if len(pv) > 1 else None)
+
+
+class FakeEngine:
+    """Just enough of chess.engine.SimpleEngine for a Search"""
+    def __init__(self, infos=(), think=5.0):
+        self.options = {}
+        self.infos = list(infos)
+        self.think = think
+        self.analyses = []
+
+    def analysis(self, board, limit, multipv=None, game=None):
+        self.game = game
+        analysis = FakeAnalysis(board, self.infos, self.think)
+        self.analyses.append(analysis)
+        return analysis
+
+
+def pv_info(depth, score, *moves):
+    return {'depth': depth, 'score': chess.engine.PovScore(chess.engine.Cp(score), chess.WHITE),
+            'pv': [chess.Move.from_uci(move) for move in moves]}
+
+
+@pytest.fixture(autouse=True)
+def no_search():
+    yield
+    search.cancel()
+    EVENTS.discard(EventType.ENGINE_RESULT)
+    EVENTS.discard(EventType.ENGINE_INFO)
+
+
+def test_result_of_the_search():
+    engine = FakeEngine([pv_info(1, 30, 'e2e4', 'e7e5')], think=0)
+    started = search.start(engine, chess.Board(), chess.engine.Limit(time=1))
+    result = started.wait()
+    assert result.move == chess.Move.from_uci('e2e4')
+    assert result.ponder == chess.Move.from_uci('e7e5')
+
+
+def test_search_for_the_tentative_move():
+    board = chess.Board()
+    board.push_uci('e2e4')
+    started = search.start(FakeEngine(), board, chess.engine.Limit(time=1))
+    assert search.get(board) is started
+
+    other = chess.Board()
+    other.push_uci('d2d4')
+    assert search.get(other) is None
+
+
+def test_taken_search_stays_current():
+    board = chess.Board()
+    started = search.start(FakeEngine(), board, chess.engine.Limit(time=1))
+    assert search.take(board) is started
+    assert search.get(board) is None
+    assert search.stop()
+    assert started.wait().move is not None
+
+
+def test_game_key_goes_to_the_engine():
+    engine = FakeEngine(think=0)
+    game = object()
+    search.start(engine, chess.Board(), chess.engine.Limit(time=1), game=game).wait()
+    assert engine.game is game  # python-chess sends 'ucinewgame' when the key changes
+
+
+def test_take_back_cancels_the_search():
+    engine = FakeEngine()
+    started = search.start(engine, chess.Board(), chess.engine.Limit(time=1))
+    search.cancel()
+    assert started.cancelled
+    assert search.get(chess.Board()) is None
+    assert not search.stop()
+
+
+def test_stop_keeps_the_best_move_so_far():
+    engine = FakeEngine([pv_info(1, 10, 'e2e4'), pv_info(2, 20, 'd2d4', 'd7d5')])
+    started = search.start(engine, chess.Board(), chess.engine.Limit(time=60))
+    for _ in range(200):
+        if started.info.get('depth') == 2:
+            break
+        threading.Event().wait(0.01)
+    assert search.stop()
+    assert not search.stop()
+    assert started.wait().move == chess.Move.from_uci('d2d4')
+    assert started.stopped
+
+
+def test_progress_while_waiting(monkeypatch):
+    monkeypatch.setattr(search.config, 'ENGINE_INFO_INTERVAL', 0)
+    engine = FakeEngine([pv_info(1, 10, 'e2e4'), pv_info(2, 20, 'e2e4')])
+    depths = []
+
+    def on_info(progress):
+        depths.append(progress.info['depth'])
+        progress.stop()
+
+    search.start(engine, chess.Board(), chess.engine.Limit(time=60)).wait(on_info)
+    assert depths
+
+
+def test_engine_error_is_raised_on_wait():
+    class BrokenEngine(FakeEngine):
+        def analysis(self, board, limit, multipv=None, game=None):
+            raise chess.engine.EngineTerminatedError('engine process died')
+
+    with pytest.raises(chess.engine.EngineTerminatedError):
+        search.start(BrokenEngine(), chess.Board(), chess.engine.Limit(time=1)).wait()
+
+
+STOP = config.EarlyStop(stable_depths=3, max_spread=20, min_depth=2, min_part=0)
+
+
+def test_early_stop_on_a_stable_best_move():
+    infos = [pv_info(depth, 30 + depth, 'e2e4', 'e7e5') for depth in range(1, 8)]
+    started = search.start(FakeEngine(infos), chess.Board(), chess.engine.Limit(time=60), early_stop=STOP)
+    assert started.wait().move == chess.Move.from_uci('e2e4')
+    assert started.stopped_early
+    assert started.info['depth'] == 4  # depths 1, 2 and 3 completed with the same move
+
+
+def test_no_early_stop_when_the_best_move_changes():
+    search_ = search.Search(FakeEngine(), chess.Board(), chess.engine.Limit(time=60), early_stop=STOP)
+    moves = ['e2e4', 'd2d4', 'e2e4', 'd2d4', 'e2e4', 'd2d4']
+    assert not any(search_._stable(pv_info(depth, 30, move), 0, STOP) for depth, move in enumerate(moves, 1))
+
+
+def test_no_early_stop_when_the_score_swings():
+    search_ = search.Search(FakeEngine(), chess.Board(), chess.engine.Limit(time=60), early_stop=STOP)
+    scores = [30, 80, 30, 80, 30, 80]
+    assert not any(search_._stable(pv_info(depth, score, 'e2e4'), 0, STOP) for depth, score in enumerate(scores, 1))
+
+
+def test_no_early_stop_before_the_min_part_of_the_movetime():
+    stop = config.EarlyStop(stable_depths=3, max_spread=20, min_depth=2, min_part=0.5)
+    search_ = search.Search(FakeEngine(), chess.Board(), chess.engine.Limit(time=60), early_stop=stop)
+    assert not any(search_._stable(pv_info(depth, 30, 'e2e4'), 29, stop) for depth in range(1, 8))
+    assert search_._stable(pv_info(8, 30, 'e2e4'), 30, stop)
+
+
+def test_only_move_stops_at_the_first_pv():
+    board = chess.Board('k7/8/8/8/8/8/r7/7K w - - 0 1')  # Kg1
+    search_ = search.Search(FakeEngine(), board, chess.engine.Limit(time=60), early_stop=STOP)
+    assert search_._stable(pv_info(1, -500, 'h1g1'), 0, STOP)
+
+
+def test_mate_scores_and_missing_depths():
+    search_ = search.Search(FakeEngine(), chess.Board(), chess.engine.Limit(time=60), early_stop=STOP)
+    mate = {'depth': 3, 'score': chess.engine.PovScore(chess.engine.Mate(2), chess.WHITE), 'pv': [chess.Move.from_uci('e2e4')]}
+    assert not search_._stable(mate, 0, STOP)
+    assert not search_._stable(pv_info(5, 30, 'e2e4'), 0, STOP)  # depth 4 never completed
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+
+import asyncio
+import threading
+
+import chess
+import pytest
+
+import gpio
+import serial_arduino
+from gpio_backends import MockBackend
+from serial_arduino import ReasonInterrupt
+from serial_async import ReedEvent, SerialLink
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    mock = MockBackend()
+    monkeypatch.setattr(gpio, '_BACKEND', mock)
+    monkeypatch.setattr(serial_arduino, '_SER', None)
+    return mock
+
+
+@pytest.fixture
+def link(backend):
+    serial_link = SerialLink(timeout=0.1, retries=2)
+    serial_link.start()
+    yield serial_link
+    serial_link.close()
+
+
+async def _first(iterator):
+    async for item in iterator:
+        return item
+
+
+def test_requests(link, backend):
+    backend.arduino.board = [0, 0, 0, 0, 0, 0, 0, 0x01]
+    assert link.run(link.say_hello()) is True
+    assert link.run(link.board()) == chess.SquareSet(serial_arduino.make_square_set(backend.arduino.board))
+    assert link.run(link.detected_move()) == 100
+    assert not serial_arduino.LOCK.locked()
+
+
+def test_interrupts_become_events(link, backend):
+    events = link.spawn(_first(link.events()))
+    backend.arduino.flag = ReasonInterrupt.MOVE.value
+    backend.arduino.move = chess.E4
+    link.interrupt_callback(25)
+    event = events.result(timeout=2)
+    assert isinstance(event, ReedEvent)
+    assert event.square == chess.E4
+    assert backend.arduino.move == 100
+
+    events = link.spawn(_first(link.events()))
+    backend.arduino.flag = ReasonInterrupt.SHUTDOWN.value
+    link.interrupt_callback(25)
+    assert events.result(timeout=2) is ReasonInterrupt.SHUTDOWN
+
+
+def test_waits_for_the_blocking_round_trip(link, backend):
+    serial_arduino.LOCK.acquire()
+    hello = link.spawn(link.say_hello())
+    try:
+        assert not hello.done()
+        serial_arduino.port().write(b'<M>')  # answer stays in the uart, the link doesn't watch it now
+        assert serial_arduino.port().read_until(b'>') == b'<d>'
+    finally:
+        serial_arduino.LOCK.release()
+    assert hello.result(timeout=2) is True
+
+
+def test_no_answer(link, backend):
+    with pytest.raises(asyncio.TimeoutError):
+        link.run(link.request(serial_arduino.WHY_SHUTDOWN, size=1))
+    assert not serial_arduino.LOCK.locked()
+    assert serial_arduino.STATS.snapshot()['timeouts'] >= 2
+
+
+def test_blocking_functions_hold_the_lock(backend):
+    inside = []
+    original = serial_arduino._read_data
+
+    def read_data():
+        inside.append(serial_arduino.LOCK.locked())
+        return original()
+
+    serial_arduino._read_data = read_data
+    try:
+        thread = threading.Thread(target=serial_arduino.say_hello)
+        thread.start()
+        thread.join(timeout=2)
+    finally:
+        serial_arduino._read_data = original
+    assert inside == [True]
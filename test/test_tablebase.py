@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+
+import chess
+from tablebase import _rank
+
+
+class Tables:
+    """WDL and DTZ of the side to move by position, like chess.syzygy.Tablebase"""
+    def __init__(self, results):
+        self.results = results
+
+    def probe_wdl(self, board):
+        return self.results[board.board_fen()][0]
+
+    def probe_dtz(self, board):
+        return self.results[board.board_fen()][1]
+
+
+def after(board, uci):
+    board = board.copy()
+    board.push_uci(uci)
+    return board.board_fen()
+
+
+def test_mate_is_best():
+    board = chess.Board('6k1/8/6K1/8/8/8/8/R7 w - - 0 1')
+    assert _rank(Tables({}), board, chess.Move.from_uci('a1a8')) == (3, 0)
+
+
+def test_win_prefers_zeroing_and_short_dtz():
+    board = chess.Board('8/8/8/8/8/2k5/P7/K6R w - - 0 1')
+    tables = Tables({after(board, 'a2a4'): (-2, -20), after(board, 'h1h3'): (-2, -5), after(board, 'h1h8'): (-2, -9),
+                     after(board, 'a1b1'): (0, 0)})
+    ranks = {uci: _rank(tables, board, chess.Move.from_uci(uci)) for uci in ('a2a4', 'h1h3', 'h1h8', 'a1b1')}
+    assert ranks['a2a4'] == (2, 0)
+    assert ranks['h1h3'] > ranks['h1h8'] > ranks['a1b1']
+    assert max(ranks, key=ranks.get) == 'a2a4'
+    assert board.fen() == '8/8/8/8/8/2k5/P7/K6R w - - 0 1'
+
+
+def test_loss_prefers_long_dtz():
+    board = chess.Board('k7/8/8/8/8/8/7r/2K5 w - - 0 1')
+    tables = Tables({after(board, 'c1b1'): (2, 3), after(board, 'c1d1'): (2, 1)})
+    assert _rank(tables, board, chess.Move.from_uci('c1b1')) == (-2, 3)
+    assert _rank(tables, board, chess.Move.from_uci('c1b1')) > _rank(tables, board, chess.Move.from_uci('c1d1'))